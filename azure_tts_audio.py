@@ -0,0 +1,144 @@
+import shutil
+import struct
+import subprocess
+
+PCM_SAMPLE_RATE = 16000
+PCM_SAMPLE_WIDTH = 2
+PCM_CHANNELS = 1
+
+# 使用的合成输出格式 (SpeechSynthesisOutputFormat 成员名)，也用作缓存键的一部分
+WAV_FORMAT_NAME = "Riff16Khz16BitMonoPcm"
+RAW_PCM_FORMAT_NAME = "Raw16Khz16BitMonoPcm"
+MP3_FORMAT_NAME = "Audio16Khz64KBitRateMonoMp3"
+
+
+class WavFormatError(ValueError):
+    pass
+
+
+class Mp3EncodeError(Exception):
+    pass
+
+
+class WavInfo:
+    def __init__(self, sample_rate, channels, sample_width, audio_format=1):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.audio_format = audio_format
+
+    @property
+    def bytes_per_second(self):
+        return self.sample_rate * self.channels * self.sample_width
+
+    def same_format(self, other):
+        return (self.sample_rate, self.channels, self.sample_width, self.audio_format) == \
+            (other.sample_rate, other.channels, other.sample_width, other.audio_format)
+
+    def __repr__(self):
+        return f"WavInfo({self.sample_rate} Hz, {self.channels} ch, {self.sample_width * 8} bit)"
+
+
+def parse_wav(data):
+    # 解析 RIFF/WAVE 数据，返回 (WavInfo, PCM 数据的 memoryview)，不复制音频数据
+    view = memoryview(data)
+    if len(view) < 12 or bytes(view[0:4]) != b"RIFF" or bytes(view[8:12]) != b"WAVE":
+        raise WavFormatError("不是有效的 RIFF/WAVE 数据")
+    info = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        chunk_size = struct.unpack_from("<I", view, offset + 4)[0]
+        body_start = offset + 8
+        if chunk_id == b"fmt ":
+            audio_format, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", view, body_start)
+            info = WavInfo(sample_rate, channels, bits // 8, audio_format)
+        elif chunk_id == b"data":
+            if info is None: raise WavFormatError("data 块出现在 fmt 块之前")
+            # 流式输出时 data 块长度可能是占位值 (0 或 0xFFFFFFFF)，此时取到数据末尾
+            body_end = len(view) if chunk_size in (0, 0xFFFFFFFF) else min(len(view), body_start + chunk_size)
+            return info, view[body_start:body_end]
+        offset = body_start + chunk_size + (chunk_size & 1)
+    raise WavFormatError("未找到 data 块")
+
+
+def build_wav_header(pcm_length, sample_rate=PCM_SAMPLE_RATE, channels=PCM_CHANNELS, sample_width=PCM_SAMPLE_WIDTH):
+    byte_rate = sample_rate * channels * sample_width
+    return struct.pack("<4sI4s4sIHHIIHH4sI",
+                       b"RIFF", 36 + pcm_length, b"WAVE",
+                       b"fmt ", 16, 1, channels, sample_rate, byte_rate, channels * sample_width, sample_width * 8,
+                       b"data", pcm_length)
+
+
+def build_wav_bytes(pcm, sample_rate=PCM_SAMPLE_RATE, channels=PCM_CHANNELS, sample_width=PCM_SAMPLE_WIDTH):
+    return build_wav_header(len(pcm), sample_rate, channels, sample_width) + bytes(pcm)
+
+
+def stitch_wav_chunks(wav_chunks):
+    # 按顺序拼接多个相同格式的 RIFF PCM 片段为一个 WAV
+    if not wav_chunks: raise WavFormatError("没有可拼接的音频片段")
+    first_info = None
+    pcm_parts = []
+    for idx, chunk in enumerate(wav_chunks):
+        info, pcm = parse_wav(chunk)
+        if first_info is None: first_info = info
+        elif not first_info.same_format(info):
+            raise WavFormatError(f"第 {idx + 1} 段音频格式 {info} 与第一段 {first_info} 不一致")
+        pcm_parts.append(pcm)
+    total_length = sum(len(p) for p in pcm_parts)
+    out = bytearray(build_wav_header(total_length, first_info.sample_rate, first_info.channels, first_info.sample_width))
+    for pcm in pcm_parts: out += pcm
+    return bytes(out)
+
+
+def wav_duration_sec(data):
+    info, pcm = parse_wav(data)
+    return len(pcm) / info.bytes_per_second if info.bytes_per_second else 0.0
+
+
+def join_audio_chunks(chunks, container="wav"):
+    # WAV 片段需要重写 RIFF 头；MP3 等帧格式可以直接按顺序拼接字节
+    if len(chunks) == 1: return chunks[0]
+    if container == "wav": return stitch_wav_chunks(chunks)
+    return b"".join(bytes(c) for c in chunks)
+
+
+def local_mp3_encoder_name():
+    # 本地 MP3 编码器是可选的：优先使用 lameenc (pip install lameenc)，其次是 PATH 中的 ffmpeg
+    try:
+        import lameenc  # noqa: F401
+        return "lameenc"
+    except ImportError:
+        pass
+    return "ffmpeg" if shutil.which("ffmpeg") else None
+
+
+def encode_pcm_to_mp3(pcm, sample_rate=PCM_SAMPLE_RATE, channels=PCM_CHANNELS, bitrate_kbps=64):
+    # 16 bit PCM -> MP3；默认参数与服务端的 Audio16Khz64KBitRateMonoMp3 输出一致
+    encoder_name = local_mp3_encoder_name()
+    if encoder_name == "lameenc":
+        import lameenc
+        encoder = lameenc.Encoder()
+        encoder.set_bit_rate(bitrate_kbps)
+        encoder.set_in_sample_rate(sample_rate)
+        encoder.set_channels(channels)
+        encoder.set_quality(2)
+        return bytes(encoder.encode(bytes(pcm)) + encoder.flush())
+    if encoder_name == "ffmpeg":
+        command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels),
+                   "-i", "pipe:0", "-codec:a", "libmp3lame", "-b:a", f"{bitrate_kbps}k", "-f", "mp3", "pipe:1"]
+        try:
+            completed = subprocess.run(command, input=bytes(pcm), stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+        except OSError as e:
+            raise Mp3EncodeError(f"无法启动 ffmpeg: {e}") from e
+        if completed.returncode != 0 or not completed.stdout:
+            raise Mp3EncodeError(f"ffmpeg 编码失败: {completed.stderr.decode('utf-8', 'replace').strip() or completed.returncode}")
+        return completed.stdout
+    raise Mp3EncodeError("没有可用的本地 MP3 编码器 (lameenc 或 ffmpeg)")
+
+
+def encode_wav_to_mp3(wav_data, bitrate_kbps=64):
+    info, pcm = parse_wav(wav_data)
+    if info.audio_format != 1 or info.sample_width != 2:
+        raise Mp3EncodeError(f"只支持 16 bit PCM 编码为 MP3，当前为 {info}")
+    return encode_pcm_to_mp3(pcm, info.sample_rate, info.channels, bitrate_kbps)
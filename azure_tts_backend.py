@@ -0,0 +1,132 @@
+import threading
+
+from azure_tts_audio import WAV_FORMAT_NAME
+from azure_tts_pool import SynthesizerPool, load_speech_sdk
+from azure_tts_synthesis import synthesize_ssml_streaming, synthesize_ssml_to_bytes
+from azure_tts_voices import fetch_voice_records
+
+BACKEND_AZURE = "azure"
+BACKEND_STUB = "stub"
+BACKEND_TYPES = (BACKEND_AZURE, BACKEND_STUB)
+
+
+class SynthesisBackend:
+    # 合成后端接口。界面、命令行、缓存和调度只通过它访问语音服务：
+    #   list_voices()                          -> [VoiceRecord]
+    #   synthesize(ssml, output_format_name, on_event=None, cancel_scope=None)
+    #                                          -> 指定格式的完整音频字节
+    #   synthesize_with_events(ssml, on_audio_chunk, on_event=None, cancel_scope=None)
+    #                                          -> 无头 16 kHz PCM，合成过程中分段回调音频
+    # on_event(name, info) 接收 SYNTHESIS_EVENT_* 事件 (started / audio / bookmark / completed / canceled)
+    # cancel_scope 可选 (例如 SynthesisJob)：其 on_cancel(callback) 登记的回调会中止进行中的请求
+    # 失败时抛出 SynthesisError (带 error_code，便于调度器判断是否重试)
+    name = ""
+
+    @property
+    def cache_namespace(self):
+        # 参与缓存键和语音目录的命名空间，保证不同后端的音频不会互相命中
+        raise NotImplementedError
+
+    def list_voices(self):
+        raise NotImplementedError
+
+    def synthesize(self, ssml, output_format_name=WAV_FORMAT_NAME, on_event=None, cancel_scope=None):
+        raise NotImplementedError
+
+    def synthesize_with_events(self, ssml, on_audio_chunk, on_event=None, cancel_scope=None):
+        raise NotImplementedError
+
+    def prewarm(self, output_format_name, count=1):
+        return 0
+
+    def close(self):
+        pass
+
+
+class AzureBackend(SynthesisBackend):
+    name = BACKEND_AZURE
+
+    def __init__(self, subscription_key, service_region, pool=None):
+        self.subscription_key = subscription_key
+        self.service_region = service_region
+        self._owns_pool = pool is None
+        self.pool = pool if pool is not None else SynthesizerPool()
+
+    @property
+    def cache_namespace(self):
+        return (self.service_region or "").strip().lower()
+
+    @staticmethod
+    def _sdk_format(output_format_name):
+        return getattr(load_speech_sdk().SpeechSynthesisOutputFormat, output_format_name)
+
+    def list_voices(self):
+        return fetch_voice_records(self.subscription_key, self.service_region, pool=self.pool)
+
+    def synthesize(self, ssml, output_format_name=WAV_FORMAT_NAME, on_event=None, cancel_scope=None):
+        return synthesize_ssml_to_bytes(self.subscription_key, self.service_region, ssml, output_format=self._sdk_format(output_format_name),
+                                        pool=self.pool, on_event=on_event, cancel_scope=cancel_scope)
+
+    def synthesize_with_events(self, ssml, on_audio_chunk, on_event=None, cancel_scope=None):
+        return synthesize_ssml_streaming(self.subscription_key, self.service_region, ssml, on_audio_chunk,
+                                         pool=self.pool, on_event=on_event, cancel_scope=cancel_scope)
+
+    def prewarm(self, output_format_name, count=1):
+        return self.pool.warm(self.subscription_key, self.service_region, self._sdk_format(output_format_name), count=count)
+
+    def close(self):
+        if self._owns_pool: self.pool.clear()
+
+
+def create_backend(backend_settings, subscription_key, service_region, pool=None):
+    # backend_settings 即配置文件中的 "backend" 组: {"type": "azure" | "stub", "stub": {...}, "endpoints": [...]}
+    # 配置了 endpoints 时在主密钥/区域之外加入更多终结点，请求在它们之间负载均衡并故障转移
+    backend_settings = backend_settings if isinstance(backend_settings, dict) else {}
+    backend_type = str(backend_settings.get("type", BACKEND_AZURE) or BACKEND_AZURE).strip().lower()
+    if backend_type == BACKEND_STUB:
+        from azure_tts_stub import stub_backend_from_settings
+        return stub_backend_from_settings(backend_settings.get("stub"))
+    if backend_type != BACKEND_AZURE:
+        raise ValueError(f"未知的合成后端类型: {backend_type} (可选: {', '.join(BACKEND_TYPES)})")
+    if backend_settings.get("endpoints"):
+        from azure_tts_endpoints import MultiEndpointBackend, endpoints_from_settings
+        return MultiEndpointBackend(endpoints_from_settings(backend_settings["endpoints"], subscription_key, service_region, pool=pool))
+    return AzureBackend(subscription_key, service_region, pool=pool)
+
+
+class BackendProvider:
+    # 界面中凭据和配置随时可能变化：按 (配置, 密钥, 区域) 缓存一个后端实例，可在任意线程调用
+    def __init__(self, pool=None):
+        self.pool = pool
+        self.backend_settings = {"type": BACKEND_AZURE}
+        self._backend = None
+        self._backend_id = None
+        self._lock = threading.Lock()
+
+    def configure(self, backend_settings):
+        with self._lock:
+            self.backend_settings = dict(backend_settings) if isinstance(backend_settings, dict) else {"type": BACKEND_AZURE}
+            self._backend_id = None
+
+    @property
+    def is_stub(self):
+        return str(self.backend_settings.get("type", BACKEND_AZURE)).strip().lower() == BACKEND_STUB
+
+    def get(self, subscription_key, service_region):
+        with self._lock:
+            backend_id = (repr(sorted(self.backend_settings.items())), subscription_key, (service_region or "").strip().lower())
+            if self._backend is None or backend_id != self._backend_id:
+                if self._backend is not None: self._backend.close()
+                self._backend = create_backend(self.backend_settings, subscription_key, service_region, pool=self.pool)
+                self._backend_id = backend_id
+            return self._backend
+
+    def current(self):
+        # 已创建的后端 (可能为 None)，只用于显示统计，不会因此创建后端
+        with self._lock: return self._backend
+
+    def close(self):
+        with self._lock:
+            if self._backend is not None: self._backend.close()
+            self._backend = None
+            self._backend_id = None
@@ -0,0 +1,362 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from azure_tts_audio import WAV_FORMAT_NAME, build_wav_bytes, stitch_wav_chunks
+from azure_tts_cache import SynthesisCache
+from azure_tts_metrics import nearest_rank
+from azure_tts_scheduler import RequestScheduler
+from azure_tts_ssml import DEFAULT_CHUNK_MAX_CHARS, build_ssml, split_text_into_chunks
+from azure_tts_stub import DEFAULT_STUB_AUDIO_SEC_PER_CHAR, StubBackend
+from azure_tts_synthesis import synthesize_chunks_parallel, synthesize_chunks_streaming
+
+# 离线基准测试：针对本地模拟后端测量合成、缓存和播放的热点路径，结果写成 JSON 便于比较
+BENCH_RESULT_VERSION = 1
+BENCH_VOICE = ("zh-CN", "zh-CN-XiaoxiaoNeural")
+DEFAULT_CONCURRENCY_LEVELS = (1, 2, 4, 8)
+# 基准测试默认让模拟后端比真实服务快，测量重点是本地代码的开销
+DEFAULT_BENCH_FIRST_AUDIO_MS = 50
+DEFAULT_BENCH_REALTIME_FACTOR = 40.0
+DEFAULT_BENCH_CACHE_ENTRIES = 3000
+_SAMPLE_SENTENCES = [
+    "今天的天气很好，我们一起去公园散步吧。",
+    "The quick brown fox jumps over the lazy dog.",
+    "语音合成服务会把文本转换为自然流畅的语音。",
+    "Benchmarks should be repeatable, so this text is generated deterministically.",
+    "长文本会被切分为多个片段并行合成，然后按顺序拼接。",
+]
+
+
+def sample_text(target_chars, paragraph_sentences=4):
+    sentences = []
+    length = 0
+    i = 0
+    while length < target_chars:
+        sentence = _SAMPLE_SENTENCES[i % len(_SAMPLE_SENTENCES)]
+        sentences.append(sentence)
+        length += len(sentence) + 1
+        i += 1
+    paragraphs = [" ".join(sentences[j:j + paragraph_sentences]) for j in range(0, len(sentences), paragraph_sentences)]
+    return "\n".join(paragraphs)
+
+
+def percentile(sorted_values, pct):
+    # 最近秩法；输入必须已排序。与诊断面板的分位数共用同一实现
+    return nearest_rank(sorted_values, pct)
+
+
+def summarize_samples_ms(samples_sec):
+    values = sorted(x * 1000 for x in samples_sec)
+    if not values: return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 3),
+        "min_ms": round(values[0], 3),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p90_ms": round(percentile(values, 90), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3),
+    }
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1) # macOS 为字节，Linux 为 KB
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+class BenchContext:
+    def __init__(self, backend, chunk_max_chars=DEFAULT_CHUNK_MAX_CHARS, chunk_workers=4):
+        self.backend = backend
+        self.chunk_max_chars = chunk_max_chars
+        self.chunk_workers = chunk_workers
+        self.scheduler = RequestScheduler(requests_per_sec=0, max_concurrency=64)
+
+    def chunk_ssml_list(self, text):
+        lang, voice = BENCH_VOICE
+        return [build_ssml(chunk, lang, voice) for chunk in split_text_into_chunks(text, self.chunk_max_chars)]
+
+    def synthesize_wav(self, text):
+        # 与界面的非流式路径相同：分段 -> 调度器 -> 并行合成 -> 拼接
+        parts = synthesize_chunks_parallel(
+            self.chunk_ssml_list(text),
+            lambda ssml: self.scheduler.call(lambda: self.backend.synthesize(ssml, WAV_FORMAT_NAME), chars=len(ssml)),
+            max_workers=self.chunk_workers,
+        )
+        return parts[0] if len(parts) == 1 else stitch_wav_chunks(parts)
+
+    def synthesize_streaming(self, text, sink):
+        return synthesize_chunks_streaming(
+            self.chunk_ssml_list(text),
+            lambda ssml, on_audio: self.scheduler.call(lambda: self.backend.synthesize_with_events(ssml, on_audio), chars=len(ssml)),
+            sink,
+            max_workers=self.chunk_workers,
+        )
+
+
+def bench_ssml_build(iterations, text):
+    lang, voice = BENCH_VOICE
+    started = time.perf_counter()
+    for _ in range(iterations): build_ssml(text, lang, voice, "Narrator", "cheerful", 1.1)
+    elapsed = time.perf_counter() - started
+    return {"iterations": iterations, "text_chars": len(text), "mean_us": round(elapsed / iterations * 1e6, 3)}
+
+
+def bench_time_to_first_audio(ctx, iterations, text):
+    samples = []
+    for _ in range(iterations):
+        first_audio = []
+        started = time.perf_counter()
+        def sink(data):
+            if not first_audio: first_audio.append(time.perf_counter() - started)
+        ctx.synthesize_streaming(text, sink)
+        if first_audio: samples.append(first_audio[0])
+    return dict(summarize_samples_ms(samples), text_chars=len(text))
+
+
+def bench_end_to_end(ctx, iterations, text, cache):
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        wav = ctx.synthesize_wav(text)
+        cache.put_bytes(f"bench_e2e_{i}", wav)
+        samples.append(time.perf_counter() - started)
+    return dict(summarize_samples_ms(samples), text_chars=len(text))
+
+
+def bench_throughput(ctx, concurrency_levels, jobs_per_level, text):
+    results = []
+    for concurrency in concurrency_levels:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as executor:
+            list(executor.map(lambda _: ctx.synthesize_wav(text), range(jobs_per_level)))
+        elapsed = time.perf_counter() - started
+        total_chars = len(text) * jobs_per_level
+        results.append({"concurrency": concurrency, "jobs": jobs_per_level, "elapsed_sec": round(elapsed, 3),
+                        "chars_per_sec": round(total_chars / elapsed, 1) if elapsed > 0 else None})
+    return results
+
+
+def bench_cache_hits(cache, iterations, wav_bytes, index_entries=DEFAULT_BENCH_CACHE_ENTRIES):
+    # 先用小条目把索引填到常见规模，命中和写入的耗时与索引大小有关
+    filler = build_wav_bytes(b"\0" * 3200)
+    for i in range(max(0, index_entries - cache.stats()["entries"])):
+        cache.put_bytes(f"bench_seed_{i:06d}", filler)
+    cache.put_bytes("bench_hit", wav_bytes)
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        path = cache.get("bench_hit")
+        with open(path, 'rb') as f: f.read()
+        samples.append(time.perf_counter() - started)
+    put_samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        cache.put_bytes(f"bench_put_{i:06d}", filler)
+        put_samples.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    cache.flush()
+    flush_ms = round((time.perf_counter() - started) * 1000, 3)
+    return dict(summarize_samples_ms(samples), audio_bytes=len(wav_bytes), index_entries=cache.stats()["entries"],
+                put=summarize_samples_ms(put_samples), index_flush_ms=flush_ms)
+
+
+def bench_seek(wav_bytes, iterations):
+    # 与界面拖动进度条相同：PcmBufferPlayer.seek() 按采样偏移定位，不重新加载；需要 pygame，使用 dummy 音频驱动
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    try:
+        import pygame
+        from azure_tts_playback import PcmBufferPlayer, init_pcm_mixer
+    except ImportError as e:
+        return {"skipped": f"pygame 不可用: {e}"}
+    try:
+        init_pcm_mixer()
+        pygame.mixer.init()
+    except pygame.error as e:
+        return {"skipped": f"无法初始化 mixer: {e}"}
+    samples = []
+    max_error_sec = 0.0
+    stuck_at_end = 0
+    player = PcmBufferPlayer.from_wav_bytes(wav_bytes)
+    try:
+        player.play()
+        for i in range(iterations):
+            # 0% ~ 100% 各位置都会取到 (37 与 101 互质)，包括拖到末尾
+            percent = (i * 37) % 101
+            position = player.duration_sec * percent / 100
+            started = time.perf_counter()
+            player.seek(position)
+            player.pump()
+            samples.append(time.perf_counter() - started)
+            max_error_sec = max(max_error_sec, abs(player.position_sec() - position))
+            if percent == 100 and not player.is_done(): stuck_at_end += 1
+    except pygame.error as e:
+        return {"error": str(e)}
+    finally:
+        player.stop()
+        pygame.mixer.quit()
+    return dict(summarize_samples_ms(samples), audio_sec=round(player.duration_sec, 3), max_position_error_ms=round(max_error_sec * 1000, 3),
+                stuck_at_end=stuck_at_end)
+
+
+# 界面启动时导入的本地模块；语音 SDK 和 pygame 应当推迟到第一次使用时才导入
+STARTUP_MODULES = ("azure_tts_audio", "azure_tts_backend", "azure_tts_cache", "azure_tts_config", "azure_tts_export", "azure_tts_metrics",
+                   "azure_tts_playback", "azure_tts_pool", "azure_tts_scheduler", "azure_tts_ssml", "azure_tts_synthesis", "azure_tts_voices")
+DEFERRED_MODULES = ("azure.cognitiveservices.speech", "pygame")
+
+
+def bench_startup_imports(iterations):
+    # 每次在新的解释器中测量，避免模块缓存的影响
+    script = (
+        "import json, sys, time\n"
+        "t = time.perf_counter()\n"
+        f"for name in {STARTUP_MODULES!r}: __import__(name)\n"
+        "elapsed = time.perf_counter() - t\n"
+        f"print(json.dumps([elapsed, [m for m in {DEFERRED_MODULES!r} if m in sys.modules]]))\n"
+    )
+    samples = []
+    eager = set()
+    for _ in range(iterations):
+        completed = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        if completed.returncode != 0:
+            return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"exit {completed.returncode}"}
+        elapsed, loaded = json.loads(completed.stdout.strip().splitlines()[-1])
+        samples.append(elapsed)
+        eager.update(loaded)
+    return dict(summarize_samples_ms(samples), eagerly_imported=sorted(eager))
+
+
+def run_benchmarks(args):
+    backend = StubBackend(first_audio_ms=args.first_audio_ms, realtime_factor=args.realtime_factor,
+                          audio_sec_per_char=args.audio_sec_per_char, seed=0)
+    ctx = BenchContext(backend, chunk_max_chars=args.chunk_max_chars, chunk_workers=args.chunk_workers)
+    short_text = sample_text(args.short_chars)
+    long_text = sample_text(args.long_chars)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="azure_tts_bench_") as work_dir:
+        cache = SynthesisCache(os.path.join(work_dir, "cache"), max_bytes=4 * 1024 ** 3)
+        steps = [
+            ("startup_imports", lambda: bench_startup_imports(max(3, args.iterations // 2))),
+            ("ssml_build", lambda: bench_ssml_build(args.iterations * 100, long_text)),
+            ("time_to_first_audio_short", lambda: bench_time_to_first_audio(ctx, args.iterations, short_text)),
+            ("time_to_first_audio_long", lambda: bench_time_to_first_audio(ctx, args.iterations, long_text)),
+            ("end_to_end_short", lambda: bench_end_to_end(ctx, args.iterations, short_text, cache)),
+            ("end_to_end_long", lambda: bench_end_to_end(ctx, args.iterations, long_text, cache)),
+            ("throughput", lambda: bench_throughput(ctx, args.concurrency, args.jobs_per_level, short_text)),
+        ]
+        for name, step in steps:
+            print(f"运行 {name}...", file=sys.stderr, flush=True)
+            results[name] = step()
+
+        long_wav = build_wav_bytes(backend.render_pcm(build_ssml(long_text, *BENCH_VOICE)))
+        print("运行 cache_hit...", file=sys.stderr, flush=True)
+        results["cache_hit"] = bench_cache_hits(cache, args.iterations * 10, long_wav, args.cache_entries)
+        print("运行 seek...", file=sys.stderr, flush=True)
+        results["seek"] = bench_seek(long_wav, args.iterations)
+    results["peak_rss_mb"] = peak_rss_mb()
+    return {
+        "version": BENCH_RESULT_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "iterations": args.iterations, "short_chars": len(short_text), "long_chars": len(long_text),
+            "chunk_max_chars": args.chunk_max_chars, "chunk_workers": args.chunk_workers,
+            "concurrency": list(args.concurrency), "jobs_per_level": args.jobs_per_level,
+            "stub": {"first_audio_ms": args.first_audio_ms, "realtime_factor": args.realtime_factor, "audio_sec_per_char": args.audio_sec_per_char},
+        },
+        "results": results,
+        "stub_stats": backend.stats(),
+        "scheduler_stats": ctx.scheduler.stats(),
+    }
+
+
+def headline_metrics(report):
+    # 用于比较两次运行的关键指标：{名称: (数值, 越小越好)}
+    metrics = {}
+    for name, value in report.get("results", {}).items():
+        if isinstance(value, dict) and "p50_ms" in value:
+            metrics[f"{name}.p50_ms"] = (value["p50_ms"], True)
+            metrics[f"{name}.p90_ms"] = (value["p90_ms"], True)
+        elif isinstance(value, dict) and "mean_us" in value:
+            metrics[f"{name}.mean_us"] = (value["mean_us"], True)
+        elif isinstance(value, list):
+            for row in value:
+                if row.get("chars_per_sec") is not None:
+                    metrics[f"{name}.c{row['concurrency']}.chars_per_sec"] = (row["chars_per_sec"], False)
+    if report.get("results", {}).get("peak_rss_mb") is not None:
+        metrics["peak_rss_mb"] = (report["results"]["peak_rss_mb"], True)
+    return metrics
+
+
+def compare_reports(baseline, current):
+    rows = []
+    old_metrics = headline_metrics(baseline)
+    for name, (new_value, lower_is_better) in headline_metrics(current).items():
+        if name not in old_metrics or not old_metrics[name][0]: continue
+        old_value = old_metrics[name][0]
+        change_pct = (new_value - old_value) / old_value * 100
+        improved = change_pct < 0 if lower_is_better else change_pct > 0
+        rows.append({"metric": name, "baseline": old_value, "current": new_value, "change_pct": round(change_pct, 1), "improved": improved})
+    return rows
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Azure 文本转语音 - 离线基准测试 (使用本地模拟后端)")
+    parser.add_argument("-o", "--output", help="结果 JSON 文件 (默认输出到标准输出)")
+    parser.add_argument("--compare", metavar="BASELINE_JSON", help="与之前保存的结果比较，并在结果中附上差异")
+    parser.add_argument("-n", "--iterations", type=int, default=10, help="每项测量的重复次数 (默认: 10)")
+    parser.add_argument("--short-chars", type=int, default=60, help="短文本字符数 (默认: 60)")
+    parser.add_argument("--long-chars", type=int, default=2000, help="长文本字符数 (默认: 2000)")
+    parser.add_argument("--concurrency", type=lambda v: tuple(int(x) for x in v.split(",") if x.strip()),
+                        default=DEFAULT_CONCURRENCY_LEVELS, help="吞吐量测试的并发级别，逗号分隔 (默认: 1,2,4,8)")
+    parser.add_argument("--cache-entries", type=int, default=DEFAULT_BENCH_CACHE_ENTRIES, help=f"测量缓存命中前填入的条目数 (默认: {DEFAULT_BENCH_CACHE_ENTRIES})")
+    parser.add_argument("--jobs-per-level", type=int, default=16, help="每个并发级别的作业数 (默认: 16)")
+    parser.add_argument("--chunk-max-chars", type=int, default=DEFAULT_CHUNK_MAX_CHARS, help="分段长度上限")
+    parser.add_argument("--chunk-workers", type=int, default=4, help="单个作业内的分段并行度 (默认: 4)")
+    parser.add_argument("--first-audio-ms", type=float, default=DEFAULT_BENCH_FIRST_AUDIO_MS, help="模拟后端的首包延迟 (默认: 50)")
+    parser.add_argument("--realtime-factor", type=float, default=DEFAULT_BENCH_REALTIME_FACTOR, help="模拟后端的合成速度，实时的倍数 (默认: 40)")
+    parser.add_argument("--audio-sec-per-char", type=float, default=DEFAULT_STUB_AUDIO_SEC_PER_CHAR, help="模拟后端每个字符对应的音频秒数")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f: baseline = json.load(f)
+    report = run_benchmarks(args)
+    if baseline is not None:
+        report["comparison"] = compare_reports(baseline, report)
+        if baseline.get("config") != report["config"]:
+            print("警告: 两次运行的参数不同，差异可能不具可比性。", file=sys.stderr)
+        for row in report["comparison"]:
+            print(f"{row['metric']:<45} {row['baseline']:>12} -> {row['current']:>12}  {row['change_pct']:+.1f}%"
+                  + ("" if row["improved"] or abs(row["change_pct"]) < 5 else "  (变差)"), file=sys.stderr)
+    text = json.dumps(report, indent=4, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f: f.write(text + "\n")
+        print(f"结果已写入 {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
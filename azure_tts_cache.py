@@ -0,0 +1,213 @@
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+CACHE_INDEX_FILE_NAME = "cache_index.json"
+CACHE_INDEX_VERSION = 1
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_CACHE_MAX_AGE_SEC = 30 * 24 * 3600
+ORPHAN_MIN_AGE_SEC = 3600
+INDEX_FLUSH_DELAY_SEC = 2.0 # 命中/写入只修改内存中的索引，延迟这么久后合并写盘一次
+
+
+class SynthesisCache:
+    # 持久化、按内容寻址的合成音频缓存。
+    # 键为最终 SSML + 输出格式 + 区域的 SHA-256，索引保存在 cache_index.json 中，
+    # 超出大小/年龄限制时按最近最少使用 (LRU) 淘汰。
+    # 索引的修改先记在内存中，由后台定时器合并写盘 (flush)，进程退出或 close() 时再写一次；
+    # 异常退出时最后几秒新增的条目会丢失，对应的文件由 cleanup_orphans() 清理
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_MAX_BYTES, max_age_sec=DEFAULT_CACHE_MAX_AGE_SEC, flush_delay_sec=INDEX_FLUSH_DELAY_SEC):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, CACHE_INDEX_FILE_NAME)
+        self.max_bytes = max_bytes
+        self.max_age_sec = max_age_sec
+        self.hits = 0
+        self.misses = 0
+        self.flush_delay_sec = flush_delay_sec
+        self._entries = {}
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock() # 保证索引按修改顺序写盘；获取顺序总是 _flush_lock -> _lock
+        self._dirty = False
+        self._flush_timer = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def make_key(ssml, output_format, region):
+        h = hashlib.sha256()
+        for part in (str(output_format), (region or "").strip().lower(), ssml):
+            h.update(part.encode("utf-8"))
+            h.update(b"\x00")
+        return h.hexdigest()
+
+    def configure(self, max_bytes=None, max_age_sec=None):
+        with self._lock:
+            if max_bytes is not None: self.max_bytes = max_bytes
+            if max_age_sec is not None: self.max_age_sec = max_age_sec
+            self.evict()
+
+    def _entry_path(self, key, ext):
+        return os.path.join(self.cache_dir, f"{key}{ext}")
+
+    def _load_index(self):
+        entries = {}
+        try:
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'r', encoding='utf-8') as f: data = json.load(f)
+                if data.get("version") == CACHE_INDEX_VERSION:
+                    entries = data.get("entries", {})
+        except (OSError, ValueError) as e:
+            print(f"警告: 缓存索引 '{self.index_path}' 读取失败，将重建索引。错误: {e}")
+        # 只保留磁盘上仍然存在的条目
+        self._entries = {k: v for k, v in entries.items() if os.path.exists(self._entry_path(k, v.get("ext", ".wav")))}
+
+    def _mark_dirty(self):
+        # 调用方持有 _lock
+        self._dirty = True
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_delay_sec, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        # 把内存中的索引写盘；序列化在 _lock 内完成，写文件在 _lock 之外，不阻塞并发的 get/put
+        with self._flush_lock:
+            with self._lock:
+                if self._flush_timer is not None: self._flush_timer.cancel()
+                self._flush_timer = None
+                if not self._dirty: return
+                text = json.dumps({"version": CACHE_INDEX_VERSION, "entries": self._entries}, ensure_ascii=False)
+                self._dirty = False
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", prefix="index_", dir=self.cache_dir)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f: f.write(text)
+                os.replace(tmp_path, self.index_path)
+            except OSError as e:
+                print(f"警告: 无法写入缓存索引 '{self.index_path}'。错误: {e}")
+                try: os.remove(tmp_path)
+                except OSError: pass
+                with self._lock: self._dirty = True # 下一次 flush 时重试
+
+    def close(self):
+        self.flush()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            path = self._entry_path(key, entry.get("ext", ".wav")) if entry else None
+            if entry and os.path.exists(path):
+                entry["last_access"] = time.time()
+                entry["hit_count"] = entry.get("hit_count", 0) + 1
+                self.hits += 1
+                self._mark_dirty()
+                return path
+            if entry:
+                del self._entries[key]
+                self._mark_dirty()
+            self.misses += 1
+            return None
+
+    def get_entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry) if entry else None
+
+    def contains(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return bool(entry) and os.path.exists(self._entry_path(key, entry.get("ext", ".wav")))
+
+    def owns_path(self, path):
+        if not path: return False
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.cache_dir) and \
+            os.path.splitext(os.path.basename(path))[0] in self._entries
+
+    def put_file(self, key, src_path, duration_sec=0, ext=".wav", move=True):
+        dest_path = self._entry_path(key, ext)
+        with self._lock:
+            if move: os.replace(src_path, dest_path)
+            elif os.path.abspath(src_path) != os.path.abspath(dest_path): shutil.copyfile(src_path, dest_path)
+            now = time.time()
+            self._entries[key] = {
+                "ext": ext,
+                "size": os.path.getsize(dest_path),
+                "duration_sec": duration_sec,
+                "created": now,
+                "last_access": now,
+                "hit_count": 0,
+            }
+            self.evict(protect_key=key)
+            self._mark_dirty()
+        return dest_path
+
+    def put_bytes(self, key, data, duration_sec=0, ext=".wav"):
+        fd, tmp_path = tempfile.mkstemp(suffix=ext, prefix="azure_tts_", dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as f: f.write(data)
+        return self.put_file(key, tmp_path, duration_sec=duration_sec, ext=ext, move=True)
+
+    def remove(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                try: os.remove(self._entry_path(key, entry.get("ext", ".wav")))
+                except OSError as e: print(f"Debug: 删除缓存条目 {key} 失败 (可忽略): {e}")
+                self._mark_dirty()
+
+    def evict(self, protect_key=None):
+        with self._lock:
+            now = time.time()
+            removed = []
+            for key, entry in list(self._entries.items()):
+                if key != protect_key and self.max_age_sec and now - entry.get("last_access", 0) > self.max_age_sec:
+                    removed.append(key)
+            total = sum(e.get("size", 0) for k, e in self._entries.items() if k not in removed)
+            if self.max_bytes and total > self.max_bytes:
+                lru_order = sorted((k for k in self._entries if k not in removed and k != protect_key),
+                                   key=lambda k: self._entries[k].get("last_access", 0))
+                for key in lru_order:
+                    if total <= self.max_bytes: break
+                    total -= self._entries[key].get("size", 0)
+                    removed.append(key)
+            for key in removed:
+                entry = self._entries.pop(key)
+                try: os.remove(self._entry_path(key, entry.get("ext", ".wav")))
+                except OSError as e: print(f"Debug: 淘汰缓存条目 {key} 时删除文件失败 (可忽略): {e}")
+            if removed:
+                print(f"Debug: 已淘汰 {len(removed)} 个缓存条目。")
+                self._mark_dirty()
+            return len(removed)
+
+    def cleanup_orphans(self, min_age_sec=0):
+        # 删除不在索引中的残留文件 (例如旧版本或异常退出留下的临时文件)；
+        # min_age_sec 用于跳过最近修改过、可能仍在写入的文件
+        now = time.time()
+        with self._lock:
+            known = {f"{k}{e.get('ext', '.wav')}" for k, e in self._entries.items()}
+            known.add(CACHE_INDEX_FILE_NAME)
+            removed = 0
+            for name in os.listdir(self.cache_dir):
+                if name in known: continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    if not os.path.isfile(path) or (min_age_sec and now - os.path.getmtime(path) < min_age_sec): continue
+                    os.remove(path); removed += 1
+                except OSError as e:
+                    print(f"Debug: 清理残留缓存文件 '{path}' 失败 (可忽略): {e}")
+            return removed
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(e.get("size", 0) for e in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
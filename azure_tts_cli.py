@@ -0,0 +1,462 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from azure_tts_audio import (MP3_FORMAT_NAME, PCM_CHANNELS, PCM_SAMPLE_RATE, PCM_SAMPLE_WIDTH, WAV_FORMAT_NAME, build_wav_bytes,
+                             join_audio_chunks, local_mp3_encoder_name, wav_duration_sec)
+from azure_tts_backend import BACKEND_AZURE, BACKEND_STUB, BACKEND_TYPES, create_backend
+from azure_tts_cache import SynthesisCache
+from azure_tts_config import ConfigError, default_config_path, get_profile_settings, read_config_file
+from azure_tts_export import EXPORT_SOURCE_SERVICE, obtain_mp3_audio
+from azure_tts_longform import DEFAULT_LONGFORM_MIN_CHARS, DEFAULT_LONGFORM_SEGMENT_CHARS, export_longform, plan_longform
+from azure_tts_metrics import MARK_FILE_WRITTEN, MetricsRegistry
+from azure_tts_packing import DEFAULT_PACK_GAP_MS, DEFAULT_PACK_MAX_CHARS, DEFAULT_PACK_MAX_ITEMS, PackSplitError, plan_packs, synthesize_pack
+from azure_tts_pool import SynthesizerPool
+from azure_tts_scheduler import RequestScheduler, scheduler_from_settings
+from azure_tts_script import compile_script_text
+from azure_tts_ssml import DEFAULT_CHUNK_MAX_CHARS, build_ssml, split_text_into_chunks
+from azure_tts_synthesis import DEFAULT_SYNTHESIS_WORKERS, SynthesisError, synthesize_chunks_parallel
+
+# 无界面批量合成入口：不导入 tkinter / pygame，可在服务器或流水线中运行
+OUTPUT_FORMATS = {
+    "wav": (WAV_FORMAT_NAME, ".wav"),
+    "mp3": (MP3_FORMAT_NAME, ".mp3"),
+}
+TEXT_FILE_EXTENSIONS = (".txt", ".text", ".md")
+
+
+class BatchJob:
+    # 多角色剧本作业的 voice_params 为 None，ssml_requests 为编译好的各请求 SSML
+    def __init__(self, text, output_path, voice_params, output_format="wav", source="", ssml_requests=None):
+        self.text = text
+        self.output_path = output_path
+        self.voice_params = voice_params
+        self.output_format = output_format
+        self.source = source
+        self.ssml_requests = ssml_requests
+
+
+def _lang_from_voice(voice_name):
+    parts = (voice_name or "").split("-")
+    return "-".join(parts[:2]) if len(parts) >= 3 else ""
+
+
+def resolve_voice_params(config_data, profile=None, overrides=None):
+    params = {"lang": "", "voice": "", "role": "(无)", "style": "(默认)", "rate": 1.0}
+    if profile: params.update(get_profile_settings(config_data, profile))
+    for key, value in (overrides or {}).items():
+        if value is not None and value != "": params[key] = float(value) if key == "rate" else value
+    if not params["voice"]: raise ConfigError("未指定语音：请使用 --voice 或 --profile，或在清单条目中提供 voice/profile。")
+    if not params["lang"]: params["lang"] = _lang_from_voice(params["voice"])
+    if not params["lang"]: raise ConfigError(f"无法从语音 '{params['voice']}' 推断语言，请使用 --lang 指定。")
+    return params
+
+
+def _read_text_file(path):
+    with open(path, 'r', encoding='utf-8-sig') as f: return f.read().strip()
+
+
+def _output_path_for(output_dir, name, output_format):
+    stem = os.path.splitext(name)[0]
+    return os.path.join(output_dir, stem + OUTPUT_FORMATS[output_format][1])
+
+
+def build_jobs(inputs, output_dir, config_data, base_profile=None, base_overrides=None, output_format="wav", script=False):
+    # script=True 时文本文件按多角色剧本 (每行 "配置名: 台词") 编译；JSONL 条目可以用 "script" 字段代替 "text"
+    jobs = []
+    base_params = None
+    def get_base_params():
+        nonlocal base_params
+        if base_params is None: base_params = resolve_voice_params(config_data, base_profile, base_overrides)
+        return base_params
+
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            for name in sorted(os.listdir(input_path)):
+                file_path = os.path.join(input_path, name)
+                if os.path.isfile(file_path) and name.lower().endswith(TEXT_FILE_EXTENSIONS):
+                    output_path = _output_path_for(output_dir, name, output_format)
+                    if script: jobs.append(_script_job(_read_text_file(file_path), output_path, config_data, output_format, file_path))
+                    else: jobs.append(BatchJob(_read_text_file(file_path), output_path, get_base_params(), output_format, file_path))
+        elif input_path.lower().endswith(".jsonl"):
+            manifest_dir = os.path.dirname(os.path.abspath(input_path))
+            with open(input_path, 'r', encoding='utf-8-sig') as f:
+                for line_no, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line or line.startswith("#"): continue
+                    try: item = json.loads(line)
+                    except ValueError as e: raise ConfigError(f"{input_path}:{line_no}: 无效的 JSON: {e}")
+                    item_format = item.get("format", output_format)
+                    if item_format not in OUTPUT_FORMATS: raise ConfigError(f"{input_path}:{line_no}: 不支持的输出格式 '{item_format}'。")
+                    output_name = item.get("output") or f"{line_no:05d}"
+                    if "script" in item:
+                        jobs.append(_script_job(str(item["script"]), _output_path_for(output_dir, output_name, item_format), config_data, item_format, f"{input_path}:{line_no}"))
+                        continue
+                    if "text" in item: text = str(item["text"]).strip()
+                    elif "text_file" in item: text = _read_text_file(os.path.join(manifest_dir, item["text_file"]))
+                    else: raise ConfigError(f"{input_path}:{line_no}: 条目缺少 text、text_file 或 script 字段。")
+                    item_overrides = {k: item.get(k) for k in ("lang", "voice", "role", "style", "rate")}
+                    if item.get("profile") or any(v not in (None, "") for v in item_overrides.values()):
+                        merged = dict(base_overrides or {})
+                        merged.update({k: v for k, v in item_overrides.items() if v not in (None, "")})
+                        params = resolve_voice_params(config_data, item.get("profile") or base_profile, merged)
+                    else:
+                        params = get_base_params()
+                    jobs.append(BatchJob(text, _output_path_for(output_dir, output_name, item_format), params, item_format, f"{input_path}:{line_no}"))
+        elif os.path.isfile(input_path):
+            output_path = _output_path_for(output_dir, os.path.basename(input_path), output_format)
+            if script: jobs.append(_script_job(_read_text_file(input_path), output_path, config_data, output_format, input_path))
+            else: jobs.append(BatchJob(_read_text_file(input_path), output_path, get_base_params(), output_format, input_path))
+        else:
+            raise ConfigError(f"输入不存在: {input_path}")
+    return jobs
+
+
+def _script_job(script_text, output_path, config_data, output_format, source):
+    try: ssml_requests = compile_script_text(script_text, config_data, resolve_voice_params)
+    except ConfigError as e: raise ConfigError(f"{source}: {e}")
+    return BatchJob(script_text, output_path, None, output_format, source, ssml_requests=ssml_requests)
+
+
+def _write_file_atomic(path, data):
+    out_dir = os.path.dirname(os.path.abspath(path))
+    os.makedirs(out_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".part", prefix=".azure_tts_", dir=out_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f: f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+
+class BatchRunner:
+    # 批量合成：作业级并发由 workers 控制，复用合成器池和持久缓存。
+    # pack=True 时同一语音的短文本打包成一个请求合成，再按书签切回各个作业 (见 azure_tts_packing)。
+    # 不少于 longform_min_chars 的文本按长篇导出，逐段记入日志，中断后再次运行从日志继续 (见 azure_tts_longform)
+    def __init__(self, backend, workers=DEFAULT_SYNTHESIS_WORKERS, cache=None,
+                 chunk_max_chars=DEFAULT_CHUNK_MAX_CHARS, overwrite=False, scheduler=None, metrics=None,
+                 pack=False, pack_max_chars=DEFAULT_PACK_MAX_CHARS, pack_max_items=DEFAULT_PACK_MAX_ITEMS, pack_gap_ms=DEFAULT_PACK_GAP_MS,
+                 longform_min_chars=DEFAULT_LONGFORM_MIN_CHARS, longform_segment_chars=DEFAULT_LONGFORM_SEGMENT_CHARS):
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.cache = cache
+        self.chunk_max_chars = chunk_max_chars
+        self.overwrite = overwrite
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.pack = pack
+        self.pack_max_chars = max(1, pack_max_chars)
+        self.pack_max_items = max(1, pack_max_items)
+        self.pack_gap_ms = pack_gap_ms
+        self.longform_min_chars = longform_min_chars
+        self.longform_segment_chars = longform_segment_chars
+        self._print_lock = threading.Lock()
+
+    def synthesize_job(self, job, chunk_workers=1):
+        started = time.monotonic()
+        result = {"source": job.source, "output": job.output_path, "chars": len(job.text), "status": "ok", "error": None, "elapsed_sec": 0.0}
+        if not job.text:
+            result.update(status="failed", error="文本为空")
+            return result
+        if not self.overwrite and os.path.exists(job.output_path):
+            result["status"] = "skipped"
+            return result
+        timeline = self.metrics.new_timeline("batch", chars=len(job.text))
+        try:
+            if job.ssml_requests is None and self.longform_min_chars and len(job.text) >= self.longform_min_chars:
+                result.update(self.export_longform_job(job, timeline, chunk_workers))
+            else:
+                if job.ssml_requests is not None:
+                    audio, result["status"], audio_source = self.obtain_script_audio(job.ssml_requests, job.output_format, timeline, chunk_workers)
+                else:
+                    audio, result["status"], audio_source = self.obtain_audio(job.text, job.voice_params, job.output_format, timeline, chunk_workers)
+                if audio_source is not None: result["audio_source"] = audio_source
+                _write_file_atomic(job.output_path, audio)
+            timeline.mark(MARK_FILE_WRITTEN)
+        except (SynthesisError, OSError) as e:
+            result.update(status="failed", error=str(e).replace("\n", " "))
+        except Exception as e:
+            result.update(status="failed", error=f"{type(e).__name__}: {e}")
+        timeline.finish("error" if result["status"] == "failed" else result["status"], result["error"])
+        result["elapsed_sec"] = time.monotonic() - started
+        return result
+
+    def obtain_audio(self, text, voice_params, output_format, timeline, chunk_workers=1):
+        # 取得一段文本的音频：先查缓存，没有时分段合成并写入缓存。返回 (音频字节, "ok" | "cached", MP3 的音频来源或 None)
+        p = voice_params
+        ssml = build_ssml(text, p["lang"], p["voice"], p["role"], p["style"], p["rate"])
+
+        def chunk_ssml_list():
+            text_chunks = split_text_into_chunks(text, self.chunk_max_chars)
+            return [build_ssml(c, p["lang"], p["voice"], p["role"], p["style"], p["rate"]) for c in text_chunks] if len(text_chunks) > 1 else [ssml]
+        return self._obtain_ssml_audio(ssml, chunk_ssml_list, output_format, timeline, chunk_workers)
+
+    def export_longform_job(self, job, timeline, chunk_workers=1):
+        # 每段按普通方式取得 (先查缓存)，完成即写入 "<输出>.parts/" 并记入日志；返回要合并到结果中的字段
+        p = job.voice_params
+        format_name = OUTPUT_FORMATS[job.output_format][0]
+        segments = plan_longform(job.text, lambda piece: build_ssml(piece, p["lang"], p["voice"], p["role"], p["style"], p["rate"]),
+                                 format_name, self.backend.cache_namespace, self.longform_segment_chars)
+        def obtain_segment(segment):
+            return self._obtain_ssml_audio(segment.ssml, lambda: [segment.ssml], job.output_format, timeline, 1)[0]
+        def on_progress(done, total, resumed):
+            if done and done < total and done % 10 == 0:
+                with self._print_lock: print(f"  {job.output_path}: {done}/{total} 段", flush=True)
+        stats = export_longform(job.output_path, segments, obtain_segment, job.output_format, max_workers=chunk_workers, progress_callback=on_progress)
+        timeline.chunks = stats["segments"]
+        return {"longform": stats}
+
+    def obtain_script_audio(self, ssml_requests, output_format, timeline, chunk_workers=1):
+        # 多角色剧本：各请求并行合成后按顺序拼成一个连续的音频；以全部请求 SSML 拼接后的文本作为缓存键
+        return self._obtain_ssml_audio("".join(ssml_requests), lambda: list(ssml_requests), output_format, timeline, chunk_workers)
+
+    def _obtain_ssml_audio(self, ssml, chunk_ssml_list_fn, output_format, timeline, chunk_workers):
+        format_name, ext = OUTPUT_FORMATS[output_format]
+
+        def synthesize_from_service():
+            chunk_ssml_list = chunk_ssml_list_fn()
+            timeline.chunks = len(chunk_ssml_list)
+            parts = synthesize_chunks_parallel(
+                chunk_ssml_list,
+                lambda chunk_ssml: self.scheduler.call(
+                    lambda: self.backend.synthesize(chunk_ssml, format_name, on_event=timeline.on_synthesis_event),
+                    chars=len(chunk_ssml), on_dispatch=timeline.on_dispatch),
+                max_workers=chunk_workers,
+            )
+            return join_audio_chunks(parts, output_format)
+
+        if output_format == "mp3":
+            # MP3 优先复用缓存的 MP3 或同一 SSML 已合成的 WAV (本地编码)，都没有时才调用服务
+            audio, source = obtain_mp3_audio(self.cache, ssml, self.backend.cache_namespace, synthesize_from_service)
+            return audio, "ok" if source == EXPORT_SOURCE_SERVICE else "cached", source
+        cache_key = SynthesisCache.make_key(ssml, format_name, self.backend.cache_namespace)
+        cached_path = self.cache.get(cache_key) if self.cache else None
+        if cached_path:
+            with open(cached_path, 'rb') as f: return f.read(), "cached", None
+        audio = synthesize_from_service()
+        if self.cache: self.cache.put_bytes(cache_key, audio, duration_sec=wav_duration_sec(audio), ext=ext)
+        return audio, "ok", None
+
+    def _ssml_for(self, job):
+        p = job.voice_params
+        return build_ssml(job.text, p["lang"], p["voice"], p["role"], p["style"], p["rate"])
+
+    def _is_packable(self, job):
+        # 剧本、已有输出、已在缓存中、需要分段或无法在本地编码 MP3 的作业按普通方式处理
+        if job.ssml_requests is not None: return False
+        if not job.text or len(job.text) > self.pack_max_chars: return False
+        if not self.overwrite and os.path.exists(job.output_path): return False
+        if job.output_format == "mp3" and not local_mp3_encoder_name(): return False
+        if self.cache:
+            ssml = self._ssml_for(job)
+            namespace = self.backend.cache_namespace
+            if any(self.cache.contains(SynthesisCache.make_key(ssml, format_name, namespace)) for format_name in (WAV_FORMAT_NAME, OUTPUT_FORMATS[job.output_format][0])):
+                return False
+        return True
+
+    def plan(self, jobs):
+        # 返回作业分组：多于一个作业的组打包成一个请求合成
+        if not self.pack: return [[job] for job in jobs]
+        packable = [job for job in jobs if self._is_packable(job)]
+        groups = [[packable[idx] for idx in pack] for pack in plan_packs([(job.text, job.voice_params) for job in packable], self.pack_max_chars, self.pack_max_items)]
+        packed_ids = {id(job) for job in packable}
+        return groups + [[job] for job in jobs if id(job) not in packed_ids]
+
+    def synthesize_pack_jobs(self, jobs):
+        # 一次请求合成整组作业，按书签切开后分别写出并各自写入缓存 (与单独合成同一文本使用相同的缓存键)。
+        # 书签缺失或偏移异常时改为逐个合成
+        started = time.monotonic()
+        timeline = self.metrics.new_timeline("batch_pack", chars=sum(len(job.text) for job in jobs))
+        request_stream = lambda ssml, on_event: self.scheduler.call(
+            lambda: self.backend.synthesize_with_events(ssml, lambda data: None, on_event=on_event),
+            chars=len(ssml), on_dispatch=timeline.on_dispatch)
+        try:
+            clips = synthesize_pack([job.text for job in jobs], jobs[0].voice_params, request_stream,
+                                    on_event=timeline.on_synthesis_event, gap_ms=self.pack_gap_ms)
+        except PackSplitError as e:
+            timeline.finish("error", e)
+            print(f"警告: 打包合成的 {len(jobs)} 个作业无法按书签切分 ({e})，改为逐个合成。", file=sys.stderr, flush=True)
+            return [self.synthesize_job(job) for job in jobs]
+        except Exception as e:
+            timeline.finish("error", e)
+            error = str(e).replace("\n", " ") if isinstance(e, (SynthesisError, OSError)) else f"{type(e).__name__}: {e}"
+            return [{"source": job.source, "output": job.output_path, "chars": len(job.text), "status": "failed", "error": error,
+                     "elapsed_sec": time.monotonic() - started, "packed": len(jobs)} for job in jobs]
+        timeline.finish("ok")
+        namespace = self.backend.cache_namespace
+        results = []
+        for job, pcm in zip(jobs, clips):
+            result = {"source": job.source, "output": job.output_path, "chars": len(job.text), "status": "ok", "error": None, "packed": len(jobs)}
+            try:
+                ssml = self._ssml_for(job)
+                wav = build_wav_bytes(pcm)
+                if self.cache:
+                    try: self.cache.put_bytes(SynthesisCache.make_key(ssml, WAV_FORMAT_NAME, namespace), wav,
+                                              duration_sec=len(pcm) / (PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH * PCM_CHANNELS))
+                    except OSError as e: print(f"警告: 无法将合成结果写入缓存。错误: {e}", file=sys.stderr)
+                audio = wav
+                if job.output_format == "mp3":
+                    audio, result["audio_source"] = obtain_mp3_audio(self.cache, ssml, namespace,
+                                                                     lambda: self.backend.synthesize(ssml, MP3_FORMAT_NAME), wav_data=wav)
+                _write_file_atomic(job.output_path, audio)
+            except (SynthesisError, OSError) as e:
+                result.update(status="failed", error=str(e).replace("\n", " "))
+            except Exception as e:
+                result.update(status="failed", error=f"{type(e).__name__}: {e}")
+            result["elapsed_sec"] = time.monotonic() - started
+            results.append(result)
+        return results
+
+    def run(self, jobs, on_result=None):
+        # 只有一个作业时把并发用于该作业内部的分段合成
+        chunk_workers = self.workers if len(jobs) == 1 else 1
+        groups = self.plan(jobs)
+        results = []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tts_batch") as executor:
+            futures = [executor.submit(self.synthesize_pack_jobs, group) if len(group) > 1 else executor.submit(lambda job: [self.synthesize_job(job, chunk_workers)], group[0])
+                       for group in groups]
+            for future in as_completed(futures):
+                for result in future.result():
+                    results.append(result)
+                    if on_result:
+                        with self._print_lock: on_result(result, len(results), len(jobs))
+        return results
+
+
+def summarize_results(results, elapsed_sec):
+    counts = {}
+    for r in results: counts[r["status"]] = counts.get(r["status"], 0) + 1
+    synthesized_chars = sum(r["chars"] for r in results if r["status"] == "ok")
+    return {
+        "jobs": len(results),
+        "counts": counts,
+        "elapsed_sec": round(elapsed_sec, 3),
+        "synthesized_chars": synthesized_chars,
+        "chars_per_sec": round(synthesized_chars / elapsed_sec, 1) if elapsed_sec > 0 else 0.0,
+    }
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Azure 文本转语音 - 无界面批量合成")
+    parser.add_argument("inputs", nargs="+", help="文本文件、包含文本文件的目录，或 JSONL 清单 (每行 {\"text\"|\"text_file\"|\"script\", \"output\", 可选 profile/voice/lang/role/style/rate/format})")
+    parser.add_argument("-o", "--output-dir", required=True, help="输出目录")
+    parser.add_argument("--config", default=default_config_path(), help="配置文件路径 (默认: 脚本目录下的 azure_tts_settings.json)")
+    parser.add_argument("--profile", help="使用 azure_tts_settings.json 中保存的语音配置")
+    parser.add_argument("--voice", help="语音名称，例如 zh-CN-XiaoxiaoNeural (覆盖配置中的语音)")
+    parser.add_argument("--lang", help="语言，例如 zh-CN (默认根据语音名称推断)")
+    parser.add_argument("--role", help="角色风格")
+    parser.add_argument("--style", help="说话风格")
+    parser.add_argument("--rate", type=float, help="语速，例如 1.2")
+    parser.add_argument("--script", action="store_true", help="把文本文件作为多角色剧本：每行 \"配置名: 台词\"，合成为一个连续的音频")
+    parser.add_argument("--format", choices=sorted(OUTPUT_FORMATS), default="wav", help="输出格式 (默认: wav)")
+    parser.add_argument("-j", "--workers", type=int, help="并发合成数 (默认: 配置中的 synthesis.max_workers)")
+    parser.add_argument("--rps", type=float, help="每秒最多发起的合成请求数 (默认: 配置中的 scheduler.requests_per_sec)")
+    parser.add_argument("--cpm", type=int, help="每分钟最多提交的字符数，0 表示不限制 (默认: 配置中的 scheduler.chars_per_minute)")
+    parser.add_argument("--key", help="订阅密钥 (默认: 环境变量 AZURE_SPEECH_KEY 或配置文件)")
+    parser.add_argument("--region", help="服务区域 (默认: 环境变量 AZURE_SPEECH_REGION 或配置文件)")
+    parser.add_argument("--backend", choices=BACKEND_TYPES, help="合成后端：azure，或不联网的本地模拟后端 stub (默认: 配置中的 backend.type)")
+    parser.add_argument("--no-cache", action="store_true", help="不读取也不写入合成缓存")
+    parser.add_argument("--overwrite", action="store_true", help="覆盖已存在的输出文件 (默认跳过)")
+    parser.add_argument("--pack", action="store_true", help="把同一语音的短文本打包成一个请求合成，再按 SSML 书签切回各个文件 (适合大量短句)")
+    parser.add_argument("--pack-max-chars", type=int, default=DEFAULT_PACK_MAX_CHARS, help=f"每个打包请求的最大字符数 (默认: {DEFAULT_PACK_MAX_CHARS})")
+    parser.add_argument("--pack-max-items", type=int, default=DEFAULT_PACK_MAX_ITEMS, help=f"每个打包请求最多包含的条目数 (默认: {DEFAULT_PACK_MAX_ITEMS})")
+    parser.add_argument("--summary-json", help="将结果摘要写入该 JSON 文件")
+    parser.add_argument("--metrics-jsonl", help="把每个作业的分阶段耗时追加到该 JSONL 文件")
+    parser.add_argument("--metrics-prom", help="运行结束后把延迟直方图写入该 Prometheus 文本文件")
+    parser.add_argument("-v", "--verbose", action="store_true", help="逐个请求输出分阶段耗时 (默认只输出失败和慢请求)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    try:
+        config_data = read_config_file(args.config)
+        credentials = config_data.get("azure_credentials", {}) or {}
+        subscription_key = args.key or os.environ.get("AZURE_SPEECH_KEY") or credentials.get("subscription_key", "")
+        service_region = args.region or os.environ.get("AZURE_SPEECH_REGION") or credentials.get("service_region", "")
+        backend_settings = dict(config_data.get("backend", {}) or {})
+        if args.backend: backend_settings["type"] = args.backend
+        use_stub = str(backend_settings.get("type", BACKEND_AZURE)).strip().lower() == BACKEND_STUB
+        if not use_stub and not backend_settings.get("endpoints") and (not subscription_key or not service_region):
+            raise ConfigError("缺少订阅密钥或服务区域：请使用 --key/--region、环境变量或配置文件提供。")
+        overrides = {"voice": args.voice, "lang": args.lang, "role": args.role, "style": args.style, "rate": args.rate}
+        jobs = build_jobs(args.inputs, args.output_dir, config_data, args.profile, overrides, args.format, script=args.script)
+    except ConfigError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 2
+    if not jobs:
+        print("没有找到需要合成的输入。", file=sys.stderr)
+        return 1
+
+    synthesis_settings = config_data.get("synthesis", {}) or {}
+    workers = args.workers or int(synthesis_settings.get("max_workers", DEFAULT_SYNTHESIS_WORKERS))
+    cache = None
+    if not args.no_cache:
+        cache_settings = config_data.get("synthesis_cache", {}) or {}
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(args.config)), "azure_tts_cache")
+        cache = SynthesisCache(cache_dir)
+        cache.configure(max_bytes=int(float(cache_settings.get("max_size_mb", 512)) * 1024 * 1024),
+                        max_age_sec=float(cache_settings.get("max_age_days", 30)) * 24 * 3600)
+    scheduler_settings = dict(config_data.get("scheduler", {}) or {})
+    if args.rps is not None: scheduler_settings["requests_per_sec"] = args.rps
+    if args.cpm is not None: scheduler_settings["chars_per_minute"] = args.cpm
+
+    def on_retry(kind, attempt, max_retries, delay_sec, exc):
+        reason = "服务限流" if kind == "throttled" else "临时错误"
+        print(f"{reason}，{delay_sec:.1f} 秒后重试 ({attempt}/{max_retries})", file=sys.stderr, flush=True)
+
+    pool = SynthesizerPool(max_idle_per_key=workers)
+    try:
+        backend = create_backend(backend_settings, subscription_key, service_region, pool=pool)
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 2
+    runner = BatchRunner(backend, workers=workers, cache=cache,
+                         chunk_max_chars=int(synthesis_settings.get("chunk_max_chars", DEFAULT_CHUNK_MAX_CHARS)),
+                         overwrite=args.overwrite, scheduler=scheduler_from_settings(scheduler_settings, on_retry=on_retry),
+                         metrics=MetricsRegistry(jsonl_path=args.metrics_jsonl, log_requests=args.verbose),
+                         pack=args.pack, pack_max_chars=args.pack_max_chars, pack_max_items=args.pack_max_items,
+                         longform_min_chars=int(synthesis_settings.get("longform_min_chars", DEFAULT_LONGFORM_MIN_CHARS)),
+                         longform_segment_chars=int(synthesis_settings.get("longform_segment_chars", DEFAULT_LONGFORM_SEGMENT_CHARS)))
+
+    def on_result(result, done, total):
+        line = f"[{done}/{total}] {result['status']:<7} {result['output']}"
+        if result["error"]: line += f"  ({result['error']})"
+        print(line, flush=True)
+
+    target = "本地模拟后端" if use_stub else (f"{len(backend.endpoints)} 个终结点" if hasattr(backend, "endpoints") else f"区域 {service_region}")
+    print(f"共 {len(jobs)} 个作业，并发 {runner.workers}，{target}", flush=True)
+    started = time.monotonic()
+    results = runner.run(jobs, on_result=on_result)
+    summary = summarize_results(results, time.monotonic() - started)
+    backend.close()
+    pool.clear()
+    if cache: cache.close()
+    summary["scheduler"] = runner.scheduler.stats()
+    summary["latency"] = runner.metrics.snapshot().get("batch", {})
+    if hasattr(backend, "endpoint_stats"): summary["endpoints"] = backend.endpoint_stats()
+    if args.metrics_prom:
+        try: runner.metrics.write_prometheus(args.metrics_prom)
+        except OSError as e: print(f"警告: 无法写入 {args.metrics_prom}: {e}", file=sys.stderr)
+    print(f"完成: {json.dumps(summary['counts'], ensure_ascii=False)}，耗时 {summary['elapsed_sec']} 秒，{summary['chars_per_sec']} 字符/秒"
+          + (f"，重试 {summary['scheduler']['retries']} 次 (限流 {summary['scheduler']['throttled']} 次)" if summary["scheduler"]["retries"] else ""))
+    packed = [r for r in results if r.get("packed")]
+    if packed: print(f"  打包合成: {len(packed)} 个作业，{round(sum(1 / r['packed'] for r in packed))} 个请求")
+    for endpoint in summary.get("endpoints", []):
+        print(f"  终结点 {endpoint['name']}: 请求 {endpoint['requests']}，成功 {endpoint['succeeded']}，限流 {endpoint['throttled']}，"
+              f"认证错误 {endpoint['auth_errors']}，网络错误 {endpoint['transient_errors']}，p50 {endpoint['latency_p50_ms']} ms")
+    if args.summary_json:
+        summary["results"] = sorted(results, key=lambda r: r["output"])
+        with open(args.summary_json, 'w', encoding='utf-8') as f: json.dump(summary, f, indent=4, ensure_ascii=False)
+    return 1 if summary["counts"].get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
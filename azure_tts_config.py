@@ -0,0 +1,39 @@
+import json
+import os
+
+CONFIG_FILE_NAME = "azure_tts_settings.json"
+
+
+class ConfigError(Exception):
+    pass
+
+
+def default_config_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), CONFIG_FILE_NAME)
+
+
+def read_config_file(config_path):
+    # 读取 azure_tts_settings.json；文件不存在时返回空配置
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f: config_data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"加载配置文件 '{config_path}' 时出错: {e}")
+    if not isinstance(config_data, dict): raise ConfigError(f"配置文件 '{config_path}' 格式无效。")
+    return config_data
+
+
+def get_profile_settings(config_data, profile_name):
+    profiles = config_data.get("voice_profiles", {}) or {}
+    if profile_name not in profiles:
+        available = ", ".join(sorted(profiles)) or "(无)"
+        raise ConfigError(f"未找到语音配置 '{profile_name}'。可用配置: {available}")
+    profile = profiles[profile_name]
+    return {
+        "lang": profile.get("language", ""),
+        "voice": profile.get("voice", ""),
+        "role": profile.get("role", "(无)"),
+        "style": profile.get("style", "(默认)"),
+        "rate": float(profile.get("rate", 1.0)),
+    }
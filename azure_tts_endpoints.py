@@ -0,0 +1,205 @@
+from collections import deque
+import threading
+import time
+
+from azure_tts_audio import WAV_FORMAT_NAME
+from azure_tts_backend import BACKEND_AZURE, BACKEND_STUB, AzureBackend, SynthesisBackend
+from azure_tts_metrics import RollingHistogram
+from azure_tts_scheduler import classify_error
+
+# 多个订阅密钥/区域组成的终结点池：每个请求按健康状况、当前负载、延迟和剩余配额选择终结点，
+# 遇到限流、认证或网络错误时把该终结点冷却一段时间，并立即改用其他终结点重试
+DEFAULT_THROTTLE_COOLDOWN_SEC = 10.0
+DEFAULT_TRANSIENT_COOLDOWN_SEC = 5.0
+DEFAULT_AUTH_COOLDOWN_SEC = 600.0
+MAX_TRANSIENT_COOLDOWN_SEC = 120.0
+QUOTA_WINDOW_SEC = 60.0
+LATENCY_EWMA_ALPHA = 0.2
+
+AUTH_ERROR_CODES = {"AuthenticationFailure", "Forbidden"}
+
+
+def classify_endpoint_error(exc):
+    # 在 classify_error 的基础上区分认证错误 (密钥无效、被禁用)：返回 "auth"、"throttled"、"transient" 或 None
+    code = getattr(exc, "error_code", None)
+    code_name = getattr(code, "name", None) or (str(code).split(".")[-1] if code is not None else "")
+    if code_name in AUTH_ERROR_CODES: return "auth"
+    text = " ".join(str(x) for x in (exc, getattr(exc, "error_details", "") or "")).lower()
+    if "401" in text or "403" in text or "authentication" in text or "unauthorized" in text: return "auth"
+    return classify_error(exc)
+
+
+class Endpoint:
+    def __init__(self, name, backend, weight=1.0, chars_per_minute=0):
+        self.name = name
+        self.backend = backend
+        self.weight = max(0.01, float(weight))
+        self.chars_per_minute = max(0, int(chars_per_minute))
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.consecutive_failures = 0
+        self.latency_ewma = None
+        self.latency = RollingHistogram()
+        self._chars = deque() # (时间, 字符数)，最近一分钟内发出的字符
+        self.stats = {"requests": 0, "succeeded": 0, "failed": 0, "throttled": 0, "auth_errors": 0, "transient_errors": 0}
+
+    def chars_used(self, now):
+        while self._chars and now - self._chars[0][0] > QUOTA_WINDOW_SEC: self._chars.popleft()
+        return sum(chars for _, chars in self._chars)
+
+    def remaining_fraction(self, now, chars):
+        # 剩余配额比例；不设配额时为 1，不够这次请求时为 0
+        if not self.chars_per_minute: return 1.0
+        remaining = self.chars_per_minute - self.chars_used(now)
+        return 0.0 if remaining < chars else remaining / self.chars_per_minute
+
+    def score(self, now, chars):
+        # 越小越好：负载 (按权重) × 平均延迟 ÷ 剩余配额比例
+        latency = self.latency_ewma if self.latency_ewma is not None else 1.0
+        return (self.in_flight + 1) / self.weight * max(0.05, latency) / max(0.05, self.remaining_fraction(now, chars))
+
+
+class MultiEndpointBackend(SynthesisBackend):
+    name = BACKEND_AZURE
+
+    def __init__(self, endpoints, throttle_cooldown_sec=DEFAULT_THROTTLE_COOLDOWN_SEC,
+                 transient_cooldown_sec=DEFAULT_TRANSIENT_COOLDOWN_SEC, auth_cooldown_sec=DEFAULT_AUTH_COOLDOWN_SEC):
+        if not endpoints: raise ValueError("终结点池至少需要一个终结点。")
+        self.endpoints = list(endpoints)
+        self.throttle_cooldown_sec = throttle_cooldown_sec
+        self.transient_cooldown_sec = transient_cooldown_sec
+        self.auth_cooldown_sec = auth_cooldown_sec
+        self._lock = threading.Lock()
+
+    @property
+    def cache_namespace(self):
+        # 合成结果与由哪个终结点返回无关：固定使用主终结点 (第一个，即界面/命令行中的主密钥和区域) 的命名空间，
+        # 与单终结点时一致。增删池中其他终结点不改变缓存键，已有缓存、语音目录和长篇导出日志仍然有效
+        return self.endpoints[0].backend.cache_namespace
+
+    def _acquire(self, chars, tried):
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e not in tried]
+            if not candidates: return None
+            healthy = [e for e in candidates if e.cooldown_until <= now]
+            if healthy:
+                endpoint = min(healthy, key=lambda e: e.score(now, chars))
+            else:
+                endpoint = min(candidates, key=lambda e: e.cooldown_until) # 全部在冷却：选最早恢复的
+            endpoint.in_flight += 1
+            endpoint.stats["requests"] += 1
+            endpoint._chars.append((now, chars))
+            return endpoint
+
+    def _release(self, endpoint, started, exc=None):
+        elapsed = time.monotonic() - started
+        with self._lock:
+            endpoint.in_flight -= 1
+            if exc is None:
+                endpoint.stats["succeeded"] += 1
+                endpoint.consecutive_failures = 0
+                endpoint.latency.observe(elapsed)
+                endpoint.latency_ewma = elapsed if endpoint.latency_ewma is None else \
+                    (1 - LATENCY_EWMA_ALPHA) * endpoint.latency_ewma + LATENCY_EWMA_ALPHA * elapsed
+                return None
+            kind = classify_endpoint_error(exc)
+            endpoint.stats["failed"] += 1
+            if kind is None: return None # 请求本身的问题 (例如 SSML 无效)，换终结点也没用
+            endpoint.consecutive_failures += 1
+            if kind == "auth":
+                endpoint.stats["auth_errors"] += 1
+                cooldown = self.auth_cooldown_sec
+            elif kind == "throttled":
+                endpoint.stats["throttled"] += 1
+                cooldown = self.throttle_cooldown_sec
+            else:
+                endpoint.stats["transient_errors"] += 1
+                cooldown = min(MAX_TRANSIENT_COOLDOWN_SEC, self.transient_cooldown_sec * 2 ** (endpoint.consecutive_failures - 1))
+            endpoint.cooldown_until = time.monotonic() + cooldown
+        print(f"Debug: 终结点 {endpoint.name} {kind} 错误，冷却 {cooldown:.0f} 秒: {str(exc).splitlines()[0] if str(exc) else type(exc).__name__}")
+        return kind
+
+    def _call(self, chars, request, can_failover=None):
+        # request(backend) 在选中的终结点上执行；可故障转移的错误依次换下一个终结点，全部失败时抛出最后一个错误
+        tried = set()
+        last_exc = None
+        while True:
+            endpoint = self._acquire(chars, tried)
+            if endpoint is None: raise last_exc
+            tried.add(endpoint)
+            started = time.monotonic()
+            try:
+                result = request(endpoint.backend)
+            except Exception as exc:
+                kind = self._release(endpoint, started, exc)
+                if kind is None or (can_failover is not None and not can_failover()): raise
+                last_exc = exc
+                continue
+            self._release(endpoint, started)
+            return result
+
+    def list_voices(self):
+        return self._call(0, lambda backend: backend.list_voices())
+
+    def synthesize(self, ssml, output_format_name=WAV_FORMAT_NAME, on_event=None, cancel_scope=None):
+        return self._call(len(ssml), lambda backend: backend.synthesize(ssml, output_format_name, on_event=on_event, cancel_scope=cancel_scope))
+
+    def synthesize_with_events(self, ssml, on_audio_chunk, on_event=None, cancel_scope=None):
+        # 已经送出音频后不再换终结点，否则同一段会重复
+        received = [0]
+        def counting_on_audio(data):
+            received[0] += len(data); on_audio_chunk(data)
+        return self._call(len(ssml), lambda backend: backend.synthesize_with_events(ssml, counting_on_audio, on_event=on_event, cancel_scope=cancel_scope),
+                          can_failover=lambda: received[0] == 0)
+
+    def prewarm(self, output_format_name, count=1):
+        with self._lock:
+            now = time.monotonic()
+            best = sorted((e for e in self.endpoints if e.cooldown_until <= now), key=lambda e: e.score(now, 0))[:max(1, count)]
+        return sum(endpoint.backend.prewarm(output_format_name, 1) for endpoint in best)
+
+    def close(self):
+        for endpoint in self.endpoints: endpoint.backend.close()
+
+    def endpoint_stats(self):
+        with self._lock:
+            now = time.monotonic()
+            result = []
+            for endpoint in self.endpoints:
+                latency = endpoint.latency.summary()
+                result.append(dict(endpoint.stats, name=endpoint.name, in_flight=endpoint.in_flight,
+                                   cooldown_sec=round(max(0.0, endpoint.cooldown_until - now), 1),
+                                   chars_last_minute=endpoint.chars_used(now), chars_per_minute=endpoint.chars_per_minute,
+                                   latency_p50_ms=round(latency["p50"] * 1000, 1) if latency["count"] else None,
+                                   latency_p90_ms=round(latency["p90"] * 1000, 1) if latency["count"] else None))
+            return result
+
+
+def endpoints_from_settings(endpoint_settings, subscription_key, service_region, pool=None):
+    # backend.endpoints: [{"key": "...", "region": "...", "weight": 1, "chars_per_minute": 0}, ...]
+    # 界面/命令行中的主密钥和区域总是第一个终结点；"type": "stub" 的条目用模拟后端，便于离线测试故障转移
+    entries = []
+    if subscription_key and service_region:
+        entries.append({"key": subscription_key, "region": service_region})
+    for entry in endpoint_settings or []:
+        if not isinstance(entry, dict): raise ValueError(f"无效的终结点配置: {entry}")
+        if any(e.get("key") == entry.get("key") and (e.get("region") or "").lower() == (entry.get("region") or "").lower()
+               and entry.get("type", BACKEND_AZURE) == BACKEND_AZURE for e in entries):
+            continue
+        entries.append(entry)
+    endpoints = []
+    for idx, entry in enumerate(entries):
+        endpoint_type = str(entry.get("type", BACKEND_AZURE)).strip().lower()
+        region = str(entry.get("region", "") or "").strip()
+        if endpoint_type == BACKEND_STUB:
+            from azure_tts_stub import stub_backend_from_settings
+            backend = stub_backend_from_settings(entry.get("stub"))
+        elif endpoint_type == BACKEND_AZURE:
+            if not entry.get("key") or not region: raise ValueError(f"终结点 #{idx + 1} 缺少 key 或 region。")
+            backend = AzureBackend(entry["key"], region, pool=pool)
+        else:
+            raise ValueError(f"未知的终结点类型: {endpoint_type}")
+        name = entry.get("name") or f"{region or endpoint_type}#{idx + 1}"
+        endpoints.append(Endpoint(name, backend, weight=float(entry.get("weight", 1.0)), chars_per_minute=int(entry.get("chars_per_minute", 0))))
+    return endpoints
@@ -0,0 +1,224 @@
+from collections import deque
+import itertools
+import threading
+import time
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+ACTIVE_JOB_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+DEFAULT_RECENT_JOBS = 20
+DEFAULT_SHUTDOWN_TIMEOUT_SEC = 5.0
+
+_job_ids = itertools.count(1)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class SynthesisJob:
+    # 一个合成/导出任务。cancel() 置位取消标志并调用所有已登记的取消回调
+    # (例如正在进行的合成器的 stop_speaking_async)，工作函数应在分段之间调用 check_cancelled()
+    def __init__(self, kind, key, fn, description=""):
+        self.id = next(_job_ids)
+        self.kind = kind
+        self.key = key
+        self.fn = fn
+        self.description = description
+        self.state = JOB_QUEUED
+        self.coalesced = 0 # 合并进来的重复提交次数
+        self.error = None
+        self.created_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._cancel_callbacks = {}
+        self._callback_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def check_cancelled(self):
+        if self._cancelled.is_set(): raise JobCancelled()
+
+    def on_cancel(self, callback):
+        # 登记取消回调，返回注销函数；任务已取消时立即调用
+        with self._lock:
+            if not self._cancelled.is_set():
+                callback_id = next(self._callback_ids)
+                self._cancel_callbacks[callback_id] = callback
+                return lambda: self._cancel_callbacks.pop(callback_id, None)
+        self._run_callback(callback)
+        return lambda: None
+
+    @staticmethod
+    def _run_callback(callback):
+        try: callback()
+        except Exception as e: print(f"Debug: 取消回调出错 (可忽略): {e}")
+
+    def cancel(self):
+        with self._lock:
+            if self._cancelled.is_set() or self.state not in ACTIVE_JOB_STATES: return False
+            self._cancelled.set()
+            callbacks = list(self._cancel_callbacks.values())
+            self._cancel_callbacks.clear()
+        for callback in callbacks: self._run_callback(callback)
+        return True
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        now = time.monotonic()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "description": self.description,
+            "coalesced": self.coalesced,
+            "cancel_requested": self.is_cancelled(),
+            "age_sec": round(now - self.created_at, 2),
+            "run_sec": round((self.finished_at or now) - self.started_at, 2) if self.started_at else None,
+            "error": self.error,
+        }
+
+
+class SynthesisExecutor:
+    # 单工作线程的任务执行器：任务按提交顺序逐个执行。
+    #   - 同一 key 的任务还在排队或执行 (且未取消) 时，重复提交直接合并到该任务 (single-flight)；
+    #   - supersede=True 时新任务会取消同一 kind 中尚未完成的旧任务，连续点击不会堆积无用的合成；
+    #   - 状态变化时调用 on_change()，界面据此显示当前任务。
+    def __init__(self, on_change=None, recent_limit=DEFAULT_RECENT_JOBS):
+        self.on_change = on_change
+        self._queue = deque()
+        self._jobs = {} # id -> 排队中或执行中的任务
+        self._current = None
+        self._recent = deque(maxlen=recent_limit)
+        self._cond = threading.Condition()
+        self._worker = None
+        self._closed = False
+        self._stats = {"submitted": 0, "coalesced": 0, "done": 0, "failed": 0, "cancelled": 0}
+
+    def _notify(self):
+        if self.on_change is None: return
+        try: self.on_change()
+        except Exception as e: print(f"Debug: 任务状态回调出错 (可忽略): {e}")
+
+    def submit(self, kind, fn, key=None, supersede=False, description=""):
+        # fn(job) 在工作线程中执行。返回 (任务, 是否合并到了已有任务)
+        superseded = []
+        with self._cond:
+            existing = next((job for job in self._jobs.values() if key is not None and job.key == key and not job.is_cancelled()), None)
+            if existing is not None:
+                existing.coalesced += 1
+                self._stats["coalesced"] += 1
+                print(f"Debug: 任务 #{existing.id} ({kind}) 已在进行，合并重复提交。")
+                return existing, True
+            if supersede: superseded = [job for job in self._jobs.values() if job.kind == kind]
+            job = SynthesisJob(kind, key, fn, description)
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._stats["submitted"] += 1
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="tts_executor", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+        for old in superseded:
+            if old.cancel(): print(f"Debug: 任务 #{old.id} ({old.kind}) 被新的任务 #{job.id} 取代，已取消。")
+        self._notify()
+        return job, False
+
+    def cancel(self, job_id):
+        with self._cond: job = self._jobs.get(job_id)
+        cancelled = job is not None and job.cancel()
+        if cancelled: self._notify()
+        return cancelled
+
+    def cancel_kind(self, kind):
+        with self._cond: jobs = [job for job in self._jobs.values() if job.kind == kind]
+        cancelled = [job for job in jobs if job.cancel()]
+        if cancelled: self._notify()
+        return len(cancelled)
+
+    def cancel_all(self):
+        with self._cond: jobs = list(self._jobs.values())
+        cancelled = [job for job in jobs if job.cancel()]
+        if cancelled: self._notify()
+        return len(cancelled)
+
+    def shutdown(self, timeout=DEFAULT_SHUTDOWN_TIMEOUT_SEC):
+        # 关闭程序前调用：取消所有任务 (进行中的请求通过 stop_speaking_async 中止)，等待工作线程退出。
+        # 返回工作线程是否已经结束；超时后工作线程 (守护线程) 随进程退出
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.cancel_all()
+        worker = self._worker
+        if worker is None or worker is threading.current_thread(): return True
+        worker.join(timeout)
+        return not worker.is_alive()
+
+    def _finish(self, job, state, error=None):
+        with self._cond:
+            job.state = state
+            job.error = error
+            job.finished_at = time.monotonic()
+            self._jobs.pop(job.id, None)
+            if self._current is job: self._current = None
+            self._stats[state] += 1
+            self._recent.appendleft(job.to_dict())
+        job._done.set()
+        self._notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed: self._cond.wait()
+                if not self._queue: return # 已关闭且没有剩余任务 (剩余的任务都已取消，下面直接结束)
+                job = self._queue.popleft()
+                if job.is_cancelled():
+                    skipped = True
+                else:
+                    skipped = False
+                    job.state = JOB_RUNNING
+                    job.started_at = time.monotonic()
+                    self._current = job
+            if skipped:
+                self._finish(job, JOB_CANCELLED); continue
+            self._notify()
+            try:
+                job.fn(job)
+            except JobCancelled:
+                self._finish(job, JOB_CANCELLED)
+            except Exception as e:
+                print(f"Debug: 任务 #{job.id} ({job.kind}) 出错: {e}")
+                self._finish(job, JOB_CANCELLED if job.is_cancelled() else JOB_FAILED, str(e).splitlines()[0][:200] if str(e) else type(e).__name__)
+            else:
+                self._finish(job, JOB_CANCELLED if job.is_cancelled() else JOB_DONE)
+
+    def current(self):
+        with self._cond: return self._current
+
+    def pending(self):
+        with self._cond: return [job for job in self._queue if not job.is_cancelled()]
+
+    def active_jobs(self, kind=None):
+        with self._cond: return [job for job in self._jobs.values() if kind is None or job.kind == kind]
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "current": self._current.to_dict() if self._current else None,
+                "queued": [job.to_dict() for job in self._queue],
+                "recent": list(self._recent),
+                "stats": dict(self._stats),
+            }
+
+    def stats(self):
+        with self._cond: return dict(self._stats, queued=len(self._queue), running=1 if self._current else 0)
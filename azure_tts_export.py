@@ -0,0 +1,51 @@
+from azure_tts_audio import MP3_FORMAT_NAME, WAV_FORMAT_NAME, Mp3EncodeError, WavFormatError, encode_wav_to_mp3, local_mp3_encoder_name, wav_duration_sec
+from azure_tts_cache import SynthesisCache
+
+EXPORT_SOURCE_CACHED_MP3 = "cached_mp3"
+EXPORT_SOURCE_LOCAL_ENCODE = "local_encode"
+EXPORT_SOURCE_SERVICE = "service"
+EXPORT_SOURCE_LABELS = {
+    EXPORT_SOURCE_CACHED_MP3: "复用缓存的 MP3",
+    EXPORT_SOURCE_LOCAL_ENCODE: "由已合成的音频本地编码",
+    EXPORT_SOURCE_SERVICE: "调用服务重新合成",
+}
+
+
+def _read_file(path):
+    with open(path, 'rb') as f: return f.read()
+
+
+def obtain_mp3_audio(cache, ssml, cache_namespace, synthesize_mp3, wav_path=None, wav_data=None):
+    # 按代价从低到高取得 MP3：缓存中的 MP3 -> 本地编码已合成的 PCM -> 调用服务。
+    # wav_data / wav_path 用于缓存不可用时传入刚播放过的同一段音频 (内存中或磁盘上)；返回 (mp3 字节, 来源)
+    mp3_key = SynthesisCache.make_key(ssml, MP3_FORMAT_NAME, cache_namespace)
+    if cache:
+        mp3_path = cache.get(mp3_key)
+        if mp3_path:
+            try: return _read_file(mp3_path), EXPORT_SOURCE_CACHED_MP3
+            except OSError as e: print(f"警告: 读取缓存的 MP3 失败，将重新生成。错误: {e}")
+
+    mp3_bytes = None
+    source = EXPORT_SOURCE_SERVICE
+    duration_sec = 0
+    if local_mp3_encoder_name():
+        pcm_path = None
+        if wav_data is None:
+            pcm_path = cache.get(SynthesisCache.make_key(ssml, WAV_FORMAT_NAME, cache_namespace)) if cache else None
+            pcm_path = pcm_path or wav_path
+        if wav_data is not None or pcm_path:
+            try:
+                if wav_data is None: wav_data = _read_file(pcm_path)
+                mp3_bytes = encode_wav_to_mp3(wav_data)
+                duration_sec = wav_duration_sec(wav_data)
+                source = EXPORT_SOURCE_LOCAL_ENCODE
+            except (Mp3EncodeError, WavFormatError, OSError) as e:
+                print(f"警告: 本地 MP3 编码失败，将调用服务合成。错误: {e}")
+                mp3_bytes = None
+    if mp3_bytes is None:
+        mp3_bytes = synthesize_mp3()
+
+    if cache:
+        try: cache.put_bytes(mp3_key, mp3_bytes, duration_sec=duration_sec, ext=".mp3")
+        except OSError as e: print(f"警告: 无法将 MP3 写入缓存。错误: {e}")
+    return mp3_bytes, source
@@ -1,20 +1,39 @@
-import shutil
 import tkinter as tk
 from tkinter import scrolledtext, messagebox, ttk, simpledialog, filedialog
-import azure.cognitiveservices.speech as speechsdk
 import threading
-import xml.sax.saxutils
 import json
 import os
+import io
 import time
 import tempfile
-import pygame
-
-CONFIG_FILE_NAME = "azure_tts_settings.json"
+_STARTUP_T0 = time.perf_counter()
+from azure_tts_audio import MP3_FORMAT_NAME, RAW_PCM_FORMAT_NAME, WAV_FORMAT_NAME, WavFormatError, build_wav_bytes, parse_wav, wav_duration_sec
+from azure_tts_backend import BACKEND_AZURE, BackendProvider
+from azure_tts_cache import ORPHAN_MIN_AGE_SEC, SynthesisCache
+from azure_tts_config import CONFIG_FILE_NAME
+from azure_tts_executor import JobCancelled, SynthesisExecutor
+from azure_tts_export import EXPORT_SOURCE_LABELS, EXPORT_SOURCE_SERVICE, obtain_mp3_audio
+from azure_tts_incremental import synthesize_sentences_incremental, uncached_sentences
+from azure_tts_longform import DEFAULT_LONGFORM_MIN_CHARS, DEFAULT_LONGFORM_SEGMENT_CHARS, export_longform, plan_longform
+from azure_tts_metrics import DEFAULT_METRICS_WINDOW_SEC, MARK_FILE_WRITTEN, MARK_PLAYBACK_STARTED, STAGE_NAMES, MetricsRegistry, StartupTimer
+from azure_tts_pool import SynthesizerPool
+from azure_tts_prefetch import (DEFAULT_PREFETCH_BUDGET_CHARS_PER_HOUR, DEFAULT_PREFETCH_DEBOUNCE_SEC, DEFAULT_PREFETCH_MAX_CHARS, PrefetchCancelled,
+                                Prefetcher)
+from azure_tts_scheduler import DEFAULT_CHARS_PER_MINUTE, DEFAULT_MAX_CONCURRENCY, DEFAULT_MAX_RETRIES, DEFAULT_REQUESTS_PER_SEC, scheduler_from_settings
+from azure_tts_voices import VOICE_CATALOG_FILE_NAME, DEFAULT_VOICE_CATALOG_TTL_SEC, VoiceCatalog, VoiceIndex, diff_voice_records
+from azure_tts_playback import (DEFAULT_PREBUFFER_SEC, PcmBufferPlayer, StreamingPcmPlayer, init_pcm_mixer, load_pygame,
+                                mixer_matches_pcm_format, music_end_event, progress_interval_ms)
+from azure_tts_ssml import DEFAULT_CHUNK_MAX_CHARS, build_ssml, split_text_into_chunk_spans, split_text_into_chunks, split_text_into_sentences
+from azure_tts_synthesis import DEFAULT_SYNTHESIS_WORKERS, SynthesisError, synthesize_chunks_streaming, synthesize_text_chunks_to_wav
+from azure_tts_uiqueue import UiUpdateQueue
+
+pygame = None # 第一次需要播放音频时由 _ensure_audio() 导入
 
 class TextToSpeechApp:
     def __init__(self, master):
         self.master = master
+        self.startup_timer = StartupTimer(_STARTUP_T0)
+        self.startup_timer.mark("imports")
         master.title("Azure 文本转语音 (v4.8.5 - 启动提示)") # 版本号和标题更新
         master.geometry("650x880")
 
@@ -29,32 +48,55 @@ class TextToSpeechApp:
 
         self.script_dir = os.path.dirname(os.path.abspath(__file__))
         self.cache_dir_path = os.path.join(self.script_dir, "azure_tts_cache")
+        self.synthesis_cache = None
+        self.synthesis_settings = {"chunk_max_chars": DEFAULT_CHUNK_MAX_CHARS, "max_workers": DEFAULT_SYNTHESIS_WORKERS, "incremental": False,
+                                   "longform_min_chars": DEFAULT_LONGFORM_MIN_CHARS, "longform_segment_chars": DEFAULT_LONGFORM_SEGMENT_CHARS}
         self._initialize_cache_directory()
+        self.startup_timer.mark("cache_index")
 
-        try:
-            pygame.init()
-            pygame.mixer.init()
-            self.pygame_initialized = True
-        except Exception as e:
-            self.pygame_initialized = False
-            messagebox.showerror("Pygame 初始化失败", f"Pygame mixer 初始化失败: {e}\n播放功能将受限或不可用。", parent=master)
-            print(f"Pygame init error: {e}")
+        # 音频在第一次播放时才初始化 (见 _ensure_audio)；mixer 以合成 PCM 的格式打开，通常都支持流式播放
+        self.pygame_initialized = False
+        self.audio_init_error = None
+        self.streaming_supported = True
 
         self.config_file_path = os.path.join(self.script_dir, CONFIG_FILE_NAME)
+        self.voice_catalog = VoiceCatalog(os.path.join(self.script_dir, VOICE_CATALOG_FILE_NAME))
+        self.voice_fetch_in_progress = False
 
         # Playback State & Cache
         self.playback_state = "idle"
         self.synthesized_audio_filepath = None
+        self.synthesized_audio_bytes = None # 内存播放模式下的完整 WAV，不经过临时文件
+        self.in_memory_playback = True
         self.total_audio_duration_sec = 0
         self.progress_updater_id = None
         self.is_user_seeking = False
         self.last_synthesis_params = {} # For caching
         self.playback_marker_sec = 0
         self.playback_start_time_monotonic = None
+        self._shown_progress = (None, None) # 上次显示的 (进度条像素, 时间标签)，未变化时不重绘
         self._text_modified_flag = False # To detect text area changes for cache
+        self.stream_player = None # 边合成边播放时使用的 StreamingPcmPlayer
+        self.buffer_player = None # 完整音频的 PcmBufferPlayer，按采样定位；mixer 格式不匹配时为 None，退回 pygame.mixer.music
+        self.synthesis_in_progress = False
+        self.streaming_prebuffer_sec = DEFAULT_PREBUFFER_SEC
+        self.synthesizer_pool = SynthesizerPool() # 复用合成器及其连接，避免每次请求重新握手
+        self.backend_provider = BackendProvider(pool=self.synthesizer_pool) # Azure 或本地模拟后端，由配置中的 "backend" 组决定
+        self.request_scheduler = scheduler_from_settings(None, on_retry=self._on_request_retry) # 所有合成请求统一限速、退避重试
+        self.metrics = MetricsRegistry(log_requests=True) # 每次合成的分阶段耗时 (排队、连接、首包、末包、写文件、开始播放)
+        self.playback_timeline = None # 等待“开始播放”标记的时间线
+        self.diagnostics_window = None
+        self.diagnostics_refresh_id = None
+        self.ui_queue = UiUpdateQueue() # 工作线程的界面更新都经由此队列，在 Tk 主线程中合并后执行
+        self.prefetcher = Prefetcher() # 编辑停顿后在后台把当前文本预先合成进缓存
+        self.prefetch_debounce_sec = DEFAULT_PREFETCH_DEBOUNCE_SEC
+        self.prefetch_after_id = None
+        # 播放合成和 MP3 导出都交给单线程执行器：新的播放请求取代旧的，相同请求合并为一次合成
+        self.synthesis_executor = SynthesisExecutor(on_change=lambda: self.ui_queue.post(self._on_jobs_changed, key="jobs"))
 
         # App state variables
         self.all_voices_in_region = []
+        self.voice_index = VoiceIndex([])
         self.loaded_voices_credentials = {"key": None, "region": None}
         self.current_language_voice_infos = {}
         self.voice_profiles_data = {}
@@ -79,7 +121,7 @@ class TextToSpeechApp:
         self.save_credentials_button = ttk.Button(self.azure_buttons_frame, text="保存凭据", command=self.save_credentials)
         self.save_credentials_button.pack(side="left", padx=(0, 5)) # 左0右5间距
 
-        self.load_voices_button = ttk.Button(self.azure_buttons_frame, text="加载/刷新语音列表", command=self.load_voices_from_azure)
+        self.load_voices_button = ttk.Button(self.azure_buttons_frame, text="加载/刷新语音列表", command=lambda: self.load_voices_from_azure(manual=True))
         self.load_voices_button.pack(side="left", padx=(0, 5)) # 左0右5间距
 
         # --- 新增：醒目的提示标签 ---
@@ -96,7 +138,7 @@ class TextToSpeechApp:
         self.voice_config_frame.pack(padx=10, pady=5, fill="x")
         ttk.Label(self.voice_config_frame, text="选择语言:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
         self.language_var = tk.StringVar(); self.language_var.trace_add("write", self._on_voice_params_changed_for_cache)
-        self.language_combo = ttk.Combobox(self.voice_config_frame, textvariable=self.language_var, values=["zh-CN", "en-US", "ja-JP", "ko-KR", "fr-FR", "de-DE", "es-ES"], state="disabled", exportselection=False, width=30)
+        self.language_combo = ttk.Combobox(self.voice_config_frame, textvariable=self.language_var, values=[], state="disabled", exportselection=False, width=30)
         self.language_combo.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
         self.language_combo.bind("<<ComboboxSelected>>", self.on_language_selected)
 
@@ -138,6 +180,22 @@ class TextToSpeechApp:
         self.rate_display_label = ttk.Label(self.rate_slider_frame, textvariable=self.rate_display_var, width=7, anchor="e")
         self.rate_display_label.pack(side="left", padx=(5,0))
 
+        # --- 新增：语音筛选 (按名称/风格/角色关键字和性别) ---
+        ttk.Label(self.voice_config_frame, text="筛选语音:").grid(row=5, column=0, padx=5, pady=5, sticky="w")
+        self.voice_filter_frame = ttk.Frame(self.voice_config_frame)
+        self.voice_filter_frame.grid(row=5, column=1, padx=5, pady=5, sticky="ew")
+        self.voice_filter_var = tk.StringVar()
+        self.voice_filter_entry = ttk.Entry(self.voice_filter_frame, textvariable=self.voice_filter_var, width=20)
+        self.voice_filter_entry.pack(side="left", fill="x", expand=True)
+        self.voice_filter_entry.bind("<KeyRelease>", self._on_voice_filter_changed)
+        self.voice_gender_filter_var = tk.StringVar(value="(全部)")
+        self.voice_gender_filter_combo = ttk.Combobox(self.voice_filter_frame, textvariable=self.voice_gender_filter_var, values=["(全部)"], state="readonly", exportselection=False, width=9)
+        self.voice_gender_filter_combo.pack(side="left", padx=(5, 0))
+        self.voice_gender_filter_combo.bind("<<ComboboxSelected>>", self._on_voice_filter_changed)
+        self.voice_filter_count_var = tk.StringVar(value="")
+        ttk.Label(self.voice_filter_frame, textvariable=self.voice_filter_count_var, width=9, anchor="e").pack(side="left", padx=(5, 0))
+        # --- 结束新增 ---
+
         self.profile_management_frame = ttk.LabelFrame(master, text="语音配置文件")
         self.profile_management_frame.pack(padx=10, pady=10, fill="x")
         ttk.Label(self.profile_management_frame, text="选择配置:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
@@ -174,30 +232,102 @@ class TextToSpeechApp:
         self.main_button_frame.pack(padx=10, pady=10, fill="x", anchor="s")
         self.save_mp3_button = ttk.Button(self.main_button_frame, text="保存为 MP3", command=self.save_text_to_mp3_thread, state="disabled")
         self.save_mp3_button.pack(side="left", padx=5, pady=5)
+        self.streaming_playback_var = tk.BooleanVar(value=True)
+        self.streaming_playback_check = ttk.Checkbutton(self.main_button_frame, text="边合成边播放", variable=self.streaming_playback_var, command=self._on_streaming_option_toggled)
+        self.streaming_playback_check.pack(side="left", padx=5, pady=5)
+        self.prefetch_var = tk.BooleanVar(value=False)
+        self.prefetch_check = ttk.Checkbutton(self.main_button_frame, text="后台预合成", variable=self.prefetch_var, command=self._on_prefetch_option_toggled)
+        self.prefetch_check.pack(side="left", padx=5, pady=5)
+        self.diagnostics_button = ttk.Button(self.main_button_frame, text="诊断", command=self._open_diagnostics_panel)
+        self.diagnostics_button.pack(side="left", padx=5, pady=5)
         self.status_label = ttk.Label(self.main_button_frame, text="状态: 请先加载语音列表或配置文件")
         self.status_label.pack(side="left", padx=5, pady=5)
+        self.jobs_var = tk.StringVar(value="")
+        self.jobs_label = ttk.Label(self.main_button_frame, textvariable=self.jobs_var, style="Hint.TLabel")
+        self.jobs_label.pack(side="right", padx=5, pady=5)
 
         self.azure_config_frame.columnconfigure(1, weight=1)
         self.voice_config_frame.columnconfigure(1, weight=1)
         self.voice_config_frame.grid_rowconfigure(4, pad=5) 
         self.profile_management_frame.columnconfigure(1, weight=1)
 
-        self.load_app_config()
         master.protocol("WM_DELETE_WINDOW", self._on_closing)
+        self.startup_timer.mark("ui")
+        self.ui_queue.attach(self.master)
+        # 先让窗口画出来，再读取配置和语音目录
+        self.master.after_idle(lambda: self.master.after(0, self._finish_startup))
+        self.pool_pruner_id = self.master.after(60000, self._prune_synthesizer_pool)
+
+    def _finish_startup(self):
+        self.startup_timer.mark("first_paint")
+        self.load_app_config()
+        self.startup_timer.mark("config")
+        self._load_voice_catalog_from_disk()
+        self.startup_timer.mark("voice_catalog")
+        print(f"Debug: 启动耗时: {self.startup_timer.summary_text()}")
+
+    def _ensure_audio(self):
+        # 只初始化 pygame 的 mixer，且推迟到第一次需要播放时
+        global pygame
+        if self.pygame_initialized: return True
+        if self.audio_init_error is not None: return False
+        started = time.perf_counter()
+        try:
+            pygame = load_pygame()
+            init_pcm_mixer()
+            pygame.mixer.init()
+            pygame.mixer.music.set_endevent(music_end_event())
+            self.pygame_initialized = True
+            self.streaming_supported = mixer_matches_pcm_format()
+            if not self.streaming_supported:
+                print(f"Debug: mixer 格式 {pygame.mixer.get_init()} 与合成 PCM 不一致，流式播放不可用。")
+                self.streaming_playback_check.config(state=tk.DISABLED)
+            print(f"Debug: 音频初始化耗时 {(time.perf_counter() - started) * 1000:.0f}ms")
+        except Exception as e:
+            self.audio_init_error = str(e)
+            self.streaming_supported = False
+            self.streaming_playback_check.config(state=tk.DISABLED)
+            messagebox.showerror("Pygame 初始化失败", f"Pygame mixer 初始化失败: {e}\n播放功能将受限或不可用。", parent=self.master)
+            print(f"Pygame init error: {e}")
+        return self.pygame_initialized
+
+    def _prune_synthesizer_pool(self):
+        dropped = self.synthesizer_pool.prune_idle()
+        if dropped: print(f"Debug: 已关闭 {dropped} 个空闲合成器连接。")
+        self.pool_pruner_id = self.master.after(60000, self._prune_synthesizer_pool)
+
+    def _get_backend(self, subscription_key=None, service_region=None):
+        # 工作线程必须显式传入凭据，只有主线程可以读取输入框
+        if subscription_key is None: subscription_key = self.subscription_key_entry.get()
+        if service_region is None: service_region = self.service_region_entry.get()
+        return self.backend_provider.get(subscription_key, service_region)
+
+    def _get_playback_output_format(self):
+        if self.streaming_supported and bool(self.streaming_playback_var.get()):
+            return RAW_PCM_FORMAT_NAME
+        return WAV_FORMAT_NAME
+
+    def _prewarm_synthesizers(self):
+        # 选定语音后在后台预先打开连接，首次播放即可跳过连接建立和 TLS 握手
+        s_key = self.subscription_key_entry.get(); s_reg = self.service_region_entry.get()
+        if not s_key or not s_reg: return
+        output_format = self._get_playback_output_format()
+        count = max(1, min(2, self.synthesis_settings["max_workers"]))
+        backend = self._get_backend(s_key, s_reg)
+        def warm():
+            try:
+                opened = backend.prewarm(output_format, count=count)
+                if opened: print(f"Debug: 已预热 {opened} 个合成器连接 ({s_reg})。")
+            except Exception as e:
+                print(f"Debug: 预热合成器失败 (可忽略): {e}")
+        threading.Thread(target=warm, daemon=True).start()
 
     def _initialize_cache_directory(self):
         print(f"Debug: 正在初始化缓存目录: {self.cache_dir_path}")
         try:
-            if os.path.exists(self.cache_dir_path):
-                print(f"Debug: 尝试删除已存在的缓存目录: {self.cache_dir_path}")
-                shutil.rmtree(self.cache_dir_path) 
-                print(f"Debug: 成功删除已存在的缓存目录。")
-        except Exception as e:
-            print(f"警告: 未能移除已存在的缓存目录 '{self.cache_dir_path}'。错误: {e}")
-            print(f"警告: 将继续尝试创建/使用目录。如果移除失败，旧文件可能残留。")
-        try:
-            os.makedirs(self.cache_dir_path, exist_ok=True) 
-            print(f"Debug: 缓存目录已确保存在于: {self.cache_dir_path}")
+            self.synthesis_cache = SynthesisCache(self.cache_dir_path)
+            # 缓存跨会话保留：清理索引之外的残留文件、过期/容量淘汰放到后台，不阻塞窗口显示
+            threading.Thread(target=self._cache_housekeeping, args=(self.synthesis_cache,), daemon=True).start()
         except Exception as e:
             messagebox.showerror(
                 "关键错误",
@@ -208,6 +338,16 @@ class TextToSpeechApp:
             print(f"严重错误: 未能创建缓存目录 {self.cache_dir_path}。语音合成功能将失败。")
 
 
+    def _cache_housekeeping(self, cache):
+        try:
+            # 最近修改的文件可能是正在写入的新条目，不当作残留文件
+            orphans_removed = cache.cleanup_orphans(min_age_sec=ORPHAN_MIN_AGE_SEC)
+            cache.evict()
+            stats = cache.stats()
+            print(f"Debug: 缓存目录已就绪: {self.cache_dir_path} (条目 {stats['entries']}, 残留文件清理 {orphans_removed} 个)")
+        except OSError as e:
+            print(f"警告: 缓存整理失败 (可忽略)。错误: {e}")
+
     def _on_rate_var_changed_for_cache_and_display(self, *args):
         try:
             rate_val = self.rate_var.get()
@@ -217,10 +357,153 @@ class TextToSpeechApp:
         self._on_voice_params_changed_for_cache(*args)
 
     def _on_text_area_modified_flag(self, event=None):
+        # <<Modified>> 只在标志从 False 变为 True 时触发：处理后复位，才能收到后续的每次编辑
+        if not self.text_area.edit_modified(): return
+        self.text_area.edit_modified(False)
         self.text_modified_flag = True
+        self._schedule_prefetch()
 
     def _on_voice_params_changed_for_cache(self, *args):
-        pass
+        self._schedule_prefetch()
+
+    def _cancel_pending_prefetch(self):
+        if self.prefetch_after_id: self.master.after_cancel(self.prefetch_after_id); self.prefetch_after_id = None
+
+    def _schedule_prefetch(self):
+        # 每次编辑都让进行中的预合成作废，并在输入停止变化 debounce 时长后重新开始
+        self._cancel_pending_prefetch()
+        self.prefetcher.cancel()
+        if not self.prefetch_var.get(): return
+        self.prefetch_after_id = self.master.after(int(self.prefetch_debounce_sec * 1000), self._start_prefetch)
+
+    def _start_prefetch(self):
+        self.prefetch_after_id = None
+        if not self.prefetch_var.get() or not self.synthesis_cache or self.synthesis_in_progress: return
+        inputs = self._get_common_synthesis_inputs(for_playback=True)
+        if not inputs: return
+        current_params = self._get_current_synthesis_params()
+        cache_key = self._get_cache_key_for_params(current_params)
+        if self.synthesis_cache.contains(cache_key): return
+        s_key, s_reg, txt_raw, lang, voice = inputs
+        paragraph, paragraph_start, paragraph_end = self._get_prefetch_paragraph()
+        if not paragraph: return
+        role, style_val, rate_val = current_params["role"], current_params["style"], current_params["rate"]
+        if self.synthesis_settings["incremental"]:
+            self._start_sentence_prefetch(cache_key, s_key, s_reg, paragraph, lang, voice, role, style_val, rate_val)
+            return
+        # 只预合成光标所在段落：取与播放时相同的切分中和该段落位置重叠的分段，每段以自己的 SSML 为键写入缓存，
+        # 播放时逐段查找 (见 _cached_chunk_wav)。全文只有一段时，该段的键就是整段音频的键
+        backend = self._get_backend(s_key, s_reg)
+        chunk_ssml_list, chars = [], 0
+        for chunk, chunk_start, chunk_end in split_text_into_chunk_spans(txt_raw, self.synthesis_settings["chunk_max_chars"]):
+            if chunk_end <= paragraph_start or chunk_start >= paragraph_end: continue
+            chunk_ssml = self._build_ssml(chunk, lang, voice, role, style_val, rate_val)
+            if self.synthesis_cache.contains(SynthesisCache.make_key(chunk_ssml, WAV_FORMAT_NAME, backend.cache_namespace)): continue
+            if chunk_ssml_list and chars + len(chunk) > self.prefetcher.max_chars: break
+            chunk_ssml_list.append(chunk_ssml); chars += len(chunk)
+        if not chunk_ssml_list: return
+        max_workers = self.synthesis_settings["max_workers"]
+        cache = self.synthesis_cache
+
+        def run(is_cancelled, cancel_scope):
+            timeline = self.metrics.new_timeline("prefetch", chars=chars, chunks=len(chunk_ssml_list))
+            def synthesize_chunk(chunk_ssml):
+                if is_cancelled(): raise PrefetchCancelled()
+                wav_bytes = self.request_scheduler.call(
+                    lambda: backend.synthesize(chunk_ssml, WAV_FORMAT_NAME, on_event=timeline.on_synthesis_event, cancel_scope=cancel_scope),
+                    chars=len(chunk_ssml), can_retry=lambda exc: not is_cancelled(), on_dispatch=timeline.on_dispatch)
+                # 已完成的分段按内容寻址，即使预合成随后作废也照样写入缓存
+                cache.put_bytes(SynthesisCache.make_key(chunk_ssml, WAV_FORMAT_NAME, backend.cache_namespace), wav_bytes,
+                                duration_sec=wav_duration_sec(wav_bytes))
+                return wav_bytes
+            try:
+                synthesize_text_chunks_to_wav(chunk_ssml_list, synthesize_chunk, max_workers=max_workers)
+                timeline.mark(MARK_FILE_WRITTEN)
+                timeline.finish("ok")
+            except PrefetchCancelled:
+                timeline.finish("cancelled"); raise
+            except Exception as e:
+                timeline.finish("cancelled" if is_cancelled() else "error", e); raise
+
+        if self.prefetcher.submit(cache_key, chars, run):
+            print(f"Debug: 开始后台预合成光标所在段落 ({chars} 字符，{len(chunk_ssml_list)} 段)")
+
+    def _get_prefetch_paragraph(self):
+        # 光标所在的段落 (一行)，返回 (段落, 起始, 结束)，偏移相对于去掉首尾空白后的全文 (即播放时切分的文本)；
+        # 光标在空行上时取上面最近的非空行，即刚写完的段落
+        full_text = self.text_area.get("1.0", tk.END)
+        lead = len(full_text) - len(full_text.lstrip())
+        lines = full_text.split("\n")
+        line_starts = [0]
+        for line_text in lines[:-1]: line_starts.append(line_starts[-1] + len(line_text) + 1)
+        line = min(int(self.text_area.index(tk.INSERT).split(".")[0]), len(lines)) - 1
+        while line >= 0:
+            paragraph = lines[line].strip()
+            if paragraph:
+                start = line_starts[line] + len(lines[line]) - len(lines[line].lstrip()) - lead
+                return paragraph, start, start + len(paragraph)
+            line -= 1
+        return "", 0, 0
+
+    def _start_sentence_prefetch(self, cache_key, s_key, s_reg, paragraph, lang, voice, role, style_val, rate_val):
+        # 逐句模式：只预合成光标所在段落中缓存还没有的句子，字符上限和预算也只按这些句子计算。
+        # 作废时已经合成好的句子照样留在缓存里，改回来或只改了别处时仍然可以复用
+        backend = self._get_backend(s_key, s_reg)
+        sentences = self._build_sentence_ssml_list(paragraph, lang, voice, role, style_val, rate_val)
+        missing = uncached_sentences(self.synthesis_cache, sentences, backend.cache_namespace)
+        if not missing: return
+        chars = sum(len(text) for text, _ in missing)
+        max_workers = self.synthesis_settings["max_workers"]
+        cache = self.synthesis_cache
+
+        def run(is_cancelled, cancel_scope):
+            timeline = self.metrics.new_timeline("prefetch", chars=chars, chunks=len(missing))
+            def synthesize_sentence(sentence_ssml, on_audio):
+                if is_cancelled(): raise PrefetchCancelled()
+                return self.request_scheduler.call(
+                    lambda: backend.synthesize(sentence_ssml, RAW_PCM_FORMAT_NAME, on_event=timeline.on_synthesis_event, cancel_scope=cancel_scope),
+                    chars=len(sentence_ssml), can_retry=lambda exc: not is_cancelled(), on_dispatch=timeline.on_dispatch)
+            try:
+                synthesize_sentences_incremental(missing, cache, backend.cache_namespace, synthesize_sentence, max_workers=max_workers)
+                timeline.mark(MARK_FILE_WRITTEN)
+                timeline.finish("ok")
+            except PrefetchCancelled:
+                timeline.finish("cancelled"); raise
+            except Exception as e:
+                timeline.finish("cancelled" if is_cancelled() else "error", e); raise
+
+        if self.prefetcher.submit(cache_key, chars, run):
+            print(f"Debug: 开始后台预合成 ({len(missing)}/{len(sentences)} 句需要合成，{chars} 字符)")
+
+    def _wait_for_prefetch_then_play(self, cache_key):
+        self.prefetcher.wait_for(cache_key)
+        self.ui_queue.post(self._resume_play_after_prefetch)
+
+    def _resume_play_after_prefetch(self):
+        # 预合成成功时这次点击会命中缓存，失败时会正常合成
+        self.synthesis_in_progress = False
+        self.playback_state = "idle"
+        self._on_play_pause_button_click()
+
+    def _on_prefetch_option_toggled(self):
+        self.save_app_config()
+        if self.prefetch_var.get():
+            self._update_status("已开启后台预合成：停止编辑后会自动合成当前文本。")
+            self._schedule_prefetch()
+        else:
+            self._cancel_pending_prefetch()
+            self.prefetcher.cancel()
+            self._update_status("已关闭后台预合成。")
+
+    def _apply_prefetch_settings(self, prefetch_settings):
+        if not isinstance(prefetch_settings, dict): return
+        try:
+            self.prefetch_debounce_sec = max(0.2, float(prefetch_settings.get("debounce_ms", DEFAULT_PREFETCH_DEBOUNCE_SEC * 1000)) / 1000)
+            self.prefetcher.configure(max_chars=int(prefetch_settings.get("max_chars", DEFAULT_PREFETCH_MAX_CHARS)),
+                                      budget_chars_per_hour=int(prefetch_settings.get("budget_chars_per_hour", DEFAULT_PREFETCH_BUDGET_CHARS_PER_HOUR)))
+            self.prefetch_var.set(bool(prefetch_settings.get("enabled", False)))
+        except (TypeError, ValueError) as e:
+            print(f"警告: 无效的预合成配置 {prefetch_settings}，将使用默认值。错误: {e}")
 
     def _get_current_synthesis_params(self):
         return {
@@ -235,15 +518,203 @@ class TextToSpeechApp:
         }
 
     def _update_status(self, message):
+        # 可在任意线程调用：工作线程的状态消息进入界面更新队列，同一轮刷新中只显示最新的一条。
+        # 不再强制 update_idletasks，重绘交给 Tk 主循环
+        if threading.current_thread() is not threading.main_thread():
+            self.ui_queue.post(self._update_status, message, key="status"); return
         if hasattr(self, 'status_label') and self.status_label and self.status_label.winfo_exists():
             self.status_label.config(text=f"状态: {message}")
-            self.master.update_idletasks()
 
     def _get_default_config(self):
-        return {"azure_credentials": {"subscription_key": "", "service_region": ""}, "voice_profiles": {}}
+        return {"azure_credentials": {"subscription_key": "", "service_region": ""}, "voice_profiles": {},
+                "synthesis_cache": {"max_size_mb": 512, "max_age_days": 30},
+                "synthesis": {"chunk_max_chars": DEFAULT_CHUNK_MAX_CHARS, "max_workers": DEFAULT_SYNTHESIS_WORKERS, "incremental": False,
+                              "longform_min_chars": DEFAULT_LONGFORM_MIN_CHARS, "longform_segment_chars": DEFAULT_LONGFORM_SEGMENT_CHARS},
+                "playback": {"streaming": True, "prebuffer_ms": int(DEFAULT_PREBUFFER_SEC * 1000), "in_memory": True},
+                "voice_catalog": {"ttl_hours": DEFAULT_VOICE_CATALOG_TTL_SEC / 3600},
+                "backend": {"type": BACKEND_AZURE},
+                "prefetch": {"enabled": False, "debounce_ms": int(DEFAULT_PREFETCH_DEBOUNCE_SEC * 1000), "max_chars": DEFAULT_PREFETCH_MAX_CHARS,
+                             "budget_chars_per_hour": DEFAULT_PREFETCH_BUDGET_CHARS_PER_HOUR},
+                "diagnostics": {"window_minutes": DEFAULT_METRICS_WINDOW_SEC / 60, "jsonl_path": "", "prometheus_path": ""},
+                "scheduler": {"requests_per_sec": DEFAULT_REQUESTS_PER_SEC, "chars_per_minute": DEFAULT_CHARS_PER_MINUTE,
+                              "max_concurrency": DEFAULT_MAX_CONCURRENCY, "max_retries": DEFAULT_MAX_RETRIES}}
+
+    def _apply_diagnostics_settings(self, diagnostics_settings):
+        if not isinstance(diagnostics_settings, dict): return
+        # 相对路径以脚本目录为基准；留空表示不导出
+        def resolve(path): return os.path.join(self.script_dir, path) if path and not os.path.isabs(path) else (path or None)
+        try:
+            self.metrics.configure(
+                window_sec=max(1.0, float(diagnostics_settings.get("window_minutes", DEFAULT_METRICS_WINDOW_SEC / 60))) * 60,
+                jsonl_path=resolve(diagnostics_settings.get("jsonl_path", "")),
+                prometheus_path=resolve(diagnostics_settings.get("prometheus_path", "")))
+        except (TypeError, ValueError) as e:
+            print(f"警告: 无效的诊断配置 {diagnostics_settings}，将使用默认值。错误: {e}")
+
+    def _apply_backend_settings(self, backend_settings):
+        if not isinstance(backend_settings, dict): return
+        self.backend_provider.configure(backend_settings)
+        if self.backend_provider.is_stub:
+            print("Debug: 使用本地模拟合成后端 (不会访问 Azure)。")
+
+    def _apply_scheduler_settings(self, scheduler_settings):
+        if not isinstance(scheduler_settings, dict): return
+        try:
+            self.request_scheduler = scheduler_from_settings(scheduler_settings, on_retry=self._on_request_retry)
+        except (TypeError, ValueError) as e:
+            print(f"警告: 无效的请求调度配置 {scheduler_settings}，将使用默认值。错误: {e}")
+
+    def _open_diagnostics_panel(self):
+        if self.diagnostics_window is not None and self.diagnostics_window.winfo_exists():
+            self.diagnostics_window.lift(); return
+        window = tk.Toplevel(self.master)
+        window.title("诊断 - 合成延迟")
+        window.geometry("760x480")
+        window.protocol("WM_DELETE_WINDOW", self._close_diagnostics_panel)
+        self.diagnostics_window = window
+
+        stage_frame = ttk.LabelFrame(window, text="分阶段耗时 (毫秒，滚动窗口)")
+        stage_frame.pack(padx=10, pady=5, fill="both", expand=True)
+        stage_columns = ("kind", "stage", "count", "p50", "p90", "p99", "max")
+        self.diagnostics_stage_tree = ttk.Treeview(stage_frame, columns=stage_columns, show="headings", height=8)
+        for col, title, width in zip(stage_columns, ("类型", "阶段", "次数", "P50", "P90", "P99", "最大"), (80, 120, 60, 80, 80, 80, 80)):
+            self.diagnostics_stage_tree.heading(col, text=title)
+            self.diagnostics_stage_tree.column(col, width=width, anchor="e" if col not in ("kind", "stage") else "w")
+        self.diagnostics_stage_tree.pack(padx=5, pady=5, fill="both", expand=True)
+
+        recent_frame = ttk.LabelFrame(window, text="最近的请求")
+        recent_frame.pack(padx=10, pady=5, fill="both", expand=True)
+        recent_columns = ("time", "kind", "chars", "outcome", "queue_wait", "first_audio", "playback_start", "total")
+        self.diagnostics_recent_tree = ttk.Treeview(recent_frame, columns=recent_columns, show="headings", height=8)
+        for col, title, width in zip(recent_columns, ("时间", "类型", "字符", "结果", "排队", "首包", "开始播放", "总计"), (80, 70, 60, 70, 80, 80, 80, 80)):
+            self.diagnostics_recent_tree.heading(col, text=title)
+            self.diagnostics_recent_tree.column(col, width=width, anchor="e" if col in ("chars", "queue_wait", "first_audio", "playback_start", "total") else "w")
+        self.diagnostics_recent_tree.pack(padx=5, pady=5, fill="both", expand=True)
+
+        button_frame = ttk.Frame(window)
+        button_frame.pack(padx=10, pady=5, fill="x")
+        ttk.Button(button_frame, text="导出...", command=self._export_diagnostics).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="清空", command=lambda: [self.metrics.clear(), self._refresh_diagnostics_panel(reschedule=False)]).pack(side="left", padx=5)
+        self.diagnostics_summary_var = tk.StringVar()
+        ttk.Label(button_frame, textvariable=self.diagnostics_summary_var).pack(side="left", padx=10)
+        self._refresh_diagnostics_panel()
+
+    def _close_diagnostics_panel(self):
+        if self.diagnostics_refresh_id: self.master.after_cancel(self.diagnostics_refresh_id); self.diagnostics_refresh_id = None
+        if self.diagnostics_window is not None:
+            try: self.diagnostics_window.destroy()
+            except tk.TclError: pass
+            self.diagnostics_window = None
+
+    def _refresh_diagnostics_panel(self, reschedule=True):
+        if self.diagnostics_window is None or not self.diagnostics_window.winfo_exists(): return
+        def ms(value): return f"{value * 1000:.0f}" if value is not None else "-"
+        self.diagnostics_stage_tree.delete(*self.diagnostics_stage_tree.get_children())
+        for kind, stages in sorted(self.metrics.snapshot().items()):
+            for stage in STAGE_NAMES:
+                summary = stages.get(stage)
+                if not summary: continue
+                self.diagnostics_stage_tree.insert("", tk.END, values=(kind, stage, summary["count"], ms(summary["p50"]), ms(summary["p90"]), ms(summary["p99"]), ms(summary["max"])))
+        self.diagnostics_recent_tree.delete(*self.diagnostics_recent_tree.get_children())
+        recent = self.metrics.recent_timelines()
+        for entry in recent:
+            stages = entry["stages_ms"]
+            self.diagnostics_recent_tree.insert("", tk.END, values=(
+                time.strftime("%H:%M:%S", time.localtime(entry["started_at"])), entry["kind"], entry["chars"], entry["outcome"],
+                *(f"{stages[k]:.0f}" if k in stages else "-" for k in ("queue_wait", "first_audio", "playback_start", "total"))))
+        scheduler_stats = self.request_scheduler.stats()
+        prefetch_stats = self.prefetcher.stats()
+        job_stats = self.synthesis_executor.stats()
+        ui_stats = self.ui_queue.stats()
+        self.diagnostics_summary_var.set(f"请求 {scheduler_stats['requests']}，重试 {scheduler_stats['retries']}，限流 {scheduler_stats['throttled']}；{self._format_cache_stats()}；"
+                                         f"预合成 {prefetch_stats['completed']}/{prefetch_stats['started']} (作废 {prefetch_stats['cancelled']})；"
+                                         f"任务 {job_stats['done']}/{job_stats['submitted']} (取消 {job_stats['cancelled']}，合并 {job_stats['coalesced']})；"
+                                         f"界面更新 {ui_stats['run']}/{ui_stats['posted']}" + self._format_endpoint_stats())
+        if reschedule: self.diagnostics_refresh_id = self.diagnostics_window.after(1000, self._refresh_diagnostics_panel)
+
+    def _format_endpoint_stats(self):
+        # 配置了多个终结点时显示每个终结点的请求数、错误和延迟
+        backend = self.backend_provider.current()
+        if not hasattr(backend, "endpoint_stats"): return ""
+        parts = []
+        for endpoint in backend.endpoint_stats():
+            state = f"冷却 {endpoint['cooldown_sec']:.0f}s" if endpoint["cooldown_sec"] else "可用"
+            latency = f"，p50 {endpoint['latency_p50_ms']:.0f}ms" if endpoint["latency_p50_ms"] is not None else ""
+            parts.append(f"{endpoint['name']} {state} {endpoint['succeeded']}/{endpoint['requests']}{latency}")
+        return "\n终结点: " + "；".join(parts)
+
+    def _export_diagnostics(self):
+        export_dir = filedialog.askdirectory(title="选择导出目录", initialdir=self.script_dir, parent=self.diagnostics_window)
+        if not export_dir: return
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        jsonl_path = os.path.join(export_dir, f"azure_tts_timelines_{stamp}.jsonl")
+        prom_path = os.path.join(export_dir, f"azure_tts_metrics_{stamp}.prom")
+        try:
+            self.metrics.append_jsonl(jsonl_path, reversed(self.metrics.recent_timelines()))
+            self.metrics.write_prometheus(prom_path)
+            messagebox.showinfo("导出成功", f"已导出:\n{jsonl_path}\n{prom_path}", parent=self.diagnostics_window)
+        except OSError as e:
+            messagebox.showerror("导出失败", f"无法写入诊断文件: {e}", parent=self.diagnostics_window)
+
+    def _on_request_retry(self, kind, attempt, max_retries, delay_sec, exc):
+        # 在工作线程中被调用，_update_status 会把提示交给主线程
+        reason = "服务限流" if kind == "throttled" else "网络或服务暂时不可用"
+        self._update_status(f"{reason}，{delay_sec:.1f} 秒后重试 ({attempt}/{max_retries})...")
+
+    def _apply_voice_catalog_settings(self, catalog_settings):
+        if not isinstance(catalog_settings, dict): return
+        try:
+            self.voice_catalog.ttl_sec = max(0.0, float(catalog_settings.get("ttl_hours", DEFAULT_VOICE_CATALOG_TTL_SEC / 3600))) * 3600
+        except (TypeError, ValueError) as e:
+            print(f"警告: 无效的语音目录配置 {catalog_settings}，将使用默认值。错误: {e}")
+
+    def _apply_playback_settings(self, playback_settings):
+        if not isinstance(playback_settings, dict): return
+        self.streaming_playback_var.set(bool(playback_settings.get("streaming", True)))
+        self.in_memory_playback = bool(playback_settings.get("in_memory", True))
+        try:
+            self.streaming_prebuffer_sec = max(0.05, float(playback_settings.get("prebuffer_ms", DEFAULT_PREBUFFER_SEC * 1000)) / 1000)
+        except (TypeError, ValueError) as e:
+            print(f"警告: 无效的播放配置 {playback_settings}，将使用默认值。错误: {e}")
+
+    def _on_streaming_option_toggled(self):
+        self.save_app_config()
+        self._update_status("已开启边合成边播放。" if self.streaming_playback_var.get() else "已关闭边合成边播放，将在合成完成后播放。")
+        if self.voice_var.get(): self._prewarm_synthesizers()
+
+    def _apply_synthesis_settings(self, synthesis_settings):
+        if not isinstance(synthesis_settings, dict): return
+        try:
+            chunk_max_chars = int(synthesis_settings.get("chunk_max_chars", DEFAULT_CHUNK_MAX_CHARS))
+            max_workers = int(synthesis_settings.get("max_workers", DEFAULT_SYNTHESIS_WORKERS))
+            longform_min_chars = int(synthesis_settings.get("longform_min_chars", DEFAULT_LONGFORM_MIN_CHARS)) # 0 表示不使用长篇导出
+            longform_segment_chars = int(synthesis_settings.get("longform_segment_chars", DEFAULT_LONGFORM_SEGMENT_CHARS))
+            self.synthesis_settings = {"chunk_max_chars": max(100, chunk_max_chars), "max_workers": max(1, max_workers),
+                                       "incremental": bool(synthesis_settings.get("incremental", False)), # 逐句合成每句一个请求，默认关闭
+                                       "longform_min_chars": max(0, longform_min_chars), "longform_segment_chars": max(100, longform_segment_chars)}
+        except (TypeError, ValueError) as e:
+            print(f"警告: 无效的合成配置 {synthesis_settings}，将使用默认值。错误: {e}")
+
+    def _apply_cache_settings(self, cache_settings):
+        if not self.synthesis_cache or not isinstance(cache_settings, dict): return
+        try:
+            max_size_mb = float(cache_settings.get("max_size_mb", 512))
+            max_age_days = float(cache_settings.get("max_age_days", 30))
+            self.synthesis_cache.configure(max_bytes=int(max_size_mb * 1024 * 1024), max_age_sec=max_age_days * 24 * 3600)
+        except (TypeError, ValueError) as e:
+            print(f"警告: 无效的缓存配置 {cache_settings}，将使用默认值。错误: {e}")
+
+    def _get_cache_key_for_params(self, params):
+        ssml = self._build_ssml(params["text"], params["lang"], params["voice"], params["role"], params["style"], params["rate"])
+        return SynthesisCache.make_key(ssml, WAV_FORMAT_NAME, self._get_backend(params["subscription_key"], params["service_region"]).cache_namespace)
+
+    def _format_cache_stats(self):
+        if not self.synthesis_cache: return ""
+        stats = self.synthesis_cache.stats()
+        return f"缓存 命中 {stats['hits']} / 未命中 {stats['misses']}"
 
     def _update_ui_for_playback_state(self):
-        if not self.pygame_initialized:
+        if self.audio_init_error is not None:
             self.play_pause_button.config(text="▶️ 播放", state=tk.DISABLED)
             self.stop_button.config(state=tk.DISABLED); self.progress_bar.config(state=tk.DISABLED)
             self.save_mp3_button.config(state=tk.DISABLED); return
@@ -256,8 +727,9 @@ class TextToSpeechApp:
         self.save_mp3_button.config(state=tk.NORMAL if can_synthesize_new else tk.DISABLED)
 
         if self.playback_state == "idle" or self.playback_state == "stopped_by_user":
-            can_play_cached = bool(self.synthesized_audio_filepath and os.path.exists(self.synthesized_audio_filepath) and self.total_audio_duration_sec > 0)
-            self.play_pause_button.config(text="▶️ 播放", state=tk.NORMAL if (can_synthesize_new or can_play_cached) else tk.DISABLED)
+            can_play_cached = self._has_playable_audio() and self.total_audio_duration_sec > 0
+            can_start = (can_synthesize_new or can_play_cached) and not self.synthesis_in_progress
+            self.play_pause_button.config(text="▶️ 播放" if not self.synthesis_in_progress else "合成中...", state=tk.NORMAL if can_start else tk.DISABLED)
             self.stop_button.config(state=tk.DISABLED)
             self.progress_bar.config(state=tk.DISABLED if not can_play_cached else tk.NORMAL) 
             
@@ -281,16 +753,16 @@ class TextToSpeechApp:
 
         elif self.playback_state == "synthesizing":
             self.play_pause_button.config(text="合成中...", state=tk.DISABLED)
-            self.stop_button.config(state=tk.DISABLED) 
+            self.stop_button.config(state=tk.NORMAL if self.synthesis_executor.active_jobs("playback") else tk.DISABLED) # 停止即取消合成
             self.progress_bar.config(state=tk.DISABLED)
         elif self.playback_state == "playing":
             self.play_pause_button.config(text="⏸️ 暂停", state=tk.NORMAL)
             self.stop_button.config(state=tk.NORMAL)
-            self.progress_bar.config(state=tk.NORMAL)
+            self.progress_bar.config(state=tk.NORMAL if self.stream_player is None else tk.DISABLED)
         elif self.playback_state == "paused":
             self.play_pause_button.config(text="▶️ 继续", state=tk.NORMAL)
             self.stop_button.config(state=tk.NORMAL)
-            self.progress_bar.config(state=tk.NORMAL)
+            self.progress_bar.config(state=tk.NORMAL if self.stream_player is None else tk.DISABLED)
 
     def load_app_config(self):
         try:
@@ -303,6 +775,14 @@ class TextToSpeechApp:
             self.service_region_entry.delete(0, tk.END); self.service_region_entry.insert(0, credentials.get("service_region", ""))
             self.voice_profiles_data = config_data.get("voice_profiles", self._get_default_config()["voice_profiles"])
             self._update_profile_combobox()
+            self._apply_cache_settings(config_data.get("synthesis_cache", self._get_default_config()["synthesis_cache"]))
+            self._apply_synthesis_settings(config_data.get("synthesis", self._get_default_config()["synthesis"]))
+            self._apply_playback_settings(config_data.get("playback", self._get_default_config()["playback"]))
+            self._apply_voice_catalog_settings(config_data.get("voice_catalog", self._get_default_config()["voice_catalog"]))
+            self._apply_scheduler_settings(config_data.get("scheduler", self._get_default_config()["scheduler"]))
+            self._apply_backend_settings(config_data.get("backend", self._get_default_config()["backend"]))
+            self._apply_diagnostics_settings(config_data.get("diagnostics", self._get_default_config()["diagnostics"]))
+            self._apply_prefetch_settings(config_data.get("prefetch", self._get_default_config()["prefetch"]))
         except Exception as e:
             messagebox.showerror("加载配置错误", f"加载配置文件时出错: {e}。\n将使用默认设置。", parent=self.master)
             self._apply_default_config_ui()
@@ -330,6 +810,9 @@ class TextToSpeechApp:
         
         config_data["azure_credentials"] = {"subscription_key": current_key, "service_region": current_region}
         config_data["voice_profiles"] = self.voice_profiles_data 
+        config_data["playback"] = {"streaming": bool(self.streaming_playback_var.get()), "prebuffer_ms": int(self.streaming_prebuffer_sec * 1000),
+                                   "in_memory": self.in_memory_playback}
+        config_data["prefetch"] = dict(config_data.get("prefetch") or {}, enabled=bool(self.prefetch_var.get()))
         try:
             with open(self.config_file_path, 'w', encoding='utf-8') as f: json.dump(config_data, f, indent=4, ensure_ascii=False)
             return True
@@ -341,7 +824,9 @@ class TextToSpeechApp:
         self.loaded_voices_credentials = {"key": None, "region": None}
         self.language_var.set("")
         # self.language_combo.set('') # Combobox doesn't have .set directly, use var
-        self.language_combo.config(state="disabled", values=["zh-CN", "en-US", "ja-JP", "ko-KR", "fr-FR", "de-DE", "es-ES"])
+        self.voice_index = VoiceIndex([])
+        self.language_combo.config(state="disabled", values=[])
+        self.voice_gender_filter_combo.config(values=["(全部)"]); self.voice_filter_count_var.set("")
         self._reset_voice_selections()
 
         # --- 修改：重新显示并重置提示标签的文本 ---
@@ -357,6 +842,7 @@ class TextToSpeechApp:
 
         if self.save_app_config(): 
             self._update_status("凭据和配置已保存。") 
+            self.synthesizer_pool.invalidate(current_key_in_field, current_region_in_field)
             credentials_differ_from_loaded_voices = \
                 (current_key_in_field != self.loaded_voices_credentials.get("key") or \
                  current_region_in_field != self.loaded_voices_credentials.get("region"))
@@ -427,7 +913,7 @@ class TextToSpeechApp:
                                  "这将使用当前凭据字段中的密钥和区域。\n是否现在加载？",
                                  parent=self.master):
                 self._pending_profile_to_apply_after_load = selected_profile_name
-                self.load_voices_from_azure()
+                self.load_voices_from_azure(manual=True)
             else:
                 self._update_status("加载配置文件已取消（需先加载区域语音）。")
             return
@@ -435,6 +921,7 @@ class TextToSpeechApp:
         settings_to_load = self.voice_profiles_data[selected_profile_name]
         self._update_status(f"正在加载配置: {selected_profile_name}...")
         self._profile_being_loaded_settings = settings_to_load.copy()
+        self._reset_voice_filter() # 配置中的语音不应被当前筛选条件隐藏
 
         self._cleanup_temp_file()
         self.last_synthesis_params = {}
@@ -469,15 +956,9 @@ class TextToSpeechApp:
                 self.rate_slider.config(state="disabled")
             self._update_ui_for_playback_state(); return
         
-        self.current_language_voice_infos.clear()
-        voice_short_names = []
-        for vi_idx, vi in enumerate(self.all_voices_in_region):
-            try:
-                if not (hasattr(vi, 'locale') and hasattr(vi, 'short_name') and isinstance(vi.locale, str) and isinstance(vi.short_name, str)): continue 
-                if vi.locale == current_lang_selection:
-                    voice_short_names.append(vi.short_name); self.current_language_voice_infos[vi.short_name] = vi
-            except Exception as e_vi_proc: print(f"Debug: Error processing VoiceInfo: {e_vi_proc}"); continue
-        voice_short_names.sort()
+        self.current_language_voice_infos = {n: self.voice_index.get(n) for n in self.voice_index.voices_for_locale(current_lang_selection)}
+        voice_short_names = self._get_filtered_voice_names(current_lang_selection)
+        self.voice_filter_count_var.set(f"{len(voice_short_names)} / {len(self.current_language_voice_infos)}")
 
         if voice_short_names:
             self.voice_combo.config(values=voice_short_names, state="readonly")
@@ -492,7 +973,8 @@ class TextToSpeechApp:
             self.on_voice_selected(event=None) 
         else:
             self.voice_var.set("") 
-            self._update_status(f"语言 '{current_lang_selection}' 没有找到可用语音。")
+            if self.current_language_voice_infos: self._update_status(f"语言 '{current_lang_selection}' 下没有符合筛选条件的语音。")
+            else: self._update_status(f"语言 '{current_lang_selection}' 没有找到可用语音。")
             if self._profile_being_loaded_settings:
                 messagebox.showwarning("配置加载警告", f"无法为配置 '{self.profile_var.get()}' 在语言 '{current_lang_selection}' 下找到语音。", parent=self.master)
                 self._profile_being_loaded_settings = None 
@@ -501,6 +983,29 @@ class TextToSpeechApp:
             self.on_voice_selected(event=None)
 
 
+    def _get_filtered_voice_names(self, lang):
+        gender = self.voice_gender_filter_var.get()
+        return self.voice_index.filter(locale=lang, gender=None if gender == "(全部)" else gender, query=self.voice_filter_var.get())
+
+    def _reset_voice_filter(self):
+        self.voice_filter_var.set(""); self.voice_gender_filter_var.set("(全部)")
+
+    def _on_voice_filter_changed(self, event=None):
+        lang = self.language_var.get()
+        if not lang or not self.current_language_voice_infos:
+            if len(self.voice_index):
+                matches = self._get_filtered_voice_names(None)
+                self.voice_filter_count_var.set(f"{len(matches)} / {len(self.voice_index)}")
+            return
+        voice_short_names = self._get_filtered_voice_names(lang)
+        self.voice_filter_count_var.set(f"{len(voice_short_names)} / {len(self.current_language_voice_infos)}")
+        self.voice_combo.config(values=voice_short_names, state="readonly" if voice_short_names else "disabled")
+        if not voice_short_names:
+            self._update_status("没有符合筛选条件的语音。"); return
+        if self.voice_var.get() not in voice_short_names:
+            self.voice_var.set(voice_short_names[0])
+            self.on_voice_selected(event=None)
+
     def on_voice_selected(self, event=None):
         selected_voice_name = self.voice_var.get()
         
@@ -529,13 +1034,8 @@ class TextToSpeechApp:
             self._update_status(final_status); self._update_ui_for_playback_state(); return 
 
         voice_info = self.current_language_voice_infos[selected_voice_name]
-        sdk_roles, sdk_styles = [], []
-        raw_roles_list = getattr(voice_info, 'role_play_list', None)
-        if isinstance(raw_roles_list, list): sdk_roles = sorted([str(r).strip() for r in raw_roles_list if str(r).strip()])
-        elif isinstance(raw_roles_list, str) and raw_roles_list: sdk_roles = sorted([r.strip() for r in raw_roles_list.split(',') if r.strip()])
-        raw_styles_list = getattr(voice_info, 'style_list', None)
-        if isinstance(raw_styles_list, list): sdk_styles = sorted([str(s).strip() for s in raw_styles_list if str(s).strip()])
-        elif isinstance(raw_styles_list, str) and raw_styles_list: sdk_styles = sorted([s.strip() for s in raw_styles_list.split(',') if s.strip()])
+        # 角色和风格在构建语音目录时已解析并排序
+        sdk_roles, sdk_styles = list(voice_info.role_play_list), list(voice_info.style_list)
         
         roles_to_display = ["(无)"] + sdk_roles; self.role_combo.config(values=roles_to_display, state="readonly" if sdk_roles else "disabled")
         default_role_to_set = roles_to_display[0]
@@ -571,82 +1071,120 @@ class TextToSpeechApp:
             status_msg = f"配置 '{self.profile_var.get()}' 已应用. {status_msg}"
         self._update_status(status_msg)
         self._update_ui_for_playback_state()
+        self._prewarm_synthesizers()
+
 
+    def _show_load_voices_hint(self, text):
+        if hasattr(self, 'load_voices_hint_label'):
+            self.load_voices_hint_label.config(text=text)
+            if not self.load_voices_hint_label.winfo_ismapped():
+                self.load_voices_hint_label.pack(side="left", padx=(0, 5), anchor='w')
 
-    def load_voices_from_azure(self):
+    def _load_voice_catalog_from_disk(self):
+        # 启动时直接使用本地语音目录，过期或缺失时再在后台从 Azure 刷新
+        subscription_key = self.subscription_key_entry.get()
+        service_region = self.service_region_entry.get()
+        if not subscription_key or not service_region: return
+        records, fetched_at = self.voice_catalog.load(self._get_backend(subscription_key, service_region).cache_namespace)
+        if records:
+            self._apply_voice_records(records, subscription_key, service_region)
+            age_hours = (time.time() - fetched_at) / 3600 if fetched_at else 0
+            self._update_status(f"已从本地目录加载 {len(records)} 个语音 ({age_hours:.1f} 小时前更新)。请选择语言。")
+        if not records or self.voice_catalog.is_stale(fetched_at):
+            self.load_voices_from_azure(manual=False)
+
+    def load_voices_from_azure(self, manual=True):
         subscription_key = self.subscription_key_entry.get()
         service_region = self.service_region_entry.get()
         if not subscription_key or not service_region:
-            messagebox.showerror("配置错误", "请输入有效的 Azure 订阅密钥和区域。", parent=self.master)
+            if manual: messagebox.showerror("配置错误", "请输入有效的 Azure 订阅密钥和区域。", parent=self.master)
             # 确保提示在出错时也可见
             if hasattr(self, 'load_voices_hint_label') and not self.load_voices_hint_label.winfo_ismapped():
-                self.load_voices_hint_label.config(text="<-- 请先配置并加载语音") 
-                self.load_voices_hint_label.pack(side="left", padx=(0, 5), anchor='w')
+                self._show_load_voices_hint("<-- 请先配置并加载语音")
             return
+        if self.voice_fetch_in_progress: return
 
-        self._update_status("正在从 Azure 加载语音列表...")
+        credentials_changed = (subscription_key != self.loaded_voices_credentials.get("key") or service_region != self.loaded_voices_credentials.get("region"))
+        if credentials_changed and self.all_voices_in_region:
+            self._clear_all_voice_data_and_ui() # 凭据变化时旧列表不再有效
+        self._update_status("正在后台从 Azure 加载语音列表..." if self.all_voices_in_region else "正在从 Azure 加载语音列表...")
         self.load_voices_button.config(state="disabled")
-        self._clear_all_voice_data_and_ui() # This will show the hint
-        self.language_combo.config(state="disabled")
-        
+        self.voice_fetch_in_progress = True
+        # 网络请求放到后台线程，避免阻塞 Tk 主循环
+        threading.Thread(target=self._fetch_voices_thread, args=(subscription_key, service_region, manual), daemon=True).start()
+
+    def _fetch_voices_thread(self, subscription_key, service_region, manual):
         try:
-            speech_config = speechsdk.SpeechConfig(subscription=subscription_key, region=service_region)
-            temp_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
-            result = temp_synthesizer.get_voices_async().get()
-
-            if result.reason == speechsdk.ResultReason.VoicesListRetrieved and result.voices:
-                self.all_voices_in_region = result.voices
-                self.loaded_voices_credentials = {"key": subscription_key, "region": service_region}
-                self.language_combo.config(state="readonly")
-                self._update_status("语音列表加载成功。请选择语言。")
-                messagebox.showinfo("成功", f"成功加载 {len(self.all_voices_in_region)} 个区域语音。", parent=self.master)
-                
-                # 成功加载后隐藏提示
-                if hasattr(self, 'load_voices_hint_label') and self.load_voices_hint_label.winfo_ismapped():
-                    self.load_voices_hint_label.pack_forget()
-
-                current_lang_after_load = self.language_var.get()
-                if self._pending_profile_to_apply_after_load:
-                    p_name = self._pending_profile_to_apply_after_load
-                    self._pending_profile_to_apply_after_load = None
-                    if p_name in self.profile_combo['values']:
-                        self.profile_var.set(p_name)
-                        self.on_profile_combobox_selected(event=None)
-                    else:
-                        self._update_status(f"待加载配置 '{p_name}' 未找到。")
-                elif current_lang_after_load:
-                    self.language_var.set(current_lang_after_load)
-                    self.on_language_selected(event=None)
-            else:
-                self.all_voices_in_region = []
-                self.loaded_voices_credentials = {"key": None, "region": None}
-                error_msg_detail = result.cancellation_details.error_details if result and result.cancellation_details and result.cancellation_details.error_details else ""
-                error_msg = f"获取语音列表失败: {result.reason if result else '未知'}" + (f" (详情: {error_msg_detail})" if error_msg_detail else "")
-                messagebox.showerror("加载失败", error_msg, parent=self.master)
-                self._update_status(f"加载失败: {error_msg.splitlines()[0]}")
-                # 加载失败时确保提示可见并更新文本
-                if hasattr(self, 'load_voices_hint_label'):
-                    self.load_voices_hint_label.config(text="<-- 加载失败, 请检查后重试")
-                    if not self.load_voices_hint_label.winfo_ismapped():
-                        self.load_voices_hint_label.pack(side="left", padx=(0, 5), anchor='w')
+            backend = self._get_backend(subscription_key, service_region)
+            records = backend.list_voices()
+            self.voice_catalog.store(backend.cache_namespace, records)
+            self.ui_queue.post(self._on_voices_fetched, records, subscription_key, service_region, manual)
         except Exception as e:
-            self.all_voices_in_region = []
-            self.loaded_voices_credentials = {"key": None, "region": None}
-            messagebox.showerror("发生错误", f"加载语音列表时出错: {str(e)}", parent=self.master)
-            self._update_status(f"加载错误: {str(e)}")
-            # 发生异常时确保提示可见并更新文本
-            if hasattr(self, 'load_voices_hint_label'):
-                self.load_voices_hint_label.config(text="<-- 加载出错, 请重试")
-                if not self.load_voices_hint_label.winfo_ismapped():
-                    self.load_voices_hint_label.pack(side="left", padx=(0, 5), anchor='w')
-        finally:
-            self.load_voices_button.config(state="normal")
-            self._update_ui_for_playback_state()
-            # 如果最终语音列表仍为空，也确保提示可见
-            if not self.all_voices_in_region and hasattr(self, 'load_voices_hint_label'):
-                self.load_voices_hint_label.config(text="<-- 启动后请先点此加载语音") 
-                if not self.load_voices_hint_label.winfo_ismapped():
-                    self.load_voices_hint_label.pack(side="left", padx=(0, 5), anchor='w')
+            self.ui_queue.post(self._on_voice_fetch_failed, str(e), manual)
+
+    def _on_voices_fetched(self, records, subscription_key, service_region, manual):
+        self.voice_fetch_in_progress = False
+        self.load_voices_button.config(state="normal")
+        if subscription_key != self.subscription_key_entry.get() or service_region != self.service_region_entry.get():
+            # 获取期间凭据已被修改，结果只写入目录，不应用到界面
+            self._update_status("语音列表已获取，但凭据已变更，请重新加载。")
+            self._update_ui_for_playback_state(); return
+        changes = diff_voice_records(self.all_voices_in_region, records) if self.all_voices_in_region else None
+        self._apply_voice_records(records, subscription_key, service_region)
+        if changes is None:
+            self._update_status("语音列表加载成功。请选择语言。")
+        elif any(changes.values()):
+            self._update_status(f"语音列表已更新: 新增 {len(changes['added'])}，移除 {len(changes['removed'])}，变更 {len(changes['changed'])}。")
+        else:
+            self._update_status(f"语音列表已是最新 ({len(records)} 个语音)。")
+        if manual:
+            messagebox.showinfo("成功", f"成功加载 {len(self.all_voices_in_region)} 个区域语音。", parent=self.master)
+
+    def _on_voice_fetch_failed(self, error_msg, manual):
+        self.voice_fetch_in_progress = False
+        self.load_voices_button.config(state="normal")
+        if self.all_voices_in_region and not manual:
+            # 后台刷新失败时继续使用本地目录
+            self._update_status(f"后台刷新语音列表失败，继续使用本地目录: {error_msg.splitlines()[0]}")
+            return
+        if manual:
+            messagebox.showerror("加载失败", error_msg, parent=self.master)
+        self._update_status(f"加载失败: {error_msg.splitlines()[0]}")
+        if not self.all_voices_in_region:
+            # 加载失败时确保提示可见并更新文本
+            self._show_load_voices_hint("<-- 加载失败, 请检查后重试")
+        self._update_ui_for_playback_state()
+
+    def _apply_voice_records(self, records, subscription_key, service_region):
+        previous_voice = self.voice_var.get()
+        self.all_voices_in_region = records
+        self.voice_index = VoiceIndex(records)
+        self.loaded_voices_credentials = {"key": subscription_key, "region": service_region}
+        self.language_combo.config(state="readonly", values=self.voice_index.locales)
+        self.voice_gender_filter_combo.config(values=["(全部)"] + self.voice_index.genders)
+        # 成功加载后隐藏提示
+        if hasattr(self, 'load_voices_hint_label') and self.load_voices_hint_label.winfo_ismapped():
+            self.load_voices_hint_label.pack_forget()
+
+        current_lang_after_load = self.language_var.get()
+        if self._pending_profile_to_apply_after_load:
+            p_name = self._pending_profile_to_apply_after_load
+            self._pending_profile_to_apply_after_load = None
+            if p_name in self.profile_combo['values']:
+                self.profile_var.set(p_name)
+                self.on_profile_combobox_selected(event=None)
+            else:
+                self._update_status(f"待加载配置 '{p_name}' 未找到。")
+        elif current_lang_after_load:
+            lang_voices = {n: self.voice_index.get(n) for n in self.voice_index.voices_for_locale(current_lang_after_load)}
+            if previous_voice and previous_voice in lang_voices:
+                # 刷新后当前语音仍然可用：只替换语音数据，保留用户的选择
+                self.current_language_voice_infos = lang_voices
+                self.voice_combo.config(values=self._get_filtered_voice_names(current_lang_after_load))
+            else:
+                self.language_var.set(current_lang_after_load)
+                self.on_language_selected(event=None)
+        self._update_ui_for_playback_state()
 
     def _get_common_synthesis_inputs(self, for_playback=False):
         s_key=self.subscription_key_entry.get();s_reg=self.service_region_entry.get();
@@ -660,31 +1198,19 @@ class TextToSpeechApp:
         return s_key,s_reg,txt,lang,voice
 
     def _build_ssml(self, text_to_speak_raw, lang, voice_name, role, style, rate):
-        txt_esc = xml.sax.saxutils.escape(text_to_speak_raw)
-        parts = [
-            f'<speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xmlns:mstts="http://www.w3.org/2001/mstts" xml:lang="{lang}">',
-            f'<voice name="{voice_name}">'
-        ]
-        prosody_opened = False
-        if abs(rate - 1.0) > 0.001: 
-            rate_value_str = f"{rate:.2f}" 
-            parts.append(f'<prosody rate="{rate_value_str}">')
-            prosody_opened = True
-        expr_as_opened = False
-        if role != "(无)" or style != "(默认)":
-            attrs = []
-            if role != "(无)": attrs.append(f'role="{role}"')
-            if style != "(默认)": attrs.append(f'style="{style}"')
-            if attrs:
-                parts.append(f'<mstts:express-as {" ".join(attrs)}>')
-                expr_as_opened = True
-        parts.append(txt_esc)
-        if expr_as_opened: parts.append('</mstts:express-as>')
-        if prosody_opened: parts.append('</prosody>')
-        parts.extend(['</voice>', '</speak>'])
-        return "".join(parts)
+        return build_ssml(text_to_speak_raw, lang, voice_name, role, style, rate)
 
     def _on_closing(self):
+        if self.pool_pruner_id: self.master.after_cancel(self.pool_pruner_id); self.pool_pruner_id = None
+        # 先取消并等待进行中的播放合成/导出任务结束，再关闭它们用到的后端、合成器池、缓存和音频
+        if not self.synthesis_executor.shutdown():
+            print("Debug: 合成任务未能在关闭前结束，将随程序退出。")
+        self.ui_queue.detach()
+        self._close_diagnostics_panel()
+        self.backend_provider.close()
+        self.synthesizer_pool.clear()
+        if self.stream_player is not None: self.stream_player.stop(); self.stream_player = None
+        self._stop_buffer_player()
         if self.pygame_initialized and pygame.mixer.get_init(): 
             try:
                 pygame.mixer.music.stop()
@@ -694,6 +1220,9 @@ class TextToSpeechApp:
             except Exception as e_pg_close:
                  print(f"Debug: 在 _on_closing 中 Pygame 关闭操作时发生意外错误: {e_pg_close}")
         self._cleanup_temp_file() 
+        self._cancel_pending_prefetch()
+        self.prefetcher.cancel()
+        if self.synthesis_cache: self.synthesis_cache.close()
         if self.pygame_initialized:
             try:
                 pygame.mixer.quit() 
@@ -702,7 +1231,46 @@ class TextToSpeechApp:
                 print(f"Debug: Pygame 退出时发生错误: {e}")
         self.master.destroy()
 
+    def _has_playable_audio(self):
+        return bool(self.synthesized_audio_bytes) or bool(self.synthesized_audio_filepath and os.path.exists(self.synthesized_audio_filepath))
+
+    def _load_music(self):
+        # 内存模式下从 BytesIO 加载；BytesIO 以 bytes 初始化时共享其缓冲区，不会复制音频数据
+        if self.synthesized_audio_bytes:
+            pygame.mixer.music.load(io.BytesIO(self.synthesized_audio_bytes), "wav")
+        else:
+            pygame.mixer.music.load(self.synthesized_audio_filepath)
+
+    def _create_buffer_player(self):
+        # 解码一次放进内存，之后的定位都不再读文件
+        if not self.streaming_supported: return None
+        data = self.synthesized_audio_bytes
+        try:
+            if data is None:
+                with open(self.synthesized_audio_filepath, 'rb') as f: data = f.read()
+            return PcmBufferPlayer.from_wav_bytes(data)
+        except (OSError, WavFormatError) as e:
+            print(f"Debug: 无法使用 PCM 缓冲播放，将使用 pygame.mixer.music。原因: {e}")
+            return None
+
+    def _stop_buffer_player(self):
+        if self.buffer_player is not None:
+            self.buffer_player.stop()
+            self.buffer_player = None
+
     def _cleanup_temp_file(self):
+        self._stop_buffer_player()
+        if self.synthesized_audio_bytes is not None:
+            # 内存中的音频没有文件句柄需要等待释放，停止播放后丢弃引用即可
+            if self.pygame_initialized and pygame.mixer.get_init():
+                try:
+                    pygame.mixer.music.stop()
+                    pygame.mixer.music.unload()
+                except pygame.error as e:
+                    print(f"Debug: 在 _cleanup_temp_file 中停止/卸载内存音频时出错 (可忽略): {e}")
+            self.synthesized_audio_bytes = None
+            self.synthesized_audio_filepath = None
+            return
         if not self.synthesized_audio_filepath or not os.path.exists(self.synthesized_audio_filepath):
             if self.synthesized_audio_filepath and not os.path.exists(self.synthesized_audio_filepath):
                 print(f"Debug: 记录的临时文件 {self.synthesized_audio_filepath} 已不存在, 清除路径。")
@@ -719,7 +1287,12 @@ class TextToSpeechApp:
                 print(f"Debug: 在 _cleanup_temp_file 中为 {filepath_to_delete} 停止/卸载 Pygame 音频时出错 (可忽略): {e}")
             except Exception as e_pg:
                 print(f"Debug: 在 _cleanup_temp_file 中为 {filepath_to_delete} 处理 Pygame 时发生意外错误: {e_pg}")
-        
+
+        if self.synthesis_cache and self.synthesis_cache.owns_path(filepath_to_delete):
+            # 持久缓存中的文件保留在磁盘上，只释放引用
+            self.synthesized_audio_filepath = None
+            return
+
         deleted_successfully = False
         for attempt in range(3):
             try:
@@ -749,69 +1322,284 @@ class TextToSpeechApp:
         minutes = int(seconds // 60); seconds = int(seconds % 60)
         return f"{minutes:02d}:{seconds:02d}"
     
-    def _synthesize_audio_to_file_thread(self):
-        current_params = self._get_current_synthesis_params()
-        common_inputs = self._get_common_synthesis_inputs(for_playback=True) 
+    def _build_sentence_ssml_list(self, txt_raw, lang, voice, role, style_val, rate_val):
+        # [(句子文本, 句子 SSML)]，逐句缓存和增量合成的单位
+        return [(sentence, self._build_ssml(sentence, lang, voice, role, style_val, rate_val))
+                for sentence in split_text_into_sentences(txt_raw, self.synthesis_settings["chunk_max_chars"])]
+
+    def _on_chunk_progress(self, done, total, unit="段"):
+        if total > 1: self._update_status(f"正在合成语音... ({done}/{total} {unit})")
+
+    def _call_for_job(self, job, timeline, request, chars, can_retry=None):
+        # 任务取消后不再发出新的请求，也不再重试
+        job.check_cancelled()
+        return self.request_scheduler.call(request, chars=chars, on_dispatch=timeline.on_dispatch,
+                                           can_retry=lambda exc: not job.is_cancelled() and (can_retry is None or can_retry(exc)))
+
+    def _stream_with_scheduler(self, job, backend, ssml, on_audio, timeline):
+        # 已经有音频送进播放器后不再重试，否则同一段会重复播放
+        received = [0]
+        def counting_on_audio(data):
+            received[0] += len(data); on_audio(data)
+        return self._call_for_job(
+            job, timeline, lambda: backend.synthesize_with_events(ssml, counting_on_audio, on_event=timeline.on_synthesis_event, cancel_scope=job),
+            chars=len(ssml), can_retry=lambda exc: received[0] == 0)
+
+    def _split_playback_chunks(self, txt_raw):
+        # 播放和预合成共用的切分，保证每段的 SSML 和缓存键一致
+        return split_text_into_chunks(txt_raw, self.synthesis_settings["chunk_max_chars"]) or [txt_raw]
+
+    def _cached_chunk_wav(self, backend, chunk_ssml):
+        # 预合成按段写入缓存；命中时返回该段的 WAV 字节
+        if not self.synthesis_cache: return None
+        chunk_key = SynthesisCache.make_key(chunk_ssml, WAV_FORMAT_NAME, backend.cache_namespace)
+        path = self.synthesis_cache.get(chunk_key) if self.synthesis_cache.contains(chunk_key) else None
+        if not path: return None
+        try:
+            with open(path, 'rb') as f: return f.read()
+        except OSError as e:
+            print(f"警告: 读取分段缓存失败，将重新合成。错误: {e}")
+            return None
+
+    def _synthesize_chunks_to_wav(self, job, backend, txt_raw, ssml, lang, voice, role, style_val, rate_val, streaming, timeline):
+        # 长文本按句子/段落切分后在线程池中并行合成，再按顺序拼接为一个 WAV；已由预合成写入缓存的分段直接读出
+        text_chunks = self._split_playback_chunks(txt_raw)
+        chunk_ssml_list = [self._build_ssml(chunk, lang, voice, role, style_val, rate_val) for chunk in text_chunks] if len(text_chunks) > 1 else [ssml]
+        timeline.chunks = len(chunk_ssml_list)
+        if len(chunk_ssml_list) > 1:
+            print(f"Debug: 文本被切分为 {len(chunk_ssml_list)} 段，并行度 {self.synthesis_settings['max_workers']}")
+        if streaming:
+            # 流式模式：synthesizing 事件送来的 PCM 直接进入播放缓冲区，缓冲到预设时长即开始播放
+            player = StreamingPcmPlayer(prebuffer_sec=self.streaming_prebuffer_sec)
+            self.ui_queue.post(self._start_streaming_playback, player)
+            def stream_chunk(chunk_ssml, on_audio):
+                cached_wav = self._cached_chunk_wav(backend, chunk_ssml) if len(chunk_ssml_list) > 1 else None
+                if cached_wav is not None:
+                    _, pcm = parse_wav(cached_wav)
+                    on_audio(pcm)
+                    return pcm
+                return self._stream_with_scheduler(job, backend, chunk_ssml, on_audio, timeline)
+            pcm_parts = synthesize_chunks_streaming(
+                chunk_ssml_list,
+                stream_chunk,
+                player.feed,
+                max_workers=self.synthesis_settings["max_workers"],
+                progress_callback=self._on_chunk_progress,
+            )
+            player.finish()
+            return build_wav_bytes(b"".join(pcm_parts))
+        return synthesize_text_chunks_to_wav(
+            chunk_ssml_list,
+            lambda chunk_ssml: (self._cached_chunk_wav(backend, chunk_ssml) if len(chunk_ssml_list) > 1 else None) or self._call_for_job(
+                job, timeline, lambda: backend.synthesize(chunk_ssml, WAV_FORMAT_NAME, on_event=timeline.on_synthesis_event, cancel_scope=job),
+                chars=len(chunk_ssml)),
+            max_workers=self.synthesis_settings["max_workers"],
+            progress_callback=self._on_chunk_progress,
+        )
+
+    def _synthesize_sentences_to_wav(self, job, backend, txt_raw, lang, voice, role, style_val, rate_val, streaming, timeline):
+        # 增量合成：每句的 PCM 单独缓存，改动后只重新合成变化了的句子，其余句子从缓存读出后按顺序拼接
+        sentences = self._build_sentence_ssml_list(txt_raw, lang, voice, role, style_val, rate_val)
+        timeline.chunks = len(sentences)
+        player = None
+        if streaming:
+            player = StreamingPcmPlayer(prebuffer_sec=self.streaming_prebuffer_sec)
+            self.ui_queue.post(self._start_streaming_playback, player)
+            synthesize_sentence = lambda sentence_ssml, on_audio: self._stream_with_scheduler(job, backend, sentence_ssml, on_audio, timeline)
+        else:
+            synthesize_sentence = lambda sentence_ssml, on_audio: self._call_for_job(
+                job, timeline, lambda: backend.synthesize(sentence_ssml, RAW_PCM_FORMAT_NAME, on_event=timeline.on_synthesis_event, cancel_scope=job),
+                chars=len(sentence_ssml))
+        pcm_parts, stats = synthesize_sentences_incremental(
+            sentences, self.synthesis_cache, backend.cache_namespace, synthesize_sentence,
+            sink=player.feed if player else None,
+            max_workers=self.synthesis_settings["max_workers"],
+            progress_callback=lambda done, total: self._on_chunk_progress(done, total, "句"),
+        )
+        if player: player.finish()
+        print(f"Debug: 增量合成 {stats['sentences']} 句，复用缓存 {stats['reused']} 句，重新合成 {stats['synthesized']} 句")
+        return build_wav_bytes(b"".join(pcm_parts))
+
+    def _synthesize_audio_to_file_thread(self, job, current_params, common_inputs, streaming=False):
+        # 在 synthesis_executor 的工作线程中执行；job 被取消 (停止或被新的播放请求取代) 时丢弃结果。
+        # 参数和输入在主线程中读取后传入，工作线程不读 Tk 控件
         if not common_inputs:
             self._update_status("输入错误，无法开始合成。")
             self.playback_state = "idle"
-            self.master.after(0, self._update_ui_for_playback_state)
+            self.ui_queue.post(self._update_ui_for_playback_state, key="ui_state")
             return
 
         self.playback_state = "synthesizing"
-        self.master.after(0, self._update_ui_for_playback_state)
+        self.synthesis_in_progress = True
+        self.ui_queue.post(self._update_ui_for_playback_state, key="ui_state")
         self._update_status("正在合成语音...")
         
         s_key, s_reg, txt_raw, lang, voice = common_inputs 
+        timeline = self.metrics.new_timeline("playback", chars=len(txt_raw))
+        timeline.wait_for(MARK_PLAYBACK_STARTED)
+        self.playback_timeline = timeline
         role, style_val = current_params["role"], current_params["style"]
         rate_val = current_params["rate"] 
         ssml = self._build_ssml(txt_raw, lang, voice, role, style_val, rate_val)
+        backend = self._get_backend(s_key, s_reg)
+        cache_key = SynthesisCache.make_key(ssml, WAV_FORMAT_NAME, backend.cache_namespace)
         self._cleanup_temp_file() 
         
+        # 逐句合成时每句的音频已经单独缓存，不再把整段 WAV 重复写入缓存
+        incremental = bool(self.synthesis_settings["incremental"] and self.synthesis_cache)
         try:
-            fd, temp_path = tempfile.mkstemp(suffix=".wav", prefix="azure_tts_", dir=self.cache_dir_path)
-            os.close(fd) 
-            self.synthesized_audio_filepath = temp_path 
-            print(f"Debug: 创建新的临时音频文件于: {self.synthesized_audio_filepath}")
-            
-            speech_config_obj = speechsdk.SpeechConfig(subscription=s_key, region=s_reg) 
-            speech_config_obj.set_speech_synthesis_output_format(speechsdk.SpeechSynthesisOutputFormat.Riff16Khz16BitMonoPcm)
-            audio_config_obj = speechsdk.audio.AudioOutputConfig(filename=self.synthesized_audio_filepath) 
-            synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config_obj, audio_config=audio_config_obj)
-            result = synthesizer.speak_ssml_async(ssml).get()
-            del synthesizer 
-
-            if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-                self.total_audio_duration_sec = result.audio_duration.total_seconds() if result.audio_duration else 0
+            if incremental:
+                wav_bytes = self._synthesize_sentences_to_wav(job, backend, txt_raw, lang, voice, role, style_val, rate_val, streaming, timeline)
+            else:
+                wav_bytes = self._synthesize_chunks_to_wav(job, backend, txt_raw, ssml, lang, voice, role, style_val, rate_val, streaming, timeline)
+            job.check_cancelled()
+
+            self.total_audio_duration_sec = wav_duration_sec(wav_bytes)
+            if self.in_memory_playback:
+                # 直接从内存播放，磁盘只在写入持久缓存时才会用到，且放在播放开始之后
+                self.synthesized_audio_bytes = wav_bytes
+                self.last_synthesis_params = current_params
+                self.text_modified_flag = False
+                self._on_synthesis_finished(streaming)
+                if self.synthesis_cache and not incremental:
+                    try:
+                        self.synthesis_cache.put_bytes(cache_key, wav_bytes, duration_sec=self.total_audio_duration_sec)
+                        timeline.mark(MARK_FILE_WRITTEN)
+                    except OSError as e_cache:
+                        print(f"警告: 无法将合成结果写入缓存。错误: {e_cache}")
+                timeline.finish("ok")
+            else:
+                fd, temp_path = tempfile.mkstemp(suffix=".wav", prefix="azure_tts_", dir=self.cache_dir_path)
+                with os.fdopen(fd, 'wb') as f: f.write(wav_bytes)
+                self.synthesized_audio_filepath = temp_path 
+                print(f"Debug: 创建新的临时音频文件于: {self.synthesized_audio_filepath}")
+                if self.synthesis_cache and not incremental:
+                    try:
+                        self.synthesized_audio_filepath = self.synthesis_cache.put_file(cache_key, temp_path, duration_sec=self.total_audio_duration_sec)
+                    except OSError as e_cache:
+                        print(f"警告: 无法将合成结果写入缓存，将使用临时文件播放。错误: {e_cache}")
+                timeline.mark(MARK_FILE_WRITTEN)
+                timeline.finish("ok")
                 self.last_synthesis_params = current_params 
                 self.text_modified_flag = False 
-                self._update_status("合成完毕，准备播放。")
-                self.master.after(0, self._start_playback_after_synthesis, True) 
-            else: 
-                details = result.cancellation_details if result else None
-                error_message_detail = ""
-                if details:
-                    error_message_detail = f"错误原因: {details.reason}"
-                    if details.reason == speechsdk.CancellationReason.Error and details.error_details:
-                        error_message_detail += f" - 错误详情: {details.error_details}"
-                msg = f"语音合成取消/失败: {result.reason if result else '未知'}\n{error_message_detail}"
-                self.master.after(0, lambda m=msg: messagebox.showerror("合成错误", m, parent=self.master))
-                self.playback_state = "idle"
-                self._cleanup_temp_file() 
-                self.master.after(0, self._update_ui_for_playback_state)
-                self.master.after(0, lambda r=result.reason: self._update_status(f"合成错误: {r if r else '未知'}"))
+                self._on_synthesis_finished(streaming)
+        except JobCancelled:
+            self._on_synthesis_cancelled(job, timeline)
+        except SynthesisError as e_synth:
+            if job.is_cancelled(): self._on_synthesis_cancelled(job, timeline); return
+            timeline.finish("error", e_synth)
+            self.ui_queue.post(lambda m=str(e_synth): messagebox.showerror("合成错误", m, parent=self.master))
+            self.ui_queue.post(self._reset_after_synthesis_stopped, job, True)
+            self._update_status(f"合成错误: {e_synth.reason if e_synth.reason else '未知'}")
         except Exception as e: 
-            self.master.after(0, lambda err=str(e): messagebox.showerror("发生严重错误", f"语音合成或文件操作失败: {err}", parent=self.master))
-            self.playback_state = "idle"
-            self._cleanup_temp_file() 
-            self.master.after(0, self._update_ui_for_playback_state)
-            self.master.after(0, lambda err=str(e): self._update_status(f"合成严重错误: {err}"))
+            if job.is_cancelled(): self._on_synthesis_cancelled(job, timeline); return
+            timeline.finish("error", e)
+            self.ui_queue.post(lambda m=f"语音合成或文件操作失败: {e}": messagebox.showerror("发生严重错误", m, parent=self.master))
+            self.ui_queue.post(self._reset_after_synthesis_stopped, job, True)
+            self._update_status(f"合成严重错误: {e}")
+        finally:
+            self.synthesis_in_progress = False
+            self.ui_queue.post(self._update_ui_for_playback_state, key="ui_state")
+
+    def _on_synthesis_cancelled(self, job, timeline):
+        timeline.finish("cancelled")
+        self.ui_queue.post(self._reset_after_synthesis_stopped, job, False)
+        self._update_status("已取消合成。")
+
+    def _reset_after_synthesis_stopped(self, job, failed):
+        # 主线程：合成失败或取消后停止流式播放、复位播放状态并清理音频。
+        # 新的播放任务已经提交时什么也不做，避免把新任务的状态和播放器一并清掉
+        if any(other is not job and not other.is_cancelled() for other in self.synthesis_executor.active_jobs("playback")): return
+        self._abort_streaming_playback()
+        if failed or self.playback_state == "synthesizing": self.playback_state = "idle"
+        self._cleanup_temp_file()
+        self._update_ui_for_playback_state()
+
+    def _on_jobs_changed(self):
+        # 在状态栏旁显示执行器中的任务，连续点击时可以看到旧任务被取消、相同请求被合并
+        current = self.synthesis_executor.current()
+        pending = len(self.synthesis_executor.pending())
+        if current is None:
+            self.jobs_var.set(f"排队 {pending}" if pending else "")
+        else:
+            label = {"playback": "播放合成", "export": "导出"}.get(current.kind, current.kind)
+            state = "取消中" if current.is_cancelled() else "进行中"
+            self.jobs_var.set(f"任务 #{current.id} {label}{state}" + (f"，排队 {pending}" if pending else ""))
+        if self.playback_state == "synthesizing": self._update_ui_for_playback_state()
+
+    def _on_synthesis_finished(self, streaming):
+        if streaming:
+            self.ui_queue.post(lambda: self._update_status(
+                f"合成完毕 ({self._format_time(self.total_audio_duration_sec)})" + ("，继续播放..." if self.stream_player is not None else "，已缓存。")), key="status")
+        else:
+            self._update_status("合成完毕，准备播放。")
+            self.ui_queue.post(self._start_playback_after_synthesis, True)
+
+    def _start_streaming_playback(self, player):
+        self.stream_player = player
+        self.playback_state = "playing"
+        self.playback_marker_sec = 0
+        self.playback_start_time_monotonic = None
+        self.progress_var.set(0)
+        self._schedule_streaming_progress_update()
+        self._update_ui_for_playback_state()
+
+    def _mark_playback_started(self):
+        timeline, self.playback_timeline = self.playback_timeline, None
+        if timeline is not None: timeline.mark(MARK_PLAYBACK_STARTED)
+
+    def _release_playback_timeline(self):
+        # 播放没有开始 (停止、出错) 时不再等待，直接提交时间线
+        timeline, self.playback_timeline = self.playback_timeline, None
+        if timeline is not None: timeline.stop_waiting()
+
+    def _abort_streaming_playback(self):
+        self._release_playback_timeline()
+        if self.stream_player is None: return
+        self.stream_player.stop()
+        self.stream_player = None
+        if self.progress_updater_id: self.master.after_cancel(self.progress_updater_id); self.progress_updater_id = None
+
+    def _schedule_streaming_progress_update(self):
+        if self.progress_updater_id: self.master.after_cancel(self.progress_updater_id); self.progress_updater_id = None
+        player = self.stream_player
+        if player is None or self.playback_state not in ("playing", "paused"): return
+        try:
+            player.pump()
+        except pygame.error as e:
+            self._abort_streaming_playback()
+            messagebox.showerror("播放错误", f"流式播放失败: {e}", parent=self.master)
+            self._update_status(f"播放错误: {e}"); self.playback_state = "idle"
+            self._update_ui_for_playback_state(); return
+        if player.is_done():
+            # 流式播放结束后释放播放器，之后的重播直接使用缓存中的完整文件
+            self.stream_player = None
+            self._on_stop_button_click()
+            return
+        buffered_sec = player.buffered_duration_sec
+        position_sec = player.position_sec()
+        self.progress_bar.config(to=max(buffered_sec, 0.01))
+        self.progress_var.set(position_sec)
+        total_label = self._format_time(buffered_sec) + ("" if player.input_finished else "+")
+        if player.started: self._mark_playback_started()
+        if not player.started: self.time_label_var.set(f"缓冲中... / {total_label}")
+        else: self.time_label_var.set(f"{self._format_time(position_sec)} / {total_label}")
+        self.progress_updater_id = self.master.after(50, self._schedule_streaming_progress_update)
 
     def _start_playback_after_synthesis(self, is_newly_synthesized=False):
-        if self.synthesized_audio_filepath and os.path.exists(self.synthesized_audio_filepath) and self.pygame_initialized:
+        if self._has_playable_audio() and self.pygame_initialized:
             try:
-                pygame.mixer.music.load(self.synthesized_audio_filepath)
-                pygame.mixer.music.play()
+                self._stop_buffer_player()
+                player = self._create_buffer_player()
+                if player is not None:
+                    player.play()
+                    self.buffer_player = player
+                    self.total_audio_duration_sec = player.duration_sec
+                else:
+                    self._load_music()
+                    pygame.mixer.music.play()
+                    self._clear_music_end_events()
+                self._mark_playback_started()
                 self.playback_state = "playing"
                 self.playback_marker_sec = 0 
                 self.playback_start_time_monotonic = time.monotonic()
@@ -820,15 +1608,36 @@ class TextToSpeechApp:
                 self.progress_var.set(0)
                 self._schedule_progress_update()
             except pygame.error as e:
+                self._release_playback_timeline()
                 messagebox.showerror("播放错误", f"无法播放音频文件: {e}", parent=self.master)
                 self._update_status(f"播放错误: {e}"); self.playback_state = "idle"; self._cleanup_temp_file()
-        else: self.playback_state = "idle" 
+        else:
+            self._release_playback_timeline()
+            self.playback_state = "idle" 
         self._update_ui_for_playback_state()
 
     def _on_play_pause_button_click(self):
-        if not self.pygame_initialized: messagebox.showwarning("播放错误", "Pygame未能正确初始化。", parent=self.master); return
+        if not self._ensure_audio(): messagebox.showwarning("播放错误", "Pygame未能正确初始化。", parent=self.master); return
         current_params = self._get_current_synthesis_params()
-        if self.playback_state == "playing": 
+        if self.playback_state == "playing" and self.stream_player is not None:
+            self.stream_player.pause()
+            self.playback_state = "paused"
+            self._update_status("已暂停。")
+        elif self.playback_state == "paused" and self.stream_player is not None:
+            self.stream_player.resume()
+            self.playback_state = "playing"
+            self._update_status("继续播放...")
+        elif self.playback_state == "playing" and self.buffer_player is not None:
+            self.buffer_player.pause()
+            self.playback_state = "paused"
+            if self.progress_updater_id: self.master.after_cancel(self.progress_updater_id); self.progress_updater_id = None
+            self._update_status("已暂停。")
+        elif self.playback_state == "paused" and self.buffer_player is not None:
+            self.buffer_player.resume()
+            self.playback_state = "playing"
+            self._schedule_progress_update()
+            self._update_status("继续播放...")
+        elif self.playback_state == "playing": 
             if pygame.mixer.music.get_busy(): pygame.mixer.music.pause()
             self.playback_state = "paused"
             if self.progress_updater_id: self.master.after_cancel(self.progress_updater_id); self.progress_updater_id = None
@@ -844,33 +1653,68 @@ class TextToSpeechApp:
             self._schedule_progress_update()
             self._update_status("继续播放...")
         elif self.playback_state == "idle" or self.playback_state == "stopped_by_user": 
-            needs_resynthesis = True 
-            if self.synthesized_audio_filepath and os.path.exists(self.synthesized_audio_filepath) and \
-               not self.text_modified_flag:
-                if all(current_params.get(k) == self.last_synthesis_params.get(k) for k in ["lang", "voice", "role", "style", "rate", "subscription_key", "service_region"]) and \
-                   current_params["text"] == self.last_synthesis_params.get("text"):
-                    needs_resynthesis = False
-            if not needs_resynthesis:
-                self._update_status("播放已缓存音频...")
+            cached_path = None
+            if self.synthesis_cache and self._get_common_synthesis_inputs(for_playback=True):
+                cache_key = self._get_cache_key_for_params(current_params)
+                cached_path = self.synthesis_cache.get(cache_key)
+                if cached_path:
+                    if self.synthesized_audio_filepath != cached_path or self.synthesized_audio_bytes is not None: self._cleanup_temp_file()
+                    entry = self.synthesis_cache.get_entry(cache_key) or {}
+                    self.synthesized_audio_filepath = cached_path
+                    if self.in_memory_playback:
+                        # 读入内存后缓存文件不会被 pygame 占用，淘汰时可以直接删除
+                        try:
+                            with open(cached_path, 'rb') as f: self.synthesized_audio_bytes = f.read()
+                        except OSError as e: print(f"警告: 读取缓存音频失败，将直接从文件播放。错误: {e}")
+                    self.total_audio_duration_sec = entry.get("duration_sec", 0)
+                    self.last_synthesis_params = current_params
+                    self.text_modified_flag = False
+            if cached_path:
+                self.playback_timeline = self.metrics.new_timeline("playback", chars=len(current_params["text"]))
+                self.playback_timeline.wait_for(MARK_PLAYBACK_STARTED)
+                self.playback_timeline.finish("cached")
+                self._update_status(f"播放已缓存音频... ({self._format_cache_stats()})")
                 self._start_playback_after_synthesis(is_newly_synthesized=False)
             else: 
-                if not self._get_common_synthesis_inputs(for_playback=True):
+                common_inputs = self._get_common_synthesis_inputs(for_playback=True)
+                if not common_inputs:
                     self._update_status("输入不完整，无法播放。")
                     self.playback_state = "idle" 
                     self._update_ui_for_playback_state()
                     return
+                self._cancel_pending_prefetch()
+                cache_key = self._get_cache_key_for_params(current_params)
+                if self.prefetcher.is_inflight(cache_key):
+                    # 同一文本正在后台预合成：等它完成后再点一次播放，直接命中缓存
+                    self._update_status("正在完成后台预合成...")
+                    self.playback_state = "synthesizing"
+                    self.synthesis_in_progress = True
+                    threading.Thread(target=self._wait_for_prefetch_then_play, args=(cache_key,), daemon=True).start()
+                    self._update_ui_for_playback_state()
+                    return
+                self.prefetcher.cancel()
                 self._update_status("准备合成新音频...")
                 self.total_audio_duration_sec = 0; self.progress_var.set(0) 
                 self.time_label_var.set("00:00 / 00:00")
                 self.last_synthesis_params = {} 
-                threading.Thread(target=self._synthesize_audio_to_file_thread, daemon=True).start()
+                use_streaming = self.streaming_supported and bool(self.streaming_playback_var.get())
+                self.synthesis_executor.submit(
+                    "playback", lambda job: self._synthesize_audio_to_file_thread(job, current_params, common_inputs, use_streaming),
+                    key=("playback", cache_key, use_streaming), supersede=True, description=f"{len(current_params['text'])} 字符")
         self._update_ui_for_playback_state()
 
     def _on_stop_button_click(self):
+        # 正在进行的播放合成一并取消 (stop_speaking_async)，不再为已经不需要的音频付费
+        self.synthesis_executor.cancel_kind("playback")
         if not self.pygame_initialized: return
+        self._release_playback_timeline()
         if self.progress_updater_id: 
             self.master.after_cancel(self.progress_updater_id)
             self.progress_updater_id = None
+        if self.stream_player is not None:
+            self.stream_player.stop()
+            self.stream_player = None
+        self._stop_buffer_player()
         if pygame.mixer.get_init() and pygame.mixer.music.get_busy():
             pygame.mixer.music.stop()
             pygame.mixer.music.unload() 
@@ -882,22 +1726,74 @@ class TextToSpeechApp:
         self._update_status("已停止。")
         self._update_ui_for_playback_state()
 
+    def _music_end_event_received(self):
+        try: return bool(pygame.event.get(music_end_event()))
+        except pygame.error: return False # 事件系统不可用时只能依赖 get_busy()
+
+    def _clear_music_end_events(self):
+        # stop()/重新 load 也会发出结束事件，开始播放后丢弃这些旧事件
+        try: pygame.event.clear(music_end_event())
+        except pygame.error: pass
+
+    def _progress_interval_ms(self, max_ms=None):
+        width_px = self.progress_bar.winfo_width() if self.progress_bar.winfo_ismapped() else 0
+        if max_ms is None: return progress_interval_ms(self.total_audio_duration_sec, width_px)
+        return progress_interval_ms(self.total_audio_duration_sec, width_px, max_ms=max_ms)
+
+    def _show_progress(self, position_sec):
+        # 只有进度条像素位置或时间标签文本变化时才写入 Tk 变量
+        width_px = max(1, self.progress_bar.winfo_width())
+        pixel = int(position_sec / self.total_audio_duration_sec * width_px) if self.total_audio_duration_sec > 0 else 0
+        label = f"{self._format_time(position_sec)} / {self._format_time(self.total_audio_duration_sec)}"
+        shown_pixel, shown_label = self._shown_progress
+        if pixel != shown_pixel: self.progress_var.set(position_sec)
+        if label != shown_label: self.time_label_var.set(label)
+        self._shown_progress = (pixel, label)
+
     def _schedule_progress_update(self):
         if self.progress_updater_id: self.master.after_cancel(self.progress_updater_id); self.progress_updater_id = None
-        if self.playback_state == "playing" and self.pygame_initialized and pygame.mixer.music.get_busy() and not self.is_user_seeking and self.playback_start_time_monotonic is not None:
-            elapsed_time_sec = time.monotonic() - self.playback_start_time_monotonic
-            current_display_time_sec = self.playback_marker_sec + elapsed_time_sec
-            current_display_time_sec = max(0, min(current_display_time_sec, self.total_audio_duration_sec if self.total_audio_duration_sec > 0 else float('inf')))
-            self.progress_var.set(current_display_time_sec)
-            self.time_label_var.set(f"{self._format_time(current_display_time_sec)} / {self._format_time(self.total_audio_duration_sec)}")
-            if self.total_audio_duration_sec > 0 and current_display_time_sec >= self.total_audio_duration_sec - 0.15: 
-                self.master.after(0, self._on_stop_button_click) 
-            else: self.progress_updater_id = self.master.after(100, self._schedule_progress_update)
-        elif self.playback_state == "playing" and self.pygame_initialized and not pygame.mixer.music.get_busy():
-            self.master.after(0, self._on_stop_button_click)
+        self._shown_progress = (None, None)
+        if self.buffer_player is not None:
+            self._update_buffer_playback_progress(); return
+        self._update_music_playback_progress()
+
+    def _update_music_playback_progress(self):
+        self.progress_updater_id = None
+        if self.playback_state != "playing" or not self.pygame_initialized or self.is_user_seeking: return
+        if self._music_end_event_received() or not pygame.mixer.music.get_busy():
+            # 以 mixer 的结束事件为准，不再按剩余时间猜测是否已播完
+            self.master.after(0, self._on_stop_button_click); return
+        if self.playback_start_time_monotonic is None: return
+        elapsed_time_sec = time.monotonic() - self.playback_start_time_monotonic
+        current_display_time_sec = self.playback_marker_sec + elapsed_time_sec
+        current_display_time_sec = max(0, min(current_display_time_sec, self.total_audio_duration_sec if self.total_audio_duration_sec > 0 else float('inf')))
+        self._show_progress(current_display_time_sec)
+        self.progress_updater_id = self.master.after(self._progress_interval_ms(), self._update_music_playback_progress)
+
+    def _update_buffer_playback_progress(self):
+        # 位置来自播放器已送出的采样，而不是墙上时钟的累加
+        self.progress_updater_id = None
+        player = self.buffer_player
+        if player is None or self.playback_state != "playing": return
+        try:
+            player.pump()
+        except pygame.error as e:
+            self._stop_buffer_player()
+            messagebox.showerror("播放错误", f"播放失败: {e}", parent=self.master)
+            self._update_status(f"播放错误: {e}"); self.playback_state = "idle"
+            self._update_ui_for_playback_state(); return
+        if player.is_done():
+            self.master.after(0, self._on_stop_button_click); return
+        if not self.is_user_seeking: self._show_progress(player.position_sec())
+        self.progress_updater_id = self.master.after(self._progress_interval_ms(player.max_pump_interval_ms), self._update_buffer_playback_progress)
 
     def _on_scale_press(self, event):
-        if self.playback_state in ["playing", "paused"] and self.total_audio_duration_sec > 0 and self.pygame_initialized and self.synthesized_audio_filepath and os.path.exists(self.synthesized_audio_filepath):
+        if self.stream_player is not None: return # 流式播放期间不支持拖动定位
+        if self.buffer_player is not None:
+            # 拖动期间继续播放，松开时再定位
+            if self.playback_state in ["playing", "paused"]: self.is_user_seeking = True
+            return
+        if self.playback_state in ["playing", "paused"] and self.total_audio_duration_sec > 0 and self.pygame_initialized and self._has_playable_audio():
             self.is_user_seeking = True
             if self.playback_state == "playing" and pygame.mixer.music.get_busy(): 
                 pygame.mixer.music.pause()
@@ -906,7 +1802,20 @@ class TextToSpeechApp:
                 self.playback_start_time_monotonic = None 
 
     def _on_scale_release(self, event):
-        if self.is_user_seeking and self.pygame_initialized and self.synthesized_audio_filepath and os.path.exists(self.synthesized_audio_filepath):
+        if self.buffer_player is not None and self.is_user_seeking:
+            self.is_user_seeking = False
+            seek_to_sec = max(0, min(self.progress_var.get(), self.total_audio_duration_sec))
+            try:
+                self.buffer_player.seek(seek_to_sec)
+            except pygame.error as e:
+                print(f"Error seeking audio: {e}")
+                messagebox.showerror("播放错误", f"音频定位失败: {e}", parent=self.master)
+            self.progress_var.set(seek_to_sec)
+            self.time_label_var.set(f"{self._format_time(seek_to_sec)} / {self._format_time(self.total_audio_duration_sec)}")
+            if self.playback_state == "playing": self._schedule_progress_update()
+            self._update_ui_for_playback_state()
+            return
+        if self.is_user_seeking and self.pygame_initialized and self._has_playable_audio():
             self.is_user_seeking = False
             seek_to_sec = self.progress_var.get()
             seek_to_sec = max(0, min(seek_to_sec, self.total_audio_duration_sec if self.total_audio_duration_sec > 0 else 0))
@@ -914,9 +1823,10 @@ class TextToSpeechApp:
                 should_be_playing_after_seek = (self.playback_state == "playing") or \
                                                (self.playback_state == "paused" and self.play_pause_button.cget("text") == "▶️ 继续") 
                 pygame.mixer.music.stop() 
-                pygame.mixer.music.load(self.synthesized_audio_filepath) 
+                self._load_music()
                 pygame.mixer.music.play() 
                 pygame.mixer.music.set_pos(seek_to_sec) 
+                self._clear_music_end_events()
                 self.playback_marker_sec = seek_to_sec 
                 self.playback_start_time_monotonic = time.monotonic()
                 self.progress_var.set(seek_to_sec) 
@@ -952,24 +1862,7 @@ class TextToSpeechApp:
         if not inputs: 
             self._update_status("输入不完整，无法保存MP3。")
             return 
-        self.play_pause_button.config(state=tk.DISABLED)
-        self.stop_button.config(state=tk.DISABLED)
-        self.save_mp3_button.config(state=tk.DISABLED) 
-        self.progress_bar.config(state=tk.DISABLED)
-        self._update_status("准备保存 MP3...")
-        threading.Thread(target=self.save_text_to_mp3, daemon=True).start()
-
-    def save_text_to_mp3(self):
-        inputs=self._get_common_synthesis_inputs()
-        if not inputs: 
-            self.master.after(0, lambda: self._update_status("输入错误，MP3保存取消。"))
-            self.master.after(0, self._update_ui_for_playback_state) 
-            return
-        
-        s_key, s_reg, txt_raw, lang, voice = inputs
-        role, style_val = self.role_var.get(), self.style_var.get()
-        rate_val = self.rate_var.get() 
-        
+        # 文件对话框必须在主线程中弹出，工作线程只负责取得音频和写文件
         actual_filepath = filedialog.asksaveasfilename(
             defaultextension=".mp3", 
             filetypes=[("MP3 audio file","*.mp3"),("All files","*.*")], 
@@ -977,43 +1870,99 @@ class TextToSpeechApp:
             initialdir=self.script_dir, 
             parent=self.master 
         )
-        
         if not actual_filepath: 
-            self.master.after(0, lambda: self._update_status("MP3保存已取消"))
-            self.master.after(0, self._update_ui_for_playback_state)
+            self._update_status("MP3保存已取消")
+            return
+        current_params = self._get_current_synthesis_params()
+        # 刚播放过的同一段音频即使没能写入缓存，也可以直接拿来本地编码
+        wav_path = wav_data = None
+        if current_params == self.last_synthesis_params and not self.text_modified_flag and self._has_playable_audio():
+            wav_data = self.synthesized_audio_bytes
+            wav_path = None if wav_data else self.synthesized_audio_filepath
+        job, coalesced = self.synthesis_executor.submit(
+            "export", lambda job: self.save_text_to_mp3(job, inputs, current_params, actual_filepath, wav_path, wav_data),
+            key=("export", self._get_cache_key_for_params(current_params), os.path.abspath(actual_filepath)),
+            description=os.path.basename(actual_filepath))
+        if coalesced:
+            self._update_status(f"相同的导出已在进行中 (任务 #{job.id})。")
             return
+        self.play_pause_button.config(state=tk.DISABLED)
+        self.stop_button.config(state=tk.DISABLED)
+        self.save_mp3_button.config(state=tk.DISABLED) 
+        self.progress_bar.config(state=tk.DISABLED)
+        self._update_status(f"正在保存到 {os.path.basename(actual_filepath)}...")
 
-        self.master.after(0, lambda p=actual_filepath: self._update_status(f"正在保存到 {os.path.basename(p)}..."))
-        ssml = self._build_ssml(txt_raw, lang, voice, role, style_val, rate_val) 
+    def save_text_to_mp3(self, job, inputs, current_params, actual_filepath, wav_path=None, wav_data=None):
+        s_key, s_reg, txt_raw, lang, voice = inputs
+        ssml = self._build_ssml(txt_raw, lang, voice, current_params["role"], current_params["style"], current_params["rate"]) 
+        backend = self._get_backend(s_key, s_reg)
+        timeline = self.metrics.new_timeline("export", chars=len(txt_raw))
+        longform_min_chars = self.synthesis_settings["longform_min_chars"]
+        longform = bool(longform_min_chars) and len(txt_raw) >= longform_min_chars
+        resume_hint = "\n\n已完成的部分已保存，再次导出到同一文件时将从中断处继续。" if longform else ""
+        def synthesize_mp3():
+            self._update_status("未找到可复用的音频，正在合成 MP3...")
+            return self._call_for_job(job, timeline, lambda: backend.synthesize(ssml, MP3_FORMAT_NAME, on_event=timeline.on_synthesis_event, cancel_scope=job),
+                                      chars=len(ssml))
         try:
-            speech_config = speechsdk.SpeechConfig(subscription=s_key, region=s_reg)
-            speech_config.set_speech_synthesis_output_format(speechsdk.SpeechSynthesisOutputFormat.Audio16Khz64KBitRateMonoMp3)
-            audio_config = speechsdk.audio.AudioOutputConfig(filename=actual_filepath)
-            file_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-            result = file_synthesizer.speak_ssml_async(ssml).get()
-            
-            if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-                self.master.after(0, lambda p=actual_filepath: [
-                    self._update_status(f"成功保存到 {os.path.basename(p)}"),
-                    messagebox.showinfo("保存成功", f"语音已成功保存到:\n{p}", parent=self.master)
-                ])
-            elif result.reason == speechsdk.ResultReason.Canceled:
-                details=result.cancellation_details
-                msg=f"MP3保存取消: {details.reason}\n" + (f"错误详情: {details.error_details}" if details.reason==speechsdk.CancellationReason.Error and details.error_details else "")
-                self.master.after(0, lambda m=msg, r=details.reason: [
-                    messagebox.showerror("保存错误", m, parent=self.master),
-                    self._update_status(f"MP3保存错误: {r}")
-                ])
-            else: 
-                self.master.after(0, lambda r=result.reason: self._update_status(f"MP3保存遇到问题: {r}"))
-            del file_synthesizer
+            if longform:
+                stats = self._export_longform_mp3(job, backend, timeline, txt_raw, lang, voice, current_params, actual_filepath)
+                outcome = "ok"
+                how = f"长篇导出，{stats['chapters']} 章 {stats['segments']} 段" + (f"，其中 {stats['resumed']} 段来自上次中断的导出" if stats["resumed"] else "")
+            else:
+                mp3_bytes, source = obtain_mp3_audio(self.synthesis_cache, ssml, backend.cache_namespace, synthesize_mp3,
+                                                    wav_path=wav_path, wav_data=wav_data)
+                job.check_cancelled()
+                with open(actual_filepath, 'wb') as f: f.write(mp3_bytes)
+                outcome = "ok" if source == EXPORT_SOURCE_SERVICE else "cached"
+                how = EXPORT_SOURCE_LABELS[source]
+                print(f"Debug: MP3 导出来源: {source}")
+            timeline.mark(MARK_FILE_WRITTEN)
+            timeline.finish(outcome)
+            self.ui_queue.post(lambda p=actual_filepath, how=how: [
+                self._update_status(f"成功保存到 {os.path.basename(p)} ({how})"),
+                messagebox.showinfo("保存成功", f"语音已成功保存到:\n{p}\n\n音频来源: {how}", parent=self.master)
+            ])
+        except JobCancelled:
+            timeline.finish("cancelled")
+            self._update_status("MP3保存已取消" + ("，已完成的段已保存" if longform else ""))
+        except SynthesisError as e_synth:
+            if job.is_cancelled():
+                timeline.finish("cancelled")
+                self._update_status("MP3保存已取消" + ("，已完成的段已保存" if longform else "")); return
+            timeline.finish("error", e_synth)
+            self.ui_queue.post(lambda m=str(e_synth) + resume_hint, r=e_synth.reason: [
+                messagebox.showerror("保存错误", m, parent=self.master),
+                self._update_status(f"MP3保存错误: {r if r else '未知'}")
+            ])
         except Exception as e:
-            self.master.after(0, lambda err=str(e): [
-                messagebox.showerror("发生严重错误", f"MP3保存失败: {err}", parent=self.master),
+            if job.is_cancelled():
+                # 取消时中止的写入或请求也可能以其他异常结束
+                timeline.finish("cancelled")
+                self._update_status("MP3保存已取消" + ("，已完成的段已保存" if longform else "")); return
+            timeline.finish("error", e)
+            self.ui_queue.post(lambda err=str(e): [
+                messagebox.showerror("发生严重错误", f"MP3保存失败: {err}{resume_hint}", parent=self.master),
                 self._update_status(f"MP3保存严重错误: {err}")
             ])
         finally: 
-            self.master.after(0, self._update_ui_for_playback_state)
+            self.ui_queue.post(self._update_ui_for_playback_state, key="ui_state")
+
+    def _export_longform_mp3(self, job, backend, timeline, txt_raw, lang, voice, current_params, actual_filepath):
+        # 长文本按章节和段导出，每段完成即保存到 "<文件名>.parts/" 并记入日志；失败或取消后再次导出到同一文件时从日志继续
+        role, style_val, rate_val = current_params["role"], current_params["style"], current_params["rate"]
+        segments = plan_longform(txt_raw, lambda piece: self._build_ssml(piece, lang, voice, role, style_val, rate_val),
+                                 MP3_FORMAT_NAME, backend.cache_namespace, self.synthesis_settings["longform_segment_chars"])
+        timeline.chunks = len(segments)
+        def obtain_segment(segment):
+            mp3_bytes, _ = obtain_mp3_audio(self.synthesis_cache, segment.ssml, backend.cache_namespace, lambda: self._call_for_job(
+                job, timeline, lambda: backend.synthesize(segment.ssml, MP3_FORMAT_NAME, on_event=timeline.on_synthesis_event, cancel_scope=job),
+                chars=len(segment.ssml)))
+            return mp3_bytes
+        def on_progress(done, total, resumed):
+            self._update_status(f"正在导出长篇 MP3... ({done}/{total} 段" + (f"，{resumed} 段来自上次导出)" if resumed else ")"))
+        return export_longform(actual_filepath, segments, obtain_segment, "mp3", max_workers=self.synthesis_settings["max_workers"],
+                               progress_callback=on_progress, check_cancelled=job.check_cancelled)
 
 if __name__ == "__main__":
     root = tk.Tk()
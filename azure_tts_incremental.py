@@ -0,0 +1,54 @@
+import threading
+
+from azure_tts_audio import PCM_CHANNELS, PCM_SAMPLE_RATE, PCM_SAMPLE_WIDTH, RAW_PCM_FORMAT_NAME
+from azure_tts_cache import SynthesisCache
+from azure_tts_synthesis import DEFAULT_SYNTHESIS_WORKERS, synthesize_chunks_streaming
+
+# 逐句缓存：每句的无头 PCM 以 "该句 SSML + 原始 PCM 格式 + 命名空间" 为键存入缓存。
+# 修改长文本中的一个词之后，只有改动过的句子需要重新合成，其余句子直接从缓存拼接。
+SENTENCE_CACHE_EXT = ".pcm"
+
+
+def sentence_cache_key(ssml, cache_namespace):
+    return SynthesisCache.make_key(ssml, RAW_PCM_FORMAT_NAME, cache_namespace)
+
+
+def uncached_sentences(cache, sentences, cache_namespace):
+    # sentences: [(文本, SSML)]；返回缓存中还没有的句子 (保持顺序)
+    if not cache: return list(sentences)
+    return [(text, ssml) for text, ssml in sentences if not cache.contains(sentence_cache_key(ssml, cache_namespace))]
+
+
+def synthesize_sentences_incremental(sentences, cache, cache_namespace, stream_fn, sink=None,
+                                     max_workers=DEFAULT_SYNTHESIS_WORKERS, progress_callback=None):
+    # sentences: [(文本, SSML)]。stream_fn(ssml, on_audio) -> 该句的完整 PCM (无头 16 kHz)。缓存命中的句子不调用 stream_fn；
+    # 所有句子的音频按顺序送入 sink (可为 None)。返回 (各句 PCM 列表, 统计)；chars_synthesized 只计文本，不含 SSML 标记
+    ssml_units = [ssml for _, ssml in sentences]
+    text_by_ssml = {ssml: text for text, ssml in sentences}
+    stats = {"sentences": len(ssml_units), "reused": 0, "synthesized": 0, "chars_synthesized": 0}
+    stats_lock = threading.Lock()
+    bytes_per_sec = PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH * PCM_CHANNELS
+
+    def run_sentence(ssml, on_audio):
+        key = sentence_cache_key(ssml, cache_namespace)
+        path = cache.get(key) if cache else None
+        if path:
+            try:
+                with open(path, 'rb') as f: pcm = f.read()
+                on_audio(pcm)
+                with stats_lock: stats["reused"] += 1
+                return pcm
+            except OSError as e:
+                print(f"警告: 读取句子缓存失败，将重新合成。错误: {e}")
+        pcm = stream_fn(ssml, on_audio)
+        with stats_lock:
+            stats["synthesized"] += 1
+            stats["chars_synthesized"] += len(text_by_ssml[ssml])
+        if cache:
+            try: cache.put_bytes(key, pcm, duration_sec=len(pcm) / bytes_per_sec, ext=SENTENCE_CACHE_EXT)
+            except OSError as e: print(f"警告: 无法将句子音频写入缓存。错误: {e}")
+        return pcm
+
+    parts = synthesize_chunks_streaming(ssml_units, run_sentence, sink if sink is not None else (lambda data: None),
+                                        max_workers=max_workers, progress_callback=progress_callback)
+    return parts, stats
@@ -0,0 +1,204 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from azure_tts_audio import WavFormatError, build_wav_header, parse_wav
+from azure_tts_cache import SynthesisCache
+from azure_tts_ssml import split_text_into_chunks
+
+# 长篇导出 (有声书)：文本先按章节、再按长度切成段，每段合成后立即保存到 "<输出文件>.parts/" 目录并记入日志 journal.jsonl。
+# 中途失败或取消后重新导出同一文件时，日志中已完成且文件完好的段直接跳过；全部完成后按顺序合并到临时文件，
+# 再原子地替换目标文件，最后删除工作目录。段文件以 SSML 的缓存键命名，修改后面的章节不影响前面已完成的段
+DEFAULT_LONGFORM_MIN_CHARS = 5000 # 超过该长度的导出走长篇导出
+DEFAULT_LONGFORM_SEGMENT_CHARS = 1500
+LONGFORM_WORK_DIR_SUFFIX = ".parts"
+LONGFORM_JOURNAL_FILE_NAME = "journal.jsonl"
+LONGFORM_JOURNAL_VERSION = 1
+
+_CHAPTER_HEADING_RE = re.compile(r"^\s*(第\s*[0-9零〇一二两三四五六七八九十百千万]+\s*[章节回卷部篇集]|chapter\s+[0-9ivxlcdm]+\b|#{1,6}\s)", re.IGNORECASE)
+
+
+class LongFormSegment:
+    def __init__(self, index, chapter, text, ssml, key):
+        self.index = index
+        self.chapter = chapter
+        self.text = text
+        self.ssml = ssml
+        self.key = key
+
+
+def split_into_chapters(text):
+    # 以 "第一章"、"Chapter 3"、"# 标题" 这类行作为新章节的开始；没有章节标题时整篇是一章
+    chapters = []
+    current = []
+    for line in (text or "").splitlines():
+        if _CHAPTER_HEADING_RE.match(line) and any(l.strip() for l in current):
+            chapters.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if any(l.strip() for l in current): chapters.append("\n".join(current).strip())
+    return chapters
+
+
+def plan_longform(text, build_segment_ssml, output_format_name, cache_namespace, segment_chars=DEFAULT_LONGFORM_SEGMENT_CHARS):
+    # build_segment_ssml(文本) -> SSML。段不跨章节，保证每章从新的一段开始
+    segments = []
+    for chapter_idx, chapter in enumerate(split_into_chapters(text), start=1):
+        for piece in split_text_into_chunks(chapter, segment_chars):
+            ssml = build_segment_ssml(piece)
+            segments.append(LongFormSegment(len(segments), chapter_idx, piece, ssml,
+                                            SynthesisCache.make_key(ssml, output_format_name, cache_namespace)))
+    return segments
+
+
+def longform_work_dir(output_path):
+    return os.path.abspath(output_path) + LONGFORM_WORK_DIR_SUFFIX
+
+
+class ExportJournal:
+    # 只追加的 JSONL 日志：第一行记录版本，之后每完成一段追加一行 {"key", "file", "bytes", "chapter", "chars", "at"}。
+    # 每行写入后 fsync；进程在写入中途退出时最后一行可能不完整，读取时忽略
+    def __init__(self, work_dir):
+        self.work_dir = work_dir
+        self.path = os.path.join(work_dir, LONGFORM_JOURNAL_FILE_NAME)
+        self._lock = threading.Lock()
+
+    def load(self):
+        # 返回 {key: 段文件路径}，只包含文件仍然存在且大小与记录一致的段
+        completed = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f: lines = f.readlines()
+        except FileNotFoundError:
+            return completed
+        except OSError as e:
+            print(f"警告: 无法读取导出日志 '{self.path}'，将重新合成全部内容。错误: {e}")
+            return completed
+        for line in lines:
+            try: entry = json.loads(line)
+            except ValueError: continue
+            if not isinstance(entry, dict) or "key" not in entry: continue
+            path = os.path.join(self.work_dir, os.path.basename(entry.get("file", "")))
+            try:
+                if os.path.getsize(path) == entry.get("bytes"): completed[entry["key"]] = path
+            except OSError:
+                pass
+        return completed
+
+    def record(self, segment, file_path, size):
+        entry = {"key": segment.key, "file": os.path.basename(file_path), "bytes": size, "chapter": segment.chapter,
+                 "chars": len(segment.text), "at": round(time.time(), 3)}
+        with self._lock:
+            is_new = not os.path.exists(self.path)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                if is_new: f.write(json.dumps({"version": LONGFORM_JOURNAL_VERSION}) + "\n")
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def _write_segment_file(work_dir, segment, data, ext):
+    path = os.path.join(work_dir, f"{segment.key}{ext}")
+    fd, tmp_path = tempfile.mkstemp(suffix=".part", prefix=".segment_", dir=work_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+    return path
+
+
+def merge_segment_files(paths, output_path, container):
+    # 按顺序流式合并到输出目录中的临时文件，完成后原子替换目标文件；WAV 先写占位头，最后回填数据长度
+    out_dir = os.path.dirname(os.path.abspath(output_path))
+    fd, tmp_path = tempfile.mkstemp(suffix=".part", prefix=".azure_tts_", dir=out_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            if container == "wav":
+                first_info = None
+                total = 0
+                out.write(build_wav_header(0))
+                for idx, path in enumerate(paths):
+                    with open(path, 'rb') as f: info, pcm = parse_wav(f.read())
+                    if first_info is None:
+                        first_info = info
+                    elif not first_info.same_format(info):
+                        raise WavFormatError(f"第 {idx + 1} 段音频格式 {info} 与第一段 {first_info} 不一致")
+                    out.write(pcm)
+                    total += len(pcm)
+                out.seek(0)
+                out.write(build_wav_header(total, first_info.sample_rate, first_info.channels, first_info.sample_width))
+            else:
+                for path in paths:
+                    with open(path, 'rb') as f: shutil.copyfileobj(f, out)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+
+def export_longform(output_path, segments, obtain_segment, container, max_workers=1, progress_callback=None, check_cancelled=None, keep_parts=False):
+    # obtain_segment(段) -> 该段的音频字节 (可以来自缓存)；progress_callback(已完成, 总数, 跳过数) 可选；
+    # check_cancelled() 在每段开始前调用，取消时应抛出异常。一段失败后不再开始新的段，正在进行的段完成后照常记入日志，
+    # 然后抛出第一个错误；再次调用时从日志继续
+    work_dir = longform_work_dir(output_path)
+    os.makedirs(work_dir, exist_ok=True)
+    journal = ExportJournal(work_dir)
+    completed = journal.load()
+    ext = "." + container
+    paths = {seg.key: completed[seg.key] for seg in segments if seg.key in completed}
+    skipped = len({seg.key for seg in segments if seg.key in completed})
+    pending = []
+    seen = set(paths)
+    for seg in segments:
+        if seg.key not in seen:
+            seen.add(seg.key); pending.append(seg)
+    total = len(paths) + len(pending)
+    if skipped: print(f"Debug: 长篇导出从日志继续：{skipped}/{total} 段已完成。")
+    if progress_callback: progress_callback(len(paths), total, skipped)
+
+    lock = threading.Lock()
+    failed = threading.Event()
+    def run_segment(seg):
+        if failed.is_set(): return
+        if check_cancelled: check_cancelled()
+        data = obtain_segment(seg)
+        path = _write_segment_file(work_dir, seg, data, ext)
+        journal.record(seg, path, len(data))
+        with lock:
+            paths[seg.key] = path
+            done = len(paths)
+        if progress_callback: progress_callback(done, total, skipped)
+
+    first_error = None
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="tts_longform") as executor:
+        queue = list(pending)
+        running = set()
+        while queue or running:
+            while queue and len(running) < max(1, max_workers) and not failed.is_set():
+                running.add(executor.submit(run_segment, queue.pop(0)))
+            if not running: break
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                exc = future.exception()
+                if exc is not None and first_error is None:
+                    first_error = exc
+                    failed.set()
+    if first_error is not None:
+        print(f"Debug: 长篇导出中断，已完成 {len(paths)}/{total} 段，再次导出同一文件时将从日志继续。")
+        raise first_error
+
+    merge_segment_files([paths[seg.key] for seg in segments], output_path, container)
+    if not keep_parts: shutil.rmtree(work_dir, ignore_errors=True)
+    return {"segments": len(segments), "unique_segments": total, "resumed": skipped,
+            "chapters": len({seg.chapter for seg in segments})}
@@ -0,0 +1,300 @@
+from collections import deque
+import itertools
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+from azure_tts_synthesis import (SYNTHESIS_EVENT_AUDIO, SYNTHESIS_EVENT_CANCELED, SYNTHESIS_EVENT_COMPLETED,
+                                 SYNTHESIS_EVENT_STARTED)
+
+DEFAULT_METRICS_WINDOW_SEC = 15 * 60
+DEFAULT_METRICS_MAX_SAMPLES = 2000
+DEFAULT_RECENT_TIMELINES = 50
+DEFAULT_SLOW_REQUEST_SEC = 10.0 # 不逐条输出时，只输出失败或超过该耗时的请求
+
+# 时间线上的标记点，全部相对于 queued (请求进入工作线程的时刻)
+MARK_QUEUED = "queued"
+MARK_DISPATCHED = "dispatched"          # 调度器放行，请求真正发出
+MARK_CONNECTED = "connected"            # synthesis_started：服务已接受请求
+MARK_FIRST_AUDIO = "first_audio"        # 第一个 synthesizing 事件
+MARK_LAST_AUDIO = "last_audio"          # 最后一段的 synthesis_completed
+MARK_FILE_WRITTEN = "file_written"
+MARK_PLAYBACK_STARTED = "playback_started"
+
+# 阶段 = (起点, 终点)；起点或终点缺失的阶段不计入统计
+STAGES = (
+    ("queue_wait", MARK_QUEUED, MARK_DISPATCHED),
+    ("connect", MARK_DISPATCHED, MARK_CONNECTED),
+    ("first_audio", MARK_DISPATCHED, MARK_FIRST_AUDIO),
+    ("synthesis", MARK_FIRST_AUDIO, MARK_LAST_AUDIO),
+    ("file_write", MARK_LAST_AUDIO, MARK_FILE_WRITTEN),
+    ("playback_start", MARK_QUEUED, MARK_PLAYBACK_STARTED),
+    ("total", MARK_QUEUED, None),
+)
+STAGE_NAMES = tuple(name for name, _, _ in STAGES)
+
+# Prometheus 直方图的桶上限 (秒)
+HISTOGRAM_BUCKETS_SEC = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_request_ids = itertools.count(1)
+
+
+class SynthesisTimeline:
+    # 一次合成请求的时间线。可在任意线程中打点；finish() 之后如果还在等待某个标记
+    # (例如播放开始)，会等它到达或 stop_waiting() 被调用时才提交给 MetricsRegistry
+    def __init__(self, registry, kind, chars=0, chunks=1):
+        self.registry = registry
+        self.request_id = next(_request_ids)
+        self.kind = kind
+        self.chars = chars
+        self.chunks = chunks
+        self.started_at = time.time()
+        self._t0 = time.monotonic()
+        self.marks = {MARK_QUEUED: 0.0}
+        self.retries = 0
+        self.outcome = None
+        self.error = None
+        self.ended_offset = None
+        self._waiting_for = None
+        self._recorded = False
+        self._lock = threading.Lock()
+
+    def _offset(self):
+        return time.monotonic() - self._t0
+
+    def mark(self, name, keep_first=True):
+        # keep_first=False 用于“最后一次”类标记 (例如多段合成中最后一段完成)
+        with self._lock:
+            if keep_first and name in self.marks: return
+            self.marks[name] = self._offset()
+        self._maybe_record()
+
+    def on_dispatch(self, attempt):
+        if attempt:
+            with self._lock: self.retries += 1
+        self.mark(MARK_DISPATCHED)
+
+    def on_synthesis_event(self, name, info=None):
+        if name == SYNTHESIS_EVENT_STARTED: self.mark(MARK_CONNECTED)
+        elif name == SYNTHESIS_EVENT_AUDIO: self.mark(MARK_FIRST_AUDIO)
+        elif name == SYNTHESIS_EVENT_COMPLETED: self.mark(MARK_LAST_AUDIO, keep_first=False)
+        elif name == SYNTHESIS_EVENT_CANCELED:
+            with self._lock: self.error = self.error or "canceled"
+
+    def wait_for(self, name):
+        with self._lock: self._waiting_for = name
+
+    def stop_waiting(self):
+        with self._lock: self._waiting_for = None
+        self._maybe_record()
+
+    def finish(self, outcome="ok", error=None):
+        with self._lock:
+            if self.outcome is not None: return
+            self.outcome = outcome
+            if error: self.error = str(error).splitlines()[0][:200]
+            self.ended_offset = self._offset()
+            if outcome != "ok": self._waiting_for = None
+        self._maybe_record()
+
+    def _maybe_record(self):
+        with self._lock:
+            if self._recorded or self.outcome is None: return
+            if self._waiting_for is not None and self._waiting_for not in self.marks: return
+            self._recorded = True
+        if self.registry is not None: self.registry.record(self)
+
+    def stage_durations(self):
+        with self._lock: marks = dict(self.marks); ended = self.ended_offset
+        end_of_request = max([ended or 0.0] + list(marks.values()))
+        durations = {}
+        for stage, start, end in STAGES:
+            end_value = end_of_request if end is None else marks.get(end)
+            if start in marks and end_value is not None and end_value >= marks[start]:
+                durations[stage] = end_value - marks[start]
+        return durations
+
+    def to_dict(self):
+        with self._lock: marks = dict(self.marks)
+        return {
+            "request_id": self.request_id,
+            "kind": self.kind,
+            "started_at": round(self.started_at, 3),
+            "chars": self.chars,
+            "chunks": self.chunks,
+            "retries": self.retries,
+            "outcome": self.outcome,
+            "error": self.error,
+            "marks_ms": {k: round(v * 1000, 1) for k, v in sorted(marks.items(), key=lambda kv: kv[1])},
+            "stages_ms": {k: round(v * 1000, 1) for k, v in self.stage_durations().items()},
+        }
+
+
+def nearest_rank(sorted_values, pct):
+    # 最近秩法分位数：第 ceil(pct/100 * n) 个值 (从 1 开始)；输入必须已排序。先乘后除，避免浮点误差多进一位
+    if not sorted_values: return None
+    rank = max(1, min(len(sorted_values), math.ceil(pct * len(sorted_values) / 100)))
+    return sorted_values[rank - 1]
+
+
+class RollingHistogram:
+    # 最近 window_sec 秒内 (最多 max_samples 个) 的样本用于分位数；累计桶计数用于 Prometheus
+    def __init__(self, window_sec=DEFAULT_METRICS_WINDOW_SEC, max_samples=DEFAULT_METRICS_MAX_SAMPLES, buckets=HISTOGRAM_BUCKETS_SEC):
+        self.window_sec = window_sec
+        self._samples = deque(maxlen=max_samples)
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.total_count = 0
+        self.total_sum = 0.0
+
+    def observe(self, value_sec, now=None):
+        self._samples.append((now if now is not None else time.time(), value_sec))
+        self.total_count += 1
+        self.total_sum += value_sec
+        for i, upper in enumerate(self.buckets):
+            if value_sec <= upper: self.bucket_counts[i] += 1
+
+    def window_values(self, now=None):
+        cutoff = (now if now is not None else time.time()) - self.window_sec
+        while self._samples and self._samples[0][0] < cutoff: self._samples.popleft()
+        return sorted(v for _, v in self._samples)
+
+    def summary(self, now=None):
+        values = self.window_values(now)
+        if not values: return {"count": 0}
+        return {"count": len(values), "mean": sum(values) / len(values), "p50": nearest_rank(values, 50), "p90": nearest_rank(values, 90),
+                "p99": nearest_rank(values, 99), "max": values[-1]}
+
+
+class MetricsRegistry:
+    # log_requests=True 时每个请求在标准输出打印一行分阶段耗时；否则只打印失败和慢请求 (批量和服务模式下避免刷屏)
+    def __init__(self, window_sec=DEFAULT_METRICS_WINDOW_SEC, jsonl_path=None, prometheus_path=None, recent_limit=DEFAULT_RECENT_TIMELINES,
+                 log_requests=False, slow_request_sec=DEFAULT_SLOW_REQUEST_SEC):
+        self.window_sec = window_sec
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.log_requests = log_requests
+        self.slow_request_sec = slow_request_sec
+        self.histograms = {}
+        self.request_counts = {}
+        self.recent = deque(maxlen=recent_limit)
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+
+    def configure(self, window_sec=None, jsonl_path=None, prometheus_path=None):
+        with self._lock:
+            if window_sec is not None:
+                self.window_sec = window_sec
+                for histogram in self.histograms.values(): histogram.window_sec = window_sec
+            self.jsonl_path = jsonl_path or None
+            self.prometheus_path = prometheus_path or None
+
+    def new_timeline(self, kind, chars=0, chunks=1):
+        return SynthesisTimeline(self, kind, chars, chunks)
+
+    def record(self, timeline):
+        now = time.time()
+        durations = timeline.stage_durations()
+        entry = timeline.to_dict()
+        with self._lock:
+            count_key = (timeline.kind, timeline.outcome or "unknown")
+            self.request_counts[count_key] = self.request_counts.get(count_key, 0) + 1
+            if timeline.outcome in ("ok", "cached"):
+                for stage, value in durations.items():
+                    histogram = self.histograms.get((timeline.kind, stage))
+                    if histogram is None:
+                        histogram = self.histograms[(timeline.kind, stage)] = RollingHistogram(self.window_sec)
+                    histogram.observe(value, now)
+            self.recent.appendleft(entry)
+            jsonl_path, prometheus_path = self.jsonl_path, self.prometheus_path
+        total_ms = max(entry["marks_ms"].values(), default=0.0)
+        if self.log_requests or timeline.outcome == "error" or total_ms >= self.slow_request_sec * 1000:
+            stages_text = ", ".join(f"{k} {v:.0f}ms" for k, v in entry["stages_ms"].items())
+            print(f"Debug: 请求 #{timeline.request_id} ({timeline.kind}, {timeline.outcome}) 耗时: {stages_text}")
+        try:
+            if jsonl_path: self.append_jsonl(jsonl_path, [entry])
+            if prometheus_path: self.write_prometheus(prometheus_path)
+        except OSError as e:
+            print(f"警告: 无法写入延迟统计文件。错误: {e}")
+
+    def snapshot(self):
+        # {kind: {stage: summary}}，只包含当前窗口内有样本的阶段
+        now = time.time()
+        result = {}
+        with self._lock:
+            for (kind, stage), histogram in self.histograms.items():
+                summary = histogram.summary(now)
+                if summary["count"]: result.setdefault(kind, {})[stage] = summary
+        return result
+
+    def recent_timelines(self):
+        with self._lock: return list(self.recent)
+
+    def clear(self):
+        with self._lock:
+            self.histograms.clear()
+            self.request_counts.clear()
+            self.recent.clear()
+
+    def append_jsonl(self, path, entries):
+        with self._file_lock:
+            with open(path, 'a', encoding='utf-8') as f:
+                for entry in entries: f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP azure_tts_requests_total Synthesis requests by kind and outcome.",
+            "# TYPE azure_tts_requests_total counter",
+        ]
+        with self._lock:
+            for (kind, outcome), count in sorted(self.request_counts.items()):
+                lines.append(f'azure_tts_requests_total{{kind="{kind}",outcome="{outcome}"}} {count}')
+            lines += [
+                "# HELP azure_tts_stage_seconds Time spent in each stage of a synthesis request.",
+                "# TYPE azure_tts_stage_seconds histogram",
+            ]
+            for (kind, stage), histogram in sorted(self.histograms.items()):
+                labels = f'kind="{kind}",stage="{stage}"'
+                for upper, count in zip(histogram.buckets, histogram.bucket_counts):
+                    lines.append(f'azure_tts_stage_seconds_bucket{{{labels},le="{upper}"}} {count}')
+                lines.append(f'azure_tts_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram.total_count}')
+                lines.append(f'azure_tts_stage_seconds_sum{{{labels}}} {histogram.total_sum:.6f}')
+                lines.append(f'azure_tts_stage_seconds_count{{{labels}}} {histogram.total_count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # 原子替换，供 node_exporter 的 textfile collector 等读取
+        text = self.prometheus_text()
+        with self._file_lock:
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", prefix="metrics_", dir=os.path.dirname(os.path.abspath(path)))
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f: f.write(text)
+                os.replace(tmp_path, path)
+            except OSError:
+                try: os.remove(tmp_path)
+                except OSError: pass
+                raise
+
+
+class StartupTimer:
+    # 记录启动过程中各步骤完成的时刻，用于发现拖慢首屏的步骤
+    def __init__(self, t0=None):
+        self._t0 = t0 if t0 is not None else time.perf_counter()
+        self.marks = []
+
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter() - self._t0))
+
+    def to_dict(self):
+        return {name: round(offset * 1000, 1) for name, offset in self.marks}
+
+    def summary_text(self):
+        parts = []
+        previous = 0.0
+        for name, offset in self.marks:
+            parts.append(f"{name} +{(offset - previous) * 1000:.0f}ms")
+            previous = offset
+        return f"{', '.join(parts)} (共 {previous * 1000:.0f}ms)"
@@ -0,0 +1,73 @@
+from azure_tts_audio import PCM_CHANNELS, PCM_SAMPLE_RATE, PCM_SAMPLE_WIDTH
+from azure_tts_ssml import build_packed_ssml
+from azure_tts_synthesis import SYNTHESIS_EVENT_BOOKMARK, SYNTHESIS_EVENT_STARTED
+
+# 大量短文本 (界面提示音、IVR 语句) 逐条合成时，耗时主要花在每个请求的往返和连接上。
+# 打包合成把同一语音的多条短文本放进一个 SSML，条目之间插入书签，按书签的音频偏移把返回的音频切回各条
+DEFAULT_PACK_MAX_CHARS = 1000
+DEFAULT_PACK_MAX_ITEMS = 50
+DEFAULT_PACK_GAP_MS = 200
+PACK_MARK_PREFIX = "item-"
+MIN_PACKED_CLIP_MS = 20
+
+
+class PackSplitError(Exception):
+    pass
+
+
+def voice_params_key(voice_params):
+    p = voice_params
+    return (p["lang"], p["voice"], p["role"], p["style"], round(float(p["rate"]), 3))
+
+
+def plan_packs(entries, max_chars=DEFAULT_PACK_MAX_CHARS, max_items=DEFAULT_PACK_MAX_ITEMS):
+    # entries: [(文本, 语音参数)]。按语音参数分组，组内保持原顺序，依次装满 max_chars / max_items；
+    # 返回索引列表的列表。超过 max_chars 的条目单独成组 (由调用方按普通方式合成)
+    packs = []
+    open_packs = {} # 语音参数 -> (索引列表, 已用字符数)
+    for idx, (text, voice_params) in enumerate(entries):
+        if len(text) > max_chars:
+            packs.append([idx]); continue
+        key = voice_params_key(voice_params)
+        current = open_packs.get(key)
+        if current is not None and (len(current[0]) >= max_items or current[1] + len(text) > max_chars):
+            current = None
+        if current is None:
+            current = ([], 0)
+            packs.append(current[0])
+        current[0].append(idx)
+        open_packs[key] = (current[0], current[1] + len(text))
+    return packs
+
+
+def split_pcm_at_bookmarks(pcm, bookmarks, count, mark_prefix=PACK_MARK_PREFIX):
+    # bookmarks: [(书签名, 音频偏移毫秒)]。第 i 条 (i >= 1) 从书签 "item-i" 开始；缺少书签或偏移不递增时抛出 PackSplitError
+    frame_size = PCM_SAMPLE_WIDTH * PCM_CHANNELS
+    bytes_per_ms = PCM_SAMPLE_RATE * frame_size / 1000
+    offsets = {}
+    for mark, offset_ms in bookmarks:
+        if not (mark or "").startswith(mark_prefix): continue
+        try: offsets.setdefault(int(mark[len(mark_prefix):]), float(offset_ms))
+        except ValueError: continue
+    missing = [idx for idx in range(1, count) if idx not in offsets]
+    if missing: raise PackSplitError(f"缺少 {len(missing)} 个书签 (第一个: {mark_prefix}{missing[0]})")
+    bounds = [0] + [min(len(pcm), int(offsets[idx] * bytes_per_ms) // frame_size * frame_size) for idx in range(1, count)] + [len(pcm)]
+    min_clip_bytes = int(MIN_PACKED_CLIP_MS * bytes_per_ms)
+    for idx in range(count):
+        if bounds[idx + 1] - bounds[idx] < min_clip_bytes:
+            raise PackSplitError(f"第 {idx + 1} 条的音频过短 ({(bounds[idx + 1] - bounds[idx]) / bytes_per_ms:.0f} ms)，书签偏移可能有误")
+    return [pcm[bounds[idx]:bounds[idx + 1]] for idx in range(count)]
+
+
+def synthesize_pack(texts, voice_params, stream_fn, on_event=None, gap_ms=DEFAULT_PACK_GAP_MS):
+    # stream_fn(ssml, on_event) 发出一次请求并返回无头 PCM (通常是经过调度器的 backend.synthesize_with_events)。
+    # 返回与 texts 一一对应的 PCM 片段
+    p = voice_params
+    ssml = build_packed_ssml(texts, p["lang"], p["voice"], p["role"], p["style"], p["rate"], mark_prefix=PACK_MARK_PREFIX, gap_ms=gap_ms)
+    bookmarks = []
+    def on_pack_event(name, info):
+        if name == SYNTHESIS_EVENT_STARTED: bookmarks.clear() # 调度器重试时丢弃上一次尝试的书签
+        elif name == SYNTHESIS_EVENT_BOOKMARK: bookmarks.append((info.get("text"), info.get("audio_offset_ms", 0)))
+        if on_event: on_event(name, info)
+    pcm = stream_fn(ssml, on_pack_event)
+    return split_pcm_at_bookmarks(pcm, bookmarks, len(texts))
@@ -0,0 +1,295 @@
+import threading
+import time
+
+from azure_tts_audio import PCM_CHANNELS, PCM_SAMPLE_RATE, PCM_SAMPLE_WIDTH, WavFormatError, parse_wav
+
+DEFAULT_PREBUFFER_SEC = 0.3
+DEFAULT_BLOCK_SEC = 0.5
+MIN_PROGRESS_INTERVAL_MS = 50
+MAX_PROGRESS_INTERVAL_MS = 1000 # 时间标签精确到秒，至少每秒刷新一次
+
+
+pygame = None # 由 load_pygame() 在第一次需要音频时导入
+
+
+def load_pygame():
+    # 导入 pygame 较慢，界面启动时不导入；之后本模块和调用方共用同一个模块对象
+    global pygame
+    if pygame is None:
+        import pygame as pygame_module
+        pygame = pygame_module
+    return pygame
+
+
+def music_end_event():
+    # pygame.mixer.music 播放结束 (或被停止) 时发出的事件类型
+    return load_pygame().USEREVENT + 1
+
+
+def init_pcm_mixer():
+    # 只会用到 mixer，因此不调用 pygame.init()。以合成输出的原生格式 (16 kHz / 16 bit / 单声道) 打开，
+    # 这样 PCM 数据可以直接交给 pygame.mixer.Sound 而无需重采样
+    load_pygame()
+    try:
+        pygame.mixer.pre_init(frequency=PCM_SAMPLE_RATE, size=-PCM_SAMPLE_WIDTH * 8, channels=PCM_CHANNELS, allowedchanges=0)
+    except TypeError:  # pygame 1.x 不支持 allowedchanges
+        pygame.mixer.pre_init(frequency=PCM_SAMPLE_RATE, size=-PCM_SAMPLE_WIDTH * 8, channels=PCM_CHANNELS)
+
+
+def progress_interval_ms(duration_sec, width_px, max_ms=MAX_PROGRESS_INTERVAL_MS):
+    # 进度条每走一个像素刷新一次就足够了：长音频刷新得慢，短音频刷新得快
+    if duration_sec <= 0: return min(max_ms, 100)
+    per_pixel_ms = duration_sec * 1000 / max(100, width_px)
+    return int(max(MIN_PROGRESS_INTERVAL_MS, min(max_ms, per_pixel_ms)))
+
+
+def mixer_matches_pcm_format():
+    init_info = pygame.mixer.get_init()
+    return bool(init_info) and init_info[0] == PCM_SAMPLE_RATE and abs(init_info[1]) == PCM_SAMPLE_WIDTH * 8 and init_info[2] == PCM_CHANNELS
+
+
+class StreamingPcmPlayer:
+    # 边接收边播放的 PCM 播放器。
+    # feed()/finish() 可在任意线程调用；pump() 必须在主线程 (Tk 循环) 中周期性调用，
+    # 它把已缓冲的数据切成块，通过 pygame Channel 的队列无缝衔接播放。
+    def __init__(self, prebuffer_sec=DEFAULT_PREBUFFER_SEC, block_sec=DEFAULT_BLOCK_SEC):
+        self.bytes_per_second = PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH * PCM_CHANNELS
+        self.frame_size = PCM_SAMPLE_WIDTH * PCM_CHANNELS
+        self.prebuffer_bytes = int(prebuffer_sec * self.bytes_per_second) // self.frame_size * self.frame_size
+        self.block_bytes = max(self.frame_size, int(block_sec * self.bytes_per_second) // self.frame_size * self.frame_size)
+        self._buffer = bytearray()
+        self._read_offset = 0
+        self._input_finished = False
+        self._lock = threading.Lock()
+        self.channel = None
+        self.started_at_monotonic = None
+        self.paused = False
+        self.stopped = False
+        self._pause_started = None
+        self._paused_total_sec = 0.0
+
+    def feed(self, data):
+        if not data: return
+        with self._lock: self._buffer += data
+
+    def finish(self):
+        with self._lock: self._input_finished = True
+
+    @property
+    def input_finished(self):
+        with self._lock: return self._input_finished
+
+    @property
+    def buffered_duration_sec(self):
+        with self._lock: return len(self._buffer) / self.bytes_per_second
+
+    @property
+    def started(self):
+        return self.started_at_monotonic is not None
+
+    def _take_block(self):
+        with self._lock:
+            available = (len(self._buffer) - self._read_offset) // self.frame_size * self.frame_size
+            if available <= 0: return None
+            if available < self.block_bytes and not self._input_finished and self.started:
+                # 数据不足一块时先等一等，避免产生大量很短的 Sound
+                if self.channel is not None and self.channel.get_busy(): return None
+            size = min(available, self.block_bytes)
+            block = bytes(self._buffer[self._read_offset:self._read_offset + size])
+            self._read_offset += size
+            return block
+
+    def pump(self):
+        if self.stopped or self.paused: return
+        if not self.started:
+            with self._lock:
+                ready = len(self._buffer) >= self.prebuffer_bytes or (self._input_finished and self._buffer)
+            if not ready: return
+            block = self._take_block()
+            if not block: return
+            self.channel = pygame.mixer.Sound(buffer=block).play()
+            if self.channel is None: raise pygame.error("没有可用的音频通道")
+            self.started_at_monotonic = time.monotonic()
+        if self.channel.get_queue() is None:
+            block = self._take_block()
+            if block:
+                if self.channel.get_busy(): self.channel.queue(pygame.mixer.Sound(buffer=block))
+                else: self.channel.play(pygame.mixer.Sound(buffer=block))
+
+    def position_sec(self):
+        if not self.started: return 0.0
+        now = self._pause_started if self.paused else time.monotonic()
+        elapsed = now - self.started_at_monotonic - self._paused_total_sec
+        return max(0.0, min(elapsed, self.buffered_duration_sec))
+
+    def is_done(self):
+        if self.stopped: return True
+        if not self.started or self.paused: return False
+        with self._lock:
+            all_consumed = self._input_finished and self._read_offset >= len(self._buffer) // self.frame_size * self.frame_size
+        return all_consumed and not self.channel.get_busy()
+
+    def pause(self):
+        if self.paused or self.stopped: return
+        self.paused = True
+        self._pause_started = time.monotonic()
+        if self.channel is not None: self.channel.pause()
+
+    def resume(self):
+        if not self.paused or self.stopped: return
+        self.paused = False
+        if self._pause_started is not None and self.started:
+            self._paused_total_sec += time.monotonic() - self._pause_started
+        self._pause_started = None
+        if self.channel is not None: self.channel.unpause()
+
+    def stop(self):
+        self.stopped = True
+        if self.channel is not None:
+            try: self.channel.stop()
+            except pygame.error as e: print(f"Debug: 停止流式播放通道时出错 (可忽略): {e}")
+
+
+class PcmBufferPlayer:
+    # 播放一段已完整解码的 PCM (16 kHz / 16 bit / 单声道)，支持按采样定位。
+    # 音频保存在 memoryview 中 (来自内存中的 WAV，不复制)，按块交给 pygame Channel 排队播放；
+    # 定位只是移动读取偏移量，不需要重新加载文件。位置按正在播放的块的起始采样计算，
+    # 块与块之间以块时长首尾相接推算，不随墙上时钟累积漂移。pump() 必须在主线程中周期性调用。
+    def __init__(self, pcm, block_sec=DEFAULT_BLOCK_SEC):
+        self.bytes_per_second = PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH * PCM_CHANNELS
+        self.frame_size = PCM_SAMPLE_WIDTH * PCM_CHANNELS
+        self.block_bytes = max(self.frame_size, int(block_sec * self.bytes_per_second) // self.frame_size * self.frame_size)
+        pcm = memoryview(pcm).cast("B")
+        self._pcm = pcm[:len(pcm) // self.frame_size * self.frame_size]
+        self.channel = None
+        self._read_offset = 0          # 下一个要排队的块的字节偏移
+        self._playing_offset = 0       # 正在播放的块的起始字节偏移
+        self._playing_length = 0
+        self._playing_started_at = None
+        self._queued_offset = None     # 已排队 (尚未开始) 的块
+        self._queued_length = 0
+        self.paused = False
+        self.stopped = False
+        self._pause_started = None
+
+    @classmethod
+    def from_wav_bytes(cls, wav_data, block_sec=DEFAULT_BLOCK_SEC):
+        info, pcm = parse_wav(wav_data)
+        if (info.sample_rate, info.channels, info.sample_width) != (PCM_SAMPLE_RATE, PCM_CHANNELS, PCM_SAMPLE_WIDTH):
+            raise WavFormatError(f"音频格式 {info} 与播放器的 PCM 格式不一致")
+        return cls(pcm, block_sec=block_sec)
+
+    @property
+    def duration_sec(self):
+        return len(self._pcm) / self.bytes_per_second
+
+    @property
+    def started(self):
+        return self._playing_started_at is not None
+
+    @property
+    def max_pump_interval_ms(self):
+        # 队列里始终只有一块，下一块必须在当前块播完之前送进去
+        return int(self.block_bytes / self.bytes_per_second * 1000 / 2)
+
+    def _take_block(self):
+        if self._read_offset >= len(self._pcm): return None, None
+        offset = self._read_offset
+        block = self._pcm[offset:offset + self.block_bytes]
+        self._read_offset += len(block)
+        return offset, block
+
+    def _start_from(self, byte_offset):
+        if self.channel is not None:
+            try: self.channel.stop()
+            except pygame.error as e: print(f"Debug: 停止播放通道时出错 (可忽略): {e}")
+        self.channel = None
+        self._read_offset = byte_offset
+        self._playing_offset = byte_offset
+        self._playing_length = 0
+        self._playing_started_at = None
+        self._queued_offset = None
+        self._queued_length = 0
+        offset, block = self._take_block()
+        if block is None: return
+        self.channel = pygame.mixer.Sound(buffer=bytes(block)).play()
+        if self.channel is None: raise pygame.error("没有可用的音频通道")
+        self._playing_offset, self._playing_length = offset, len(block)
+        self._playing_started_at = time.monotonic()
+
+    def play(self):
+        self.stopped = False
+        self._start_from(0)
+
+    def pump(self):
+        if self.stopped or self.paused or self.channel is None: return
+        if self._queued_offset is not None and self.channel.get_queue() is None:
+            # 排队的块已经开始播放：它紧接在上一块之后，起始时间按上一块的时长推算
+            self._playing_started_at += self._playing_length / self.bytes_per_second
+            self._playing_offset, self._playing_length = self._queued_offset, self._queued_length
+            self._queued_offset = None
+        if self._queued_offset is None:
+            if not self.channel.get_busy():
+                # pump 调用不及时导致断档：从下一块重新开始
+                if self._read_offset < len(self._pcm): self._start_from(self._read_offset)
+                return
+            offset, block = self._take_block()
+            if block is not None:
+                self.channel.queue(pygame.mixer.Sound(buffer=bytes(block)))
+                self._queued_offset, self._queued_length = offset, len(block)
+
+    def position_sec(self):
+        if not self.started: return self._playing_offset / self.bytes_per_second
+        now = self._pause_started if self.paused else time.monotonic()
+        in_block = min(max(0.0, now - self._playing_started_at), self._playing_length / self.bytes_per_second)
+        return self._playing_offset / self.bytes_per_second + in_block
+
+    def seek(self, position_sec):
+        # 对齐到采样帧边界；暂停时只移动位置，继续播放时从新位置开始
+        frames = int(max(0.0, min(position_sec, self.duration_sec)) * PCM_SAMPLE_RATE)
+        byte_offset = min(frames * self.frame_size, len(self._pcm))
+        if self.paused or self.stopped:
+            if self.channel is not None:
+                try: self.channel.stop()
+                except pygame.error as e: print(f"Debug: 停止播放通道时出错 (可忽略): {e}")
+            self.channel = None
+            self._read_offset = self._playing_offset = byte_offset
+            self._playing_length = 0
+            self._playing_started_at = None
+            self._queued_offset = None
+            if self.paused: self._pause_started = None
+            return
+        self._start_from(byte_offset)
+
+    def is_done(self):
+        if self.stopped: return True
+        if self.paused: return False
+        if self.channel is None:
+            # 定位到末尾时没有可播放的块，不会再创建通道
+            return self._read_offset >= len(self._pcm)
+        return self._read_offset >= len(self._pcm) and self._queued_offset is None and not self.channel.get_busy()
+
+    def pause(self):
+        if self.paused or self.stopped: return
+        self.paused = True
+        self._pause_started = time.monotonic()
+        if self.channel is not None: self.channel.pause()
+
+    def resume(self):
+        if not self.paused or self.stopped: return
+        self.paused = False
+        if self.channel is None:
+            # 暂停期间定位过：从新位置开始播放
+            self._start_from(self._playing_offset)
+        else:
+            if self._pause_started is not None and self.started:
+                self._playing_started_at += time.monotonic() - self._pause_started
+            self.channel.unpause()
+        self._pause_started = None
+
+    def stop(self):
+        self.stopped = True
+        if self.channel is not None:
+            try: self.channel.stop()
+            except pygame.error as e: print(f"Debug: 停止播放通道时出错 (可忽略): {e}")
+        self.channel = None
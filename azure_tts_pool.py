@@ -0,0 +1,158 @@
+from contextlib import contextmanager
+import threading
+import time
+
+DEFAULT_POOL_MAX_IDLE_PER_KEY = 4
+DEFAULT_POOL_IDLE_TIMEOUT_SEC = 300
+
+
+def load_speech_sdk():
+    # 语音 SDK 会加载原生库，导入较慢：等到第一次合成或获取语音列表时才导入
+    import azure.cognitiveservices.speech as speechsdk
+    return speechsdk
+
+
+def create_synthesizer(subscription_key, service_region, output_format):
+    speechsdk = load_speech_sdk()
+    speech_config = speechsdk.SpeechConfig(subscription=subscription_key, region=service_region)
+    speech_config.set_speech_synthesis_output_format(output_format)
+    return speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+
+
+def _disconnect_synthesizer_events(synthesizer):
+    # 归还前断开本次请求挂上的事件回调，避免串到下一个请求
+    for signal_name in ("synthesis_started", "synthesizing", "synthesis_completed", "synthesis_canceled", "word_boundary", "bookmark_reached", "viseme_received"):
+        signal = getattr(synthesizer, signal_name, None)
+        if signal is not None:
+            try: signal.disconnect_all()
+            except Exception as e: print(f"Debug: 断开合成器事件 {signal_name} 时出错 (可忽略): {e}")
+
+
+class _PooledSynthesizer:
+    def __init__(self, synthesizer, connection=None):
+        self.synthesizer = synthesizer
+        self.connection = connection
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.connection is not None:
+            try: self.connection.close()
+            except Exception as e: print(f"Debug: 关闭合成器连接时出错 (可忽略): {e}")
+        self.connection = None
+        self.synthesizer = None
+
+
+class SynthesizerPool:
+    # 按 (订阅密钥, 区域, 输出格式) 复用 SpeechSynthesizer，连接可预先打开。
+    # 每个合成器同一时间只借给一个请求；空闲超时或凭据变更时关闭并丢弃。
+    def __init__(self, max_idle_per_key=DEFAULT_POOL_MAX_IDLE_PER_KEY, idle_timeout_sec=DEFAULT_POOL_IDLE_TIMEOUT_SEC):
+        self.max_idle_per_key = max_idle_per_key
+        self.idle_timeout_sec = idle_timeout_sec
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.created_count = 0
+        self.reused_count = 0
+
+    @staticmethod
+    def _pool_key(subscription_key, service_region, output_format):
+        return (subscription_key, (service_region or "").strip().lower(), output_format)
+
+    def _new_entry(self, subscription_key, service_region, output_format, preconnect):
+        synthesizer = create_synthesizer(subscription_key, service_region, output_format)
+        connection = None
+        if preconnect:
+            try:
+                connection = load_speech_sdk().Connection.from_speech_synthesizer(synthesizer)
+                connection.open(True)
+            except Exception as e:
+                print(f"Debug: 预连接失败，将在首次请求时再建立连接: {e}")
+                connection = None
+        with self._lock: self.created_count += 1
+        return _PooledSynthesizer(synthesizer, connection)
+
+    @contextmanager
+    def acquire(self, subscription_key, service_region, output_format):
+        key = self._pool_key(subscription_key, service_region, output_format)
+        self.prune_idle()
+        entry = None
+        with self._lock:
+            idle_list = self._idle.get(key)
+            if idle_list:
+                entry = idle_list.pop()
+                self.reused_count += 1
+        if entry is None:
+            entry = self._new_entry(subscription_key, service_region, output_format, preconnect=False)
+        healthy = False
+        try:
+            yield entry.synthesizer
+            healthy = True
+        finally:
+            _disconnect_synthesizer_events(entry.synthesizer)
+            if healthy: self._release(key, entry)
+            else: entry.close()
+
+    def _release(self, key, entry):
+        entry.last_used = time.monotonic()
+        with self._lock:
+            idle_list = self._idle.setdefault(key, [])
+            if len(idle_list) < self.max_idle_per_key:
+                idle_list.append(entry)
+                return
+        entry.close()
+
+    def warm(self, subscription_key, service_region, output_format, count=1):
+        # 预先创建合成器并打开连接 (TLS 握手等)，通常在后台线程中调用
+        key = self._pool_key(subscription_key, service_region, output_format)
+        with self._lock:
+            missing = min(count, self.max_idle_per_key) - len(self._idle.get(key, []))
+        for _ in range(max(0, missing)):
+            entry = self._new_entry(subscription_key, service_region, output_format, preconnect=True)
+            self._release(key, entry)
+        return max(0, missing)
+
+    def prune_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout_sec
+        expired = []
+        with self._lock:
+            for key, idle_list in list(self._idle.items()):
+                keep = [e for e in idle_list if e.last_used >= cutoff]
+                expired.extend(e for e in idle_list if e.last_used < cutoff)
+                if keep: self._idle[key] = keep
+                else: del self._idle[key]
+        for entry in expired: entry.close()
+        return len(expired)
+
+    def invalidate(self, keep_subscription_key=None, keep_service_region=None):
+        # 凭据变更时丢弃不属于当前凭据的合成器；两个参数都为 None 时全部丢弃
+        keep_region = (keep_service_region or "").strip().lower()
+        dropped = []
+        with self._lock:
+            for key in list(self._idle):
+                if keep_subscription_key is not None and key[0] == keep_subscription_key and key[1] == keep_region: continue
+                dropped.extend(self._idle.pop(key))
+        for entry in dropped: entry.close()
+        return len(dropped)
+
+    def clear(self):
+        return self.invalidate()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "idle": sum(len(v) for v in self._idle.values()),
+                "created": self.created_count,
+                "reused": self.reused_count,
+            }
+
+
+@contextmanager
+def leased_synthesizer(pool, subscription_key, service_region, output_format):
+    if pool is not None:
+        with pool.acquire(subscription_key, service_region, output_format) as synthesizer:
+            yield synthesizer
+    else:
+        synthesizer = create_synthesizer(subscription_key, service_region, output_format)
+        try:
+            yield synthesizer
+        finally:
+            del synthesizer
@@ -0,0 +1,150 @@
+from collections import deque
+import itertools
+import threading
+import time
+
+DEFAULT_PREFETCH_DEBOUNCE_SEC = 1.2
+DEFAULT_PREFETCH_MAX_CHARS = 1500
+DEFAULT_PREFETCH_BUDGET_CHARS_PER_HOUR = 20000
+PREFETCH_BUDGET_WINDOW_SEC = 3600
+
+
+class PrefetchCancelled(Exception):
+    pass
+
+
+class PrefetchScope:
+    # 一次预合成的取消范围，接口与 SynthesisJob 的 on_cancel 相同，可作为后端的 cancel_scope：
+    # 请求作废时调用登记的回调 (stop_speaking_async)，进行中的请求立即中止，不再为作废的音频付费
+    def __init__(self):
+        self._cancelled = False
+        self._callbacks = {}
+        self._callback_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def is_cancelled(self):
+        with self._lock: return self._cancelled
+
+    def on_cancel(self, callback):
+        with self._lock:
+            if not self._cancelled:
+                callback_id = next(self._callback_ids)
+                self._callbacks[callback_id] = callback
+                return lambda: self._callbacks.pop(callback_id, None)
+        self._run_callback(callback)
+        return lambda: None
+
+    @staticmethod
+    def _run_callback(callback):
+        try: callback()
+        except Exception as e: print(f"Debug: 预合成取消回调出错 (可忽略): {e}")
+
+    def cancel(self):
+        with self._lock:
+            if self._cancelled: return
+            self._cancelled = True
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for callback in callbacks: self._run_callback(callback)
+
+
+class Prefetcher:
+    # 推测性合成：编辑停下来后在后台把当前文本合成进缓存，按下播放时通常可以直接命中。
+    # 同一时刻只保留最新的一个请求：新的输入会让旧请求作废 (尚未发出的分段不再发出、
+    # 进行中的请求通过 PrefetchScope 中止、已经合成的结果丢弃)。按滚动一小时的字符数限制推测性合成的用量。
+    def __init__(self, max_chars=DEFAULT_PREFETCH_MAX_CHARS, budget_chars_per_hour=DEFAULT_PREFETCH_BUDGET_CHARS_PER_HOUR):
+        self.max_chars = max_chars
+        self.budget_chars_per_hour = budget_chars_per_hour
+        self._wanted_key = None # 当前输入对应的键；其他键的请求都已作废
+        self._inflight = {} # key -> threading.Event，完成 (成功、失败或作废) 时置位
+        self._scopes = {} # key -> PrefetchScope
+        self._spent = deque() # (时间, 字符数)
+        self._lock = threading.Lock()
+        self._stats = {"started": 0, "completed": 0, "cancelled": 0, "failed": 0, "skipped_budget": 0, "skipped_size": 0}
+
+    def configure(self, max_chars=None, budget_chars_per_hour=None):
+        with self._lock:
+            if max_chars is not None: self.max_chars = max_chars
+            if budget_chars_per_hour is not None: self.budget_chars_per_hour = budget_chars_per_hour
+
+    def _budget_used(self, now):
+        while self._spent and now - self._spent[0][0] > PREFETCH_BUDGET_WINDOW_SEC: self._spent.popleft()
+        return sum(chars for _, chars in self._spent)
+
+    def budget_remaining(self):
+        with self._lock: return max(0, self.budget_chars_per_hour - self._budget_used(time.time()))
+
+    def _supersede(self, key):
+        # 调用方持有 _lock；返回需要取消的其他键的 PrefetchScope (在锁外调用 cancel)
+        self._wanted_key = key
+        return [scope for scope_key, scope in self._scopes.items() if scope_key != key]
+
+    def cancel(self):
+        # 输入又变了：作废正在进行的请求
+        with self._lock: stale = self._supersede(None)
+        for scope in stale: scope.cancel()
+
+    def is_inflight(self, key):
+        with self._lock: return key in self._inflight
+
+    def wait_for(self, key, timeout=None):
+        # 等待同一键的预合成结束；没有进行中的请求时立即返回 False
+        with self._lock: done = self._inflight.get(key)
+        if done is None: return False
+        return done.wait(timeout)
+
+    def submit(self, key, chars, run):
+        # run(is_cancelled, cancel_scope) 在后台线程中执行合成并写入缓存；cancel_scope 应传给后端的请求，
+        # 发现 is_cancelled() 为真时应抛出 PrefetchCancelled。返回是否真的开始了预合成
+        with self._lock:
+            stale = self._supersede(key)
+            started = self._start_locked(key, chars)
+        for scope in stale: scope.cancel()
+        if started is None: return False
+        done, scope = started
+
+        def is_cancelled():
+            with self._lock: return self._wanted_key != key
+
+        def worker():
+            outcome = "completed"
+            try:
+                run(is_cancelled, scope)
+            except PrefetchCancelled:
+                outcome = "cancelled"
+            except Exception as e:
+                # 作废时中止的请求以错误结束，按作废统计
+                if is_cancelled(): outcome = "cancelled"
+                else:
+                    outcome = "failed"
+                    print(f"Debug: 预合成失败 (可忽略): {e}")
+            finally:
+                with self._lock:
+                    self._stats[outcome] += 1
+                    self._inflight.pop(key, None)
+                    self._scopes.pop(key, None)
+                done.set()
+            if outcome == "cancelled": print("Debug: 输入已变化，预合成结果已丢弃。")
+
+        threading.Thread(target=worker, name="tts_prefetch", daemon=True).start()
+        return True
+
+    def _start_locked(self, key, chars):
+        # 调用方持有 _lock；返回 (完成事件, PrefetchScope)，不开始时返回 None
+        if key in self._inflight: return None # 改回了同一文本：让进行中的请求继续
+        if chars > self.max_chars:
+            self._stats["skipped_size"] += 1; return None
+        now = time.time()
+        if self._budget_used(now) + chars > self.budget_chars_per_hour:
+            self._stats["skipped_budget"] += 1
+            print(f"Debug: 预合成字符预算已用完 (每小时 {self.budget_chars_per_hour} 字符)，跳过。")
+            return None
+        self._spent.append((now, chars))
+        done = self._inflight[key] = threading.Event()
+        scope = self._scopes[key] = PrefetchScope()
+        self._stats["started"] += 1
+        return done, scope
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, inflight=len(self._inflight), budget_used=self._budget_used(time.time()))
@@ -0,0 +1,129 @@
+import random
+import threading
+import time
+
+DEFAULT_REQUESTS_PER_SEC = 20.0
+DEFAULT_CHARS_PER_MINUTE = 0 # 0 表示不限制
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BASE_BACKOFF_SEC = 0.5
+DEFAULT_MAX_BACKOFF_SEC = 30.0
+
+THROTTLE_ERROR_CODES = {"TooManyRequests"}
+TRANSIENT_ERROR_CODES = {"ServiceTimeout", "ConnectionFailure", "ServiceUnavailable", "ServiceError"}
+
+
+def classify_error(exc):
+    # 返回 "throttled" (限流)、"transient" (可重试的临时错误) 或 None (不应重试)
+    code = getattr(exc, "error_code", None)
+    code_name = getattr(code, "name", None) or (str(code).split(".")[-1] if code is not None else "")
+    if code_name in THROTTLE_ERROR_CODES: return "throttled"
+    if code_name in TRANSIENT_ERROR_CODES: return "transient"
+    text = " ".join(str(x) for x in (exc, getattr(exc, "error_details", "") or "")).lower()
+    if "429" in text or "too many requests" in text or "throttl" in text: return "throttled"
+    if isinstance(exc, (ConnectionError, TimeoutError)): return "transient"
+    if any(marker in text for marker in ("timeout", "timed out", "connection", "503", "service unavailable", "websocket")): return "transient"
+    return None
+
+
+class TokenBucket:
+    # 预约式令牌桶：立即扣减令牌 (允许为负)，返回调用方需要等待的秒数，保证先到先得
+    def __init__(self, rate_per_sec, capacity=None):
+        self.rate_per_sec = float(rate_per_sec or 0)
+        self.capacity = float(capacity if capacity else max(1.0, self.rate_per_sec))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1.0):
+        if self.rate_per_sec <= 0: return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_sec)
+            self._updated = now
+            self._tokens -= min(float(amount), self.capacity) # 超大请求按满桶计，避免永远等不到
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate_per_sec
+
+
+class RequestScheduler:
+    # 所有合成请求的统一调度：并发上限 + 每秒请求数/每分钟字符数令牌桶，
+    # 限流和临时错误按带抖动的指数退避重试；一旦被限流，所有请求一起冷却，避免继续冲击配额
+    def __init__(self, requests_per_sec=DEFAULT_REQUESTS_PER_SEC, chars_per_minute=DEFAULT_CHARS_PER_MINUTE,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, max_retries=DEFAULT_MAX_RETRIES,
+                 base_backoff_sec=DEFAULT_BASE_BACKOFF_SEC, max_backoff_sec=DEFAULT_MAX_BACKOFF_SEC, on_retry=None):
+        self.request_bucket = TokenBucket(requests_per_sec)
+        self.char_bucket = TokenBucket(chars_per_minute / 60.0, capacity=chars_per_minute) if chars_per_minute else TokenBucket(0)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self.max_retries = max(0, int(max_retries))
+        self.base_backoff_sec = base_backoff_sec
+        self.max_backoff_sec = max_backoff_sec
+        self.on_retry = on_retry
+        self._cooldown_until = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "succeeded": 0, "failed": 0, "retries": 0, "throttled": 0, "wait_sec": 0.0, "in_flight": 0}
+
+    def _backoff_delay(self, attempt):
+        # full jitter: [0, min(上限, 基数 * 2^attempt)]，再加一个小的下限避免立刻重试
+        ceiling = min(self.max_backoff_sec, self.base_backoff_sec * (2 ** attempt))
+        return self.base_backoff_sec / 2 + random.uniform(0, ceiling)
+
+    def _wait_for_slot(self, chars):
+        waited = 0.0
+        with self._lock: cooldown = self._cooldown_until - time.monotonic()
+        if cooldown > 0:
+            time.sleep(cooldown); waited += cooldown
+        delay = max(self.request_bucket.reserve(1), self.char_bucket.reserve(chars) if chars else 0.0)
+        if delay > 0:
+            time.sleep(delay); waited += delay
+        with self._lock: self._stats["wait_sec"] += waited
+
+    def call(self, fn, chars=0, can_retry=None, on_dispatch=None):
+        # can_retry(exc) 返回 False 时即使是可重试错误也直接抛出 (例如流式请求已经输出了部分音频)；
+        # on_dispatch(attempt) 在每次真正发出请求前调用，用于统计排队时间
+        attempt = 0
+        while True:
+            with self._semaphore:
+                self._wait_for_slot(chars)
+                if on_dispatch is not None: on_dispatch(attempt)
+                with self._lock:
+                    self._stats["requests"] += 1
+                    self._stats["in_flight"] += 1
+                try:
+                    result = fn()
+                    with self._lock: self._stats["succeeded"] += 1
+                    return result
+                except Exception as exc:
+                    kind = classify_error(exc)
+                    if kind is None or attempt >= self.max_retries or (can_retry is not None and not can_retry(exc)):
+                        with self._lock: self._stats["failed"] += 1
+                        raise
+                    attempt += 1
+                    last_exc = exc
+                    delay = self._backoff_delay(attempt)
+                    with self._lock:
+                        self._stats["retries"] += 1
+                        if kind == "throttled":
+                            self._stats["throttled"] += 1
+                            self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+                finally:
+                    with self._lock: self._stats["in_flight"] -= 1
+            if self.on_retry:
+                try: self.on_retry(kind, attempt, self.max_retries, delay, last_exc)
+                except Exception as e_cb: print(f"Debug: 重试回调出错 (可忽略): {e_cb}")
+            print(f"Debug: 请求{'被限流' if kind == 'throttled' else '临时失败'}，{delay:.2f} 秒后第 {attempt} 次重试: {str(last_exc).splitlines()[0] if str(last_exc) else type(last_exc).__name__}")
+            time.sleep(delay)
+
+    def stats(self):
+        with self._lock: return dict(self._stats)
+
+
+def scheduler_from_settings(scheduler_settings, on_retry=None):
+    scheduler_settings = scheduler_settings if isinstance(scheduler_settings, dict) else {}
+    return RequestScheduler(
+        requests_per_sec=float(scheduler_settings.get("requests_per_sec", DEFAULT_REQUESTS_PER_SEC)),
+        chars_per_minute=int(scheduler_settings.get("chars_per_minute", DEFAULT_CHARS_PER_MINUTE)),
+        max_concurrency=int(scheduler_settings.get("max_concurrency", DEFAULT_MAX_CONCURRENCY)),
+        max_retries=int(scheduler_settings.get("max_retries", DEFAULT_MAX_RETRIES)),
+        on_retry=on_retry,
+    )
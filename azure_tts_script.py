@@ -0,0 +1,84 @@
+import re
+
+from azure_tts_config import ConfigError
+from azure_tts_ssml import build_multi_voice_ssml, split_text_into_chunks
+
+# 多角色剧本：每行 "配置名: 台词" (半角或全角冒号)，配置名是 azure_tts_settings.json 中保存的语音配置。
+# 没有标记的行接在上一行台词后面；空行和 # 开头的行忽略。
+# 编译时按顺序把各行放进尽量少的 SSML 请求，每个请求包含多个 <voice> 段，受服务端限制约束
+DEFAULT_SCRIPT_MAX_CHARS = 2000 # 每个请求的文本字符数 (单个请求的音频不能超过 10 分钟)
+MAX_VOICE_ELEMENTS_PER_REQUEST = 50 # 服务端对一个 SSML 中 <voice> 元素数量的限制
+
+_SPEAKER_RE = re.compile(r"^\s*([^:：\s][^:：]{0,31}?)\s*[:：]\s*(.*)$")
+
+
+class ScriptError(ConfigError):
+    pass
+
+
+class ScriptLine:
+    def __init__(self, speaker, text, line_no):
+        self.speaker = speaker
+        self.text = text
+        self.line_no = line_no
+
+    def __repr__(self):
+        return f"ScriptLine({self.speaker!r}, {self.text!r}, line {self.line_no})"
+
+
+def parse_script(script_text, profile_names):
+    # 返回 [ScriptLine]；冒号前的名称不是已保存的配置时，整行按上一角色的台词处理 (台词中本身带冒号的情况)
+    profile_names = set(profile_names)
+    lines = []
+    for line_no, raw in enumerate((script_text or "").splitlines(), start=1):
+        stripped = raw.strip()
+        if not stripped or stripped.startswith("#"): continue
+        match = _SPEAKER_RE.match(stripped)
+        if match and match.group(1) in profile_names:
+            lines.append(ScriptLine(match.group(1), match.group(2), line_no))
+            continue
+        if not lines:
+            hint = f"'{match.group(1)}' 不是已保存的语音配置" if match else "缺少 '配置名:' 标记"
+            raise ScriptError(f"剧本第 {line_no} 行: {hint}。可用配置: {', '.join(sorted(profile_names)) or '(无)'}")
+        if match: print(f"警告: 剧本第 {line_no} 行的 '{match.group(1)}' 不是已保存的语音配置，按 {lines[-1].speaker} 的台词处理。")
+        previous = lines[-1]
+        previous.text = f"{previous.text}\n{stripped}" if previous.text else stripped
+    lines = [line for line in lines if line.text.strip()]
+    if not lines: raise ScriptError("剧本中没有台词。")
+    return lines
+
+
+def compile_script(script_lines, resolve_voice_params, max_chars=DEFAULT_SCRIPT_MAX_CHARS, max_voices=MAX_VOICE_ELEMENTS_PER_REQUEST):
+    # resolve_voice_params(配置名) -> {"lang", "voice", "role", "style", "rate"}。
+    # 同一角色的相邻行合并为一个 <voice> 段；超长的台词按 max_chars 分段。返回各请求的 SSML 列表，
+    # 每个请求的 xml:lang 取自该请求第一段的语音配置 (不同语言的角色可能分到不同请求)
+    params_by_speaker = {}
+    segments = [] # [语音参数, 文本]
+    for line in script_lines:
+        params = params_by_speaker.get(line.speaker)
+        if params is None:
+            try: params = params_by_speaker[line.speaker] = resolve_voice_params(line.speaker)
+            except ConfigError as e: raise ScriptError(f"剧本第 {line.line_no} 行: {e}")
+        for piece in split_text_into_chunks(line.text, max_chars):
+            if segments and segments[-1][0] == params and len(segments[-1][1]) + 1 + len(piece) <= max_chars:
+                segments[-1][1] = f"{segments[-1][1]}\n{piece}"
+            else:
+                segments.append([params, piece])
+
+    requests = [] # [(lang, [(文本, 语音名称, role, style, rate)])]
+    current, current_chars = [], 0
+    for params, text in segments:
+        if current and (len(current) >= max_voices or current_chars + len(text) > max_chars):
+            requests.append((current_lang, current))
+            current, current_chars = [], 0
+        if not current: current_lang = params["lang"]
+        current.append((text, params["voice"], params["role"], params["style"], params["rate"]))
+        current_chars += len(text)
+    if current: requests.append((current_lang, current))
+    return [build_multi_voice_ssml(request, lang) for lang, request in requests]
+
+
+def compile_script_text(script_text, config_data, resolve_voice_params, max_chars=DEFAULT_SCRIPT_MAX_CHARS):
+    # resolve_voice_params(config_data, 配置名) 即 azure_tts_cli.resolve_voice_params
+    profile_names = (config_data.get("voice_profiles", {}) or {}).keys()
+    return compile_script(parse_script(script_text, profile_names), lambda name: resolve_voice_params(config_data, name), max_chars)
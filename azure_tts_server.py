@@ -0,0 +1,397 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import hmac
+import ipaddress
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from azure_tts_audio import PCM_CHANNELS, PCM_SAMPLE_RATE, PCM_SAMPLE_WIDTH, WAV_FORMAT_NAME, build_wav_bytes, parse_wav
+from azure_tts_backend import BACKEND_AZURE, BACKEND_STUB, BACKEND_TYPES, create_backend
+from azure_tts_cache import SynthesisCache
+from azure_tts_cli import OUTPUT_FORMATS, BatchRunner, resolve_voice_params
+from azure_tts_config import ConfigError, default_config_path, get_profile_settings, read_config_file
+from azure_tts_metrics import MARK_FILE_WRITTEN, MetricsRegistry
+from azure_tts_pool import SynthesizerPool
+from azure_tts_prefetch import PrefetchCancelled, PrefetchScope
+from azure_tts_scheduler import scheduler_from_settings
+from azure_tts_script import compile_script_text
+from azure_tts_ssml import DEFAULT_CHUNK_MAX_CHARS, build_ssml, split_text_into_chunks
+from azure_tts_synthesis import DEFAULT_SYNTHESIS_WORKERS, SynthesisError, synthesize_chunks_streaming
+from azure_tts_voices import VOICE_CATALOG_FILE_NAME, VoiceCatalog
+
+# 本机 HTTP 服务：其他程序通过 HTTP 使用同一套语音、配置文件和合成缓存。
+# 连接由 asyncio 处理 (不为每个请求开线程)，阻塞的合成调用在有界线程池中执行，并经过统一的请求调度器。
+#   GET  /health
+#   GET  /voices[?locale=zh-CN]
+#   GET  /profiles, GET /profiles/<名称>
+#   GET  /metrics                    Prometheus 文本格式的延迟统计
+#   POST /synthesize                 {"text", "profile" | "voice", "lang", "role", "style", "rate", "format": "wav" | "mp3", "stream": false}
+#                                    或 {"script": "配置名: 台词\n...", "format", "stream"}：多角色剧本合成为一个连续的音频
+#                                    stream=true 时以分块传输返回无头 16 kHz PCM，边合成边发送
+DEFAULT_SERVER_HOST = "127.0.0.1"
+DEFAULT_SERVER_PORT = 8765
+MAX_REQUEST_BODY_BYTES = 1024 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+REQUEST_TIMEOUT_SEC = 30
+PCM_CONTENT_TYPE = f"audio/L16; rate={PCM_SAMPLE_RATE}; channels={PCM_CHANNELS}"
+CONTENT_TYPES = {"wav": "audio/wav", "mp3": "audio/mpeg"}
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error", 502: "Bad Gateway"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class SynthesisRequest:
+    # 一次 /synthesize 请求：cache_ssml 为整段 SSML (缓存键和合并相同请求的依据)，chunk_ssml_list 为实际发出的各段 SSML
+    def __init__(self, output_format, cache_ssml, chunk_ssml_list, chars, obtain_audio):
+        self.output_format = output_format
+        self.cache_ssml = cache_ssml
+        self.chunk_ssml_list = chunk_ssml_list
+        self.chars = chars
+        self.obtain_audio = obtain_audio # obtain_audio(timeline) -> (音频字节, 状态, 来源)
+
+
+def is_loopback_host(host):
+    try: return ipaddress.ip_address(host).is_loopback
+    except ValueError: return host == "localhost"
+
+
+class TtsServer:
+    def __init__(self, backend, config_data, cache=None, scheduler=None, metrics=None, voice_catalog=None,
+                 workers=DEFAULT_SYNTHESIS_WORKERS, chunk_max_chars=DEFAULT_CHUNK_MAX_CHARS, token=None, access_log=False):
+        self.backend = backend
+        self.config_data = config_data
+        self.cache = cache
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.voice_catalog = voice_catalog
+        self.token = token or None
+        self.access_log = access_log
+        self.runner = BatchRunner(backend, workers=workers, cache=cache, chunk_max_chars=chunk_max_chars, scheduler=scheduler, metrics=self.metrics)
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="tts_server")
+        self._inflight = {} # (文本, 参数, 格式) -> asyncio.Future，相同的并发请求只合成一次
+        self._voices = None
+        self._voices_lock = threading.Lock()
+        self._stats = {"requests": 0, "coalesced": 0, "errors": 0}
+
+    # --- 合成与查询 (在线程池中执行) ---
+
+    def _list_voices(self):
+        with self._voices_lock:
+            if self._voices is not None: return self._voices
+            namespace = self.backend.cache_namespace
+            records, fetched_at = self.voice_catalog.load(namespace) if self.voice_catalog else (None, None)
+            if records is None or (self.voice_catalog and self.voice_catalog.is_stale(fetched_at)):
+                records = self.backend.list_voices()
+                if self.voice_catalog: self.voice_catalog.store(namespace, records)
+            self._voices = [{"short_name": r.short_name, "locale": r.locale, "gender": r.gender, "local_name": r.local_name,
+                             "styles": list(r.style_list), "roles": list(r.role_play_list)} for r in records]
+            return self._voices
+
+    def _synthesize(self, request):
+        timeline = self.metrics.new_timeline("server", chars=request.chars)
+        try:
+            audio, status, _ = request.obtain_audio(timeline)
+        except Exception as e:
+            timeline.finish("error", e); raise
+        timeline.mark(MARK_FILE_WRITTEN)
+        timeline.finish(status)
+        return audio, status
+
+    def _stream(self, request, emit, scope):
+        # 缓存命中时直接送出缓存的 PCM；否则分段流式合成，完成后把完整 WAV 写入缓存。
+        # scope 在客户端断开时取消：尚未发出的分段不再发出，进行中的请求立即中止，不完整的结果不写入缓存
+        cache_key = SynthesisCache.make_key(request.cache_ssml, WAV_FORMAT_NAME, self.backend.cache_namespace)
+        timeline = self.metrics.new_timeline("server_stream", chars=request.chars)
+        cached_path = self.cache.get(cache_key) if self.cache else None
+        if cached_path:
+            with open(cached_path, 'rb') as f: wav = f.read()
+            _, pcm = parse_wav(wav)
+            emit(pcm)
+            timeline.finish("cached")
+            return "cached"
+        timeline.chunks = len(request.chunk_ssml_list)
+
+        def stream_chunk(chunk_ssml, on_audio):
+            if scope.is_cancelled(): raise PrefetchCancelled()
+            received = [0]
+            def counting_on_audio(data):
+                received[0] += len(data); on_audio(data)
+            return self.runner.scheduler.call(
+                lambda: self.backend.synthesize_with_events(chunk_ssml, counting_on_audio, on_event=timeline.on_synthesis_event, cancel_scope=scope),
+                chars=len(chunk_ssml), can_retry=lambda exc: received[0] == 0 and not scope.is_cancelled(), on_dispatch=timeline.on_dispatch)
+        try:
+            parts = synthesize_chunks_streaming(request.chunk_ssml_list, stream_chunk, emit, max_workers=self.runner.workers)
+        except Exception as e:
+            if scope.is_cancelled():
+                timeline.finish("cancelled")
+                return "cancelled"
+            timeline.finish("error", e); raise
+        if self.cache:
+            wav = build_wav_bytes(b"".join(parts))
+            try: self.cache.put_bytes(cache_key, wav, duration_sec=len(wav) / (PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH * PCM_CHANNELS))
+            except OSError as e: print(f"警告: 无法将合成结果写入缓存。错误: {e}")
+        timeline.mark(MARK_FILE_WRITTEN)
+        timeline.finish("ok")
+        return "ok"
+
+    # --- HTTP ---
+
+    def _synthesis_request(self, body):
+        # {"text", "profile" | "voice", ...} 或多角色剧本 {"script": "配置名: 台词\n..."}
+        output_format = body.get("format", "wav")
+        if output_format not in OUTPUT_FORMATS: raise HttpError(400, f"不支持的输出格式 '{output_format}' (可选: {', '.join(sorted(OUTPUT_FORMATS))})")
+        workers = self.runner.workers
+        if body.get("script"):
+            script_text = str(body["script"])
+            try: ssml_requests = compile_script_text(script_text, self.config_data, resolve_voice_params)
+            except ConfigError as e: raise HttpError(400, str(e))
+            return SynthesisRequest(output_format, "".join(ssml_requests), ssml_requests, len(script_text),
+                                    lambda timeline: self.runner.obtain_script_audio(ssml_requests, output_format, timeline, chunk_workers=workers))
+        text = str(body.get("text", "") or "").strip()
+        if not text: raise HttpError(400, "缺少 text 或 script。")
+        overrides = {k: body.get(k) for k in ("lang", "voice", "role", "style", "rate")}
+        try: p = resolve_voice_params(self.config_data, body.get("profile"), overrides)
+        except (ConfigError, ValueError) as e: raise HttpError(400, str(e))
+        ssml = build_ssml(text, p["lang"], p["voice"], p["role"], p["style"], p["rate"])
+        text_chunks = split_text_into_chunks(text, self.runner.chunk_max_chars)
+        chunk_ssml_list = [build_ssml(c, p["lang"], p["voice"], p["role"], p["style"], p["rate"]) for c in text_chunks] if len(text_chunks) > 1 else [ssml]
+        return SynthesisRequest(output_format, ssml, chunk_ssml_list, len(text),
+                                lambda timeline: self.runner.obtain_audio(text, p, output_format, timeline, chunk_workers=workers))
+
+    async def _run_blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def _synthesize_coalesced(self, request):
+        key = (request.cache_ssml, request.output_format)
+        future = self._inflight.get(key)
+        if future is not None:
+            self._stats["coalesced"] += 1
+            audio, _ = await asyncio.shield(future)
+            return audio, "coalesced"
+        future = asyncio.ensure_future(self._run_blocking(self._synthesize, request))
+        self._inflight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done(): self._inflight.pop(key, None)
+            else: future.add_done_callback(lambda f: self._inflight.pop(key, None))
+
+    async def handle_request(self, method, path, query, headers, body, writer):
+        if path == "/health":
+            return self._json(200, {"status": "ok", "backend": self.backend.name, "namespace": self.backend.cache_namespace})
+        if path == "/metrics":
+            return 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}, self.metrics.prometheus_text().encode("utf-8")
+        if path == "/voices":
+            voices = await self._run_blocking(self._list_voices)
+            locale = (query.get("locale") or [""])[0].lower()
+            return self._json(200, {"voices": [v for v in voices if not locale or v["locale"].lower() == locale]})
+        if path == "/profiles":
+            profiles = self.config_data.get("voice_profiles", {}) or {}
+            return self._json(200, {"profiles": {name: get_profile_settings(self.config_data, name) for name in sorted(profiles)}})
+        if path.startswith("/profiles/"):
+            try: return self._json(200, get_profile_settings(self.config_data, unquote(path[len("/profiles/"):])))
+            except ConfigError as e: raise HttpError(404, str(e))
+        if path == "/synthesize":
+            if method != "POST": raise HttpError(405, "请使用 POST。")
+            try: request = json.loads(body.decode("utf-8") or "{}")
+            except ValueError as e: raise HttpError(400, f"无效的 JSON: {e}")
+            if not isinstance(request, dict): raise HttpError(400, "请求体必须是 JSON 对象。")
+            synthesis_request = self._synthesis_request(request)
+            if request.get("stream"):
+                await self._send_stream(writer, synthesis_request)
+                return None
+            audio, status = await self._synthesize_coalesced(synthesis_request)
+            return 200, {"Content-Type": CONTENT_TYPES[synthesis_request.output_format], "X-TTS-Source": status}, audio
+        raise HttpError(404, f"未知路径: {path}")
+
+    async def _send_stream(self, writer, request):
+        # 合成线程把 PCM 放进 asyncio 队列，事件循环按到达顺序以分块传输发送；客户端断开时取消合成并丢弃剩余数据
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        scope = PrefetchScope()
+        emit = lambda data: loop.call_soon_threadsafe(queue.put_nowait, bytes(data))
+        writer.write(self._head(200, {"Content-Type": PCM_CONTENT_TYPE, "Transfer-Encoding": "chunked"}))
+        task = asyncio.ensure_future(self._run_blocking(self._stream, request, emit, scope))
+        task.add_done_callback(lambda _: loop.call_soon_threadsafe(queue.put_nowait, None))
+        client_gone = False
+        while True:
+            data = await queue.get()
+            if data is None: break
+            if client_gone or not data: continue
+            try:
+                writer.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                await writer.drain()
+            except ConnectionError:
+                client_gone = True
+                scope.cancel()
+        try:
+            await task
+        except Exception as e:
+            # 响应头已经发出，只能提前结束分块流；客户端据此发现数据不完整
+            print(f"警告: 流式合成失败: {e}")
+            self._stats["errors"] += 1
+            writer.close(); return
+        if not client_gone:
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+
+    @staticmethod
+    def _json(status, payload):
+        return status, {"Content-Type": "application/json; charset=utf-8"}, json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    @staticmethod
+    def _head(status, headers):
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}"] + [f"{k}: {v}" for k, v in headers.items()] + ["Connection: close", "", ""]
+        return "\r\n".join(lines).encode("utf-8")
+
+    def _authorized(self, headers):
+        if not self.token: return True
+        supplied = headers.get("authorization", "")
+        return hmac.compare_digest(supplied.encode("utf-8"), f"Bearer {self.token}".encode("utf-8"))
+
+    async def _read_request(self, reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        if len(head) > MAX_HEADER_BYTES: raise HttpError(413, "请求头过大。")
+        lines = head.decode("latin-1").split("\r\n")
+        try: method, target, _ = lines[0].split(" ", 2)
+        except ValueError: raise HttpError(400, "无效的请求行。")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        try: length = int(headers.get("content-length", "0") or 0)
+        except ValueError: raise HttpError(400, "无效的 Content-Length。")
+        if length > MAX_REQUEST_BODY_BYTES: raise HttpError(413, "请求体过大。")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        return method.upper(), url.path.rstrip("/") or "/", parse_qs(url.query), headers, body
+
+    async def handle_connection(self, reader, writer):
+        started = time.monotonic()
+        method = path = "-"
+        status = 500
+        try:
+            try:
+                method, path, query, headers, body = await asyncio.wait_for(self._read_request(reader), REQUEST_TIMEOUT_SEC)
+                self._stats["requests"] += 1
+                if not self._authorized(headers): raise HttpError(401, "缺少或错误的访问令牌。")
+                response = await self.handle_request(method, path, query, headers, body, writer)
+                if response is None:
+                    status = 200
+                else:
+                    status, response_headers, payload = response
+                    writer.write(self._head(status, dict(response_headers, **{"Content-Length": len(payload)})) + payload)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                return
+            except HttpError as e:
+                status = e.status
+                _, response_headers, payload = self._json(e.status, {"error": str(e)})
+                writer.write(self._head(e.status, dict(response_headers, **{"Content-Length": len(payload)})) + payload)
+            except SynthesisError as e:
+                status = 502
+                self._stats["errors"] += 1
+                _, response_headers, payload = self._json(502, {"error": str(e), "error_code": str(e.error_code) if e.error_code else None})
+                writer.write(self._head(502, dict(response_headers, **{"Content-Length": len(payload)})) + payload)
+            except Exception as e:
+                self._stats["errors"] += 1
+                _, response_headers, payload = self._json(500, {"error": f"{type(e).__name__}: {e}"})
+                writer.write(self._head(500, dict(response_headers, **{"Content-Length": len(payload)})) + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            if self.access_log: print(f"Debug: {method} {path} -> {status} ({(time.monotonic() - started) * 1000:.0f}ms)")
+
+    async def serve(self, host=DEFAULT_SERVER_HOST, port=DEFAULT_SERVER_PORT, ready=None):
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        bound_port = server.sockets[0].getsockname()[1]
+        print(f"语音合成服务已启动: http://{host}:{bound_port}/ (后端 {self.backend.name}，命名空间 {self.backend.cache_namespace or '-'})", flush=True)
+        if ready is not None: ready(bound_port)
+        async with server: await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.backend.close()
+
+    def stats(self):
+        return dict(self._stats, inflight=len(self._inflight))
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Azure 文本转语音 - 本机 HTTP 合成服务")
+    parser.add_argument("--host", default=DEFAULT_SERVER_HOST, help=f"监听地址 (默认: {DEFAULT_SERVER_HOST}，只接受本机连接)")
+    parser.add_argument("--port", type=int, default=DEFAULT_SERVER_PORT, help=f"监听端口 (默认: {DEFAULT_SERVER_PORT}，0 表示随机端口)")
+    parser.add_argument("--config", default=default_config_path(), help="配置文件路径 (默认: 脚本目录下的 azure_tts_settings.json)")
+    parser.add_argument("-j", "--workers", type=int, help="同时进行的合成数 (默认: 配置中的 synthesis.max_workers)")
+    parser.add_argument("--key", help="订阅密钥 (默认: 环境变量 AZURE_SPEECH_KEY 或配置文件)")
+    parser.add_argument("--region", help="服务区域 (默认: 环境变量 AZURE_SPEECH_REGION 或配置文件)")
+    parser.add_argument("--backend", choices=BACKEND_TYPES, help="合成后端：azure，或不联网的本地模拟后端 stub (默认: 配置中的 backend.type)")
+    parser.add_argument("--token", default=os.environ.get("AZURE_TTS_SERVER_TOKEN"), help="要求请求携带 Authorization: Bearer <令牌> (默认: 环境变量 AZURE_TTS_SERVER_TOKEN)")
+    parser.add_argument("--no-cache", action="store_true", help="不读取也不写入合成缓存")
+    parser.add_argument("-v", "--verbose", action="store_true", help="打印每个请求的访问日志和耗时 (默认只打印失败或较慢的合成)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    try:
+        config_data = read_config_file(args.config)
+        credentials = config_data.get("azure_credentials", {}) or {}
+        subscription_key = args.key or os.environ.get("AZURE_SPEECH_KEY") or credentials.get("subscription_key", "")
+        service_region = args.region or os.environ.get("AZURE_SPEECH_REGION") or credentials.get("service_region", "")
+        backend_settings = dict(config_data.get("backend", {}) or {})
+        if args.backend: backend_settings["type"] = args.backend
+        use_stub = str(backend_settings.get("type", BACKEND_AZURE)).strip().lower() == BACKEND_STUB
+        if not use_stub and not backend_settings.get("endpoints") and (not subscription_key or not service_region):
+            raise ConfigError("缺少订阅密钥或服务区域：请使用 --key/--region、环境变量或配置文件提供。")
+    except ConfigError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 2
+    if not is_loopback_host(args.host) and not args.token:
+        print(f"警告: 监听非本机地址 {args.host} 且未设置 --token，任何能访问该地址的人都可以使用你的语音服务配额。", file=sys.stderr)
+
+    synthesis_settings = config_data.get("synthesis", {}) or {}
+    workers = args.workers or int(synthesis_settings.get("max_workers", DEFAULT_SYNTHESIS_WORKERS))
+    config_dir = os.path.dirname(os.path.abspath(args.config))
+    cache = None
+    if not args.no_cache:
+        cache_settings = config_data.get("synthesis_cache", {}) or {}
+        cache = SynthesisCache(os.path.join(config_dir, "azure_tts_cache"))
+        cache.configure(max_bytes=int(float(cache_settings.get("max_size_mb", 512)) * 1024 * 1024),
+                        max_age_sec=float(cache_settings.get("max_age_days", 30)) * 24 * 3600)
+    diagnostics = config_data.get("diagnostics", {}) or {}
+    pool = SynthesizerPool(max_idle_per_key=workers)
+    try:
+        backend = create_backend(backend_settings, subscription_key, service_region, pool=pool)
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 2
+    server = TtsServer(backend, config_data, cache=cache, scheduler=scheduler_from_settings(config_data.get("scheduler")),
+                       metrics=MetricsRegistry(jsonl_path=diagnostics.get("jsonl_path"), prometheus_path=diagnostics.get("prometheus_path"), log_requests=args.verbose),
+                       voice_catalog=VoiceCatalog(os.path.join(config_dir, VOICE_CATALOG_FILE_NAME)), workers=workers,
+                       chunk_max_chars=int(synthesis_settings.get("chunk_max_chars", DEFAULT_CHUNK_MAX_CHARS)), token=args.token,
+                       access_log=args.verbose)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("服务已停止。")
+    finally:
+        server.close()
+        pool.clear()
+        if cache: cache.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
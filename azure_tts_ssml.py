@@ -0,0 +1,136 @@
+import re
+import xml.sax.saxutils
+
+DEFAULT_CHUNK_MAX_CHARS = 600
+NO_ROLE = "(无)"
+DEFAULT_STYLE = "(默认)"
+
+# 句末标点 (中英文)，可带右引号/右括号
+_SENTENCE_END_RE = re.compile(r'([。！？!?；;…]+[”’"\'」』）)\]]*|\.+[”’"\'」』）)\]]*(?=\s|$))\s*')
+_PARAGRAPH_SPLIT_RE = re.compile(r'\n\s*\n+|\r?\n')
+_SOFT_BREAK_RE = re.compile(r'[，,、：:\s]')
+
+
+def split_sentences(paragraph):
+    sentences = []
+    start = 0
+    for m in _SENTENCE_END_RE.finditer(paragraph):
+        piece = paragraph[start:m.end()].strip()
+        if piece: sentences.append(piece)
+        start = m.end()
+    tail = paragraph[start:].strip()
+    if tail: sentences.append(tail)
+    return sentences
+
+
+def _hard_split(sentence, max_chars):
+    # 超长句子：优先在逗号/空白处断开，否则按长度硬切
+    pieces = []
+    while len(sentence) > max_chars:
+        cut = -1
+        for m in _SOFT_BREAK_RE.finditer(sentence, 0, max_chars):
+            cut = m.end()
+        if cut <= 0: cut = max_chars
+        pieces.append(sentence[:cut].strip())
+        sentence = sentence[cut:].strip()
+    if sentence: pieces.append(sentence)
+    return [p for p in pieces if p]
+
+
+def split_text_into_chunks(text, max_chars=DEFAULT_CHUNK_MAX_CHARS):
+    # 在段落和句子边界处切分文本，每段不超过 max_chars 个字符。
+    # 段落边界处若当前块已过半则另起一块，尽量让每块自成语义单元。
+    return [chunk for chunk, _, _ in split_text_into_chunk_spans(text, max_chars)]
+
+
+def split_text_into_chunk_spans(text, max_chars=DEFAULT_CHUNK_MAX_CHARS):
+    # 与 split_text_into_chunks 相同的切分，另外返回每段在原文 text 中的 (起始, 结束) 偏移：[(段文本, 起始, 结束)]。
+    # 段由原文中按顺序出现的句子片段拼成，片段之间只有空白，因此按顺序查找即可定位
+    text = text or ""
+    stripped = text.strip()
+    if not stripped: return []
+    lead = len(text) - len(text.lstrip())
+    if len(stripped) <= max_chars: return [(stripped, lead, lead + len(stripped))]
+    spans = []
+    current, start, end = "", 0, 0
+    search_from = lead
+    for paragraph in _PARAGRAPH_SPLIT_RE.split(stripped):
+        paragraph = paragraph.strip()
+        if not paragraph: continue
+        if current and len(current) >= max_chars // 2:
+            spans.append((current, start, end)); current = ""
+        sep = "\n"
+        for sentence in split_sentences(paragraph):
+            for piece in _hard_split(sentence, max_chars):
+                piece_start = text.find(piece, search_from)
+                search_from = piece_start + len(piece)
+                if not current:
+                    current, start = piece, piece_start
+                elif len(current) + len(sep) + len(piece) > max_chars:
+                    spans.append((current, start, end)); current, start = piece, piece_start
+                else:
+                    current = f"{current}{sep}{piece}"
+                end = search_from
+                sep = " "
+    if current: spans.append((current, start, end))
+    return spans
+
+
+def split_text_into_sentences(text, max_chars=DEFAULT_CHUNK_MAX_CHARS):
+    # 按句子切分 (超长句子再按 max_chars 断开)，用作逐句缓存和增量合成的单位
+    units = []
+    for paragraph in _PARAGRAPH_SPLIT_RE.split((text or "").strip()):
+        for sentence in split_sentences(paragraph.strip()):
+            units.extend(_hard_split(sentence, max_chars))
+    return units
+
+
+def build_ssml(text_to_speak_raw, lang, voice_name, role=NO_ROLE, style=DEFAULT_STYLE, rate=1.0):
+    # role/style 为空或为界面上的占位值 "(无)"/"(默认)" 时不输出 express-as
+    return _wrap_ssml_body(xml.sax.saxutils.escape(text_to_speak_raw), lang, voice_name, role, style, rate)
+
+
+def build_packed_ssml(texts, lang, voice_name, role=NO_ROLE, style=DEFAULT_STYLE, rate=1.0, mark_prefix="item-", gap_ms=200):
+    # 把同一语音的多段短文本放进一个 SSML，相邻两段之间插入 <bookmark mark="item-<序号>"/>，
+    # 合成后按书签的音频偏移把音频切回各段。书签两侧各有 gap_ms/2 的停顿，避免相邻两段连读，切开后每段首尾各带一半
+    half_break = f'<break time="{max(0, int(gap_ms)) // 2}ms"/>' if gap_ms else ""
+    body = []
+    for idx, text in enumerate(texts):
+        if idx: body.append(f'{half_break}<bookmark mark="{mark_prefix}{idx}"/>{half_break}')
+        body.append(xml.sax.saxutils.escape(text))
+    return _wrap_ssml_body("".join(body), lang, voice_name, role, style, rate)
+
+
+def build_multi_voice_ssml(segments, lang):
+    # 多角色剧本：segments 为 [(文本, 语音名称, role, style, rate)]，每段一个 <voice>，按顺序放在同一个 SSML 中
+    return _speak_element(lang, "".join(_voice_element(xml.sax.saxutils.escape(text), voice_name, role, style, rate)
+                                        for text, voice_name, role, style, rate in segments))
+
+
+def _wrap_ssml_body(txt_esc, lang, voice_name, role=NO_ROLE, style=DEFAULT_STYLE, rate=1.0):
+    return _speak_element(lang, _voice_element(txt_esc, voice_name, role, style, rate))
+
+
+def _speak_element(lang, voices_xml):
+    return f'<speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xmlns:mstts="http://www.w3.org/2001/mstts" xml:lang="{lang}">{voices_xml}</speak>'
+
+
+def _voice_element(txt_esc, voice_name, role=NO_ROLE, style=DEFAULT_STYLE, rate=1.0):
+    parts = [f'<voice name="{voice_name}">']
+    prosody_opened = False
+    if abs(rate - 1.0) > 0.001: 
+        rate_value_str = f"{rate:.2f}" 
+        parts.append(f'<prosody rate="{rate_value_str}">')
+        prosody_opened = True
+    expr_as_opened = False
+    attrs = []
+    if role and role != NO_ROLE: attrs.append(f'role="{role}"')
+    if style and style != DEFAULT_STYLE: attrs.append(f'style="{style}"')
+    if attrs:
+        parts.append(f'<mstts:express-as {" ".join(attrs)}>')
+        expr_as_opened = True
+    parts.append(txt_esc)
+    if expr_as_opened: parts.append('</mstts:express-as>')
+    if prosody_opened: parts.append('</prosody>')
+    parts.append('</voice>')
+    return "".join(parts)
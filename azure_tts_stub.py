@@ -0,0 +1,220 @@
+from array import array
+import html
+import math
+import random
+import re
+import threading
+import time
+import zlib
+
+from azure_tts_audio import (MP3_FORMAT_NAME, PCM_CHANNELS, PCM_SAMPLE_RATE, PCM_SAMPLE_WIDTH, RAW_PCM_FORMAT_NAME,
+                             WAV_FORMAT_NAME, build_wav_bytes)
+from azure_tts_backend import BACKEND_STUB, SynthesisBackend
+from azure_tts_synthesis import (SYNTHESIS_EVENT_AUDIO, SYNTHESIS_EVENT_BOOKMARK, SYNTHESIS_EVENT_CANCELED, SYNTHESIS_EVENT_COMPLETED,
+                                 SYNTHESIS_EVENT_STARTED, SynthesisError)
+from azure_tts_voices import VoiceRecord
+
+# 本地替身后端：不联网，按 SSML 生成确定性的 PCM (正弦音)，
+# 延迟、限流和失败率可配置，用于离线测试缓存、分段、调度和播放
+DEFAULT_STUB_FIRST_AUDIO_MS = 150
+DEFAULT_STUB_REALTIME_FACTOR = 10.0 # 合成速度是音频实时速度的倍数
+DEFAULT_STUB_AUDIO_SEC_PER_CHAR = 0.06
+DEFAULT_STUB_CHUNK_MS = 100
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_BOOKMARK_RE = re.compile(r"<bookmark\s+mark\s*=\s*[\"']([^\"']*)[\"']\s*/>")
+
+# MPEG-2 Layer III, 64 kbps, 16 kHz, 单声道的静音帧 (288 字节，576 个采样)
+_SILENT_MP3_FRAME = b"\xff\xf3\x88\xc0" + b"\x00" * 284
+_MP3_FRAME_SAMPLES = 576
+
+STUB_VOICES = [
+    VoiceRecord("zh-CN-XiaoxiaoNeural", "zh-CN", "Female", "晓晓", "OnlineNeural", ["affectionate", "cheerful", "sad", "serious"], []),
+    VoiceRecord("zh-CN-YunxiNeural", "zh-CN", "Male", "云希", "OnlineNeural", ["cheerful", "narration-relaxed"], ["Boy", "Narrator", "YoungAdultMale"]),
+    VoiceRecord("zh-CN-XiaomoNeural", "zh-CN", "Female", "晓墨", "OnlineNeural", ["calm", "gentle"], ["Girl", "OlderAdultFemale", "YoungAdultFemale"]),
+    VoiceRecord("en-US-AriaNeural", "en-US", "Female", "Aria", "OnlineNeural", ["chat", "cheerful", "newscast"], []),
+    VoiceRecord("en-US-GuyNeural", "en-US", "Male", "Guy", "OnlineNeural", ["newscast", "shouting"], []),
+    VoiceRecord("ja-JP-NanamiNeural", "ja-JP", "Female", "七海", "OnlineNeural", ["chat", "cheerful"], []),
+]
+
+
+def ssml_plain_text(ssml):
+    return html.unescape(_TAG_RE.sub("", ssml or "")).strip()
+
+
+class StubBackend(SynthesisBackend):
+    name = BACKEND_STUB
+    cache_namespace = "stub"
+
+    def __init__(self, first_audio_ms=DEFAULT_STUB_FIRST_AUDIO_MS, realtime_factor=DEFAULT_STUB_REALTIME_FACTOR,
+                 jitter_ms=0, audio_sec_per_char=DEFAULT_STUB_AUDIO_SEC_PER_CHAR, chunk_ms=DEFAULT_STUB_CHUNK_MS,
+                 throttle_rate=0.0, failure_rate=0.0, failure_error_code="ServiceTimeout", concurrency_limit=0,
+                 seed=None, voices=None):
+        self.first_audio_sec = max(0.0, first_audio_ms / 1000)
+        self.realtime_factor = max(0.01, float(realtime_factor))
+        self.jitter_sec = max(0.0, jitter_ms / 1000)
+        self.audio_sec_per_char = max(0.0, float(audio_sec_per_char))
+        self.chunk_sec = max(0.01, chunk_ms / 1000)
+        self.throttle_rate = min(1.0, max(0.0, float(throttle_rate)))
+        self.failure_rate = min(1.0, max(0.0, float(failure_rate)))
+        self.failure_error_code = failure_error_code
+        self.concurrency_limit = max(0, int(concurrency_limit)) # 超过该并发数的请求按限流处理，0 表示不限
+        self.voices = list(voices) if voices is not None else list(STUB_VOICES)
+        self._rng = random.Random(seed)
+        self._tone_blocks = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {"requests": 0, "succeeded": 0, "throttled": 0, "failed": 0, "chars": 0, "audio_sec": 0.0}
+
+    def _delay(self, seconds, stopped=None):
+        if self.jitter_sec:
+            with self._lock: seconds += self._rng.uniform(0, self.jitter_sec)
+        if seconds <= 0: return
+        if stopped is None: time.sleep(seconds)
+        else: stopped.wait(seconds)
+
+    @staticmethod
+    def _check_stopped(stopped, on_event=None):
+        # 与 stop_speaking_async 一致：进行中的请求以 Canceled 结束
+        if stopped is None or not stopped.is_set(): return
+        if on_event: on_event(SYNTHESIS_EVENT_CANCELED, {})
+        raise SynthesisError("语音合成取消/失败: Canceled\n错误原因: CancellationReason.CancelledByUser",
+                             reason="Canceled", error_details="stopped")
+
+    def _begin_request(self, chars, on_event=None):
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["chars"] += chars
+            over_limit = self.concurrency_limit and self._in_flight >= self.concurrency_limit
+            roll = self._rng.random()
+            if over_limit or roll < self.throttle_rate:
+                self._stats["throttled"] += 1
+                outcome = "throttled"
+            elif roll < self.throttle_rate + self.failure_rate:
+                self._stats["failed"] += 1
+                outcome = "failed"
+            else:
+                self._in_flight += 1
+                return
+        # 服务端拒绝请求也需要一个往返的时间
+        self._delay(self.first_audio_sec / 2)
+        if on_event: on_event(SYNTHESIS_EVENT_CANCELED, {})
+        if outcome == "throttled":
+            raise SynthesisError("语音合成取消/失败: Canceled\n错误原因: Error - 错误详情: Too many requests (模拟限流 429)",
+                                 reason="Canceled", error_details="Too many requests", error_code="TooManyRequests")
+        raise SynthesisError(f"语音合成取消/失败: Canceled\n错误原因: Error - 错误详情: 模拟失败 ({self.failure_error_code})",
+                             reason="Canceled", error_details="simulated failure", error_code=self.failure_error_code)
+
+    def _end_request(self, audio_sec=None):
+        with self._lock:
+            self._in_flight -= 1
+            if audio_sec is not None:
+                self._stats["succeeded"] += 1
+                self._stats["audio_sec"] += audio_sec
+
+    def _tone_block(self, frequency):
+        # 一秒整数个周期的正弦块，重复拼接即可得到任意长度的连续音频
+        block = self._tone_blocks.get(frequency)
+        if block is None:
+            samples = array("h", (int(3000 * math.sin(2 * math.pi * frequency * i / PCM_SAMPLE_RATE)) for i in range(PCM_SAMPLE_RATE)))
+            block = samples.tobytes()
+            self._tone_blocks[frequency] = block
+        return block
+
+    def render_pcm(self, ssml):
+        # 同一 SSML 总是得到相同的音频：频率由 SSML 的 CRC 决定，时长与文本长度成正比
+        text = ssml_plain_text(ssml)
+        frame_size = PCM_SAMPLE_WIDTH * PCM_CHANNELS
+        frames = max(int(0.2 * PCM_SAMPLE_RATE), int(len(text) * self.audio_sec_per_char * PCM_SAMPLE_RATE))
+        block = self._tone_block(220 + zlib.crc32(ssml.encode("utf-8")) % 440)
+        full_blocks, remainder = divmod(frames * frame_size, len(block))
+        return block * full_blocks + block[:remainder]
+
+    @staticmethod
+    def _bookmark_offsets(ssml, pcm_length):
+        # 按书签前文本长度在音频中的比例估算偏移量
+        text_len = max(1, len(ssml_plain_text(ssml)))
+        duration_ms = pcm_length / (PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH * PCM_CHANNELS) * 1000
+        return [(m.group(1), duration_ms * len(ssml_plain_text(ssml[:m.start()])) / text_len) for m in _BOOKMARK_RE.finditer(ssml)]
+
+    def list_voices(self):
+        self._delay(self.first_audio_sec)
+        return list(self.voices)
+
+    def synthesize(self, ssml, output_format_name=WAV_FORMAT_NAME, on_event=None, cancel_scope=None):
+        self._begin_request(len(ssml_plain_text(ssml)), on_event)
+        audio_sec = None
+        stopped, unregister = self._watch_cancel(cancel_scope)
+        try:
+            pcm = self.render_pcm(ssml)
+            duration_sec = len(pcm) / (PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH * PCM_CHANNELS)
+            if on_event: on_event(SYNTHESIS_EVENT_STARTED, {})
+            self._delay(self.first_audio_sec, stopped)
+            self._check_stopped(stopped, on_event)
+            if on_event: on_event(SYNTHESIS_EVENT_AUDIO, {"bytes": min(len(pcm), int(self.chunk_sec * PCM_SAMPLE_RATE) * PCM_SAMPLE_WIDTH)})
+            self._delay(duration_sec / self.realtime_factor, stopped)
+            self._check_stopped(stopped, on_event)
+            if output_format_name == WAV_FORMAT_NAME: data = build_wav_bytes(pcm)
+            elif output_format_name == RAW_PCM_FORMAT_NAME: data = pcm
+            elif output_format_name == MP3_FORMAT_NAME:
+                data = _SILENT_MP3_FRAME * math.ceil(len(pcm) / PCM_SAMPLE_WIDTH / _MP3_FRAME_SAMPLES)
+            else:
+                raise SynthesisError(f"模拟后端不支持输出格式 {output_format_name}", reason="Canceled", error_code="BadRequest")
+            audio_sec = duration_sec
+            if on_event: on_event(SYNTHESIS_EVENT_COMPLETED, {"audio_bytes": len(data)})
+            return data
+        finally:
+            unregister()
+            self._end_request(audio_sec)
+
+    @staticmethod
+    def _watch_cancel(cancel_scope):
+        if cancel_scope is None: return None, lambda: None
+        stopped = threading.Event()
+        return stopped, cancel_scope.on_cancel(stopped.set)
+
+    def synthesize_with_events(self, ssml, on_audio_chunk, on_event=None, cancel_scope=None):
+        self._begin_request(len(ssml_plain_text(ssml)), on_event)
+        audio_sec = None
+        stopped, unregister = self._watch_cancel(cancel_scope)
+        try:
+            pcm = self.render_pcm(ssml)
+            bytes_per_sec = PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH * PCM_CHANNELS
+            chunk_bytes = int(self.chunk_sec * PCM_SAMPLE_RATE) * PCM_SAMPLE_WIDTH * PCM_CHANNELS
+            if on_event: on_event(SYNTHESIS_EVENT_STARTED, {})
+            bookmarks = self._bookmark_offsets(ssml, len(pcm)) if on_event else []
+            self._delay(self.first_audio_sec, stopped)
+            for offset in range(0, len(pcm), chunk_bytes):
+                piece = pcm[offset:offset + chunk_bytes]
+                if offset: self._delay(len(piece) / bytes_per_sec / self.realtime_factor, stopped)
+                self._check_stopped(stopped, on_event)
+                while bookmarks and bookmarks[0][1] <= (offset + len(piece)) / bytes_per_sec * 1000:
+                    mark, offset_ms = bookmarks.pop(0)
+                    on_event(SYNTHESIS_EVENT_BOOKMARK, {"text": mark, "audio_offset_ms": offset_ms})
+                if on_event: on_event(SYNTHESIS_EVENT_AUDIO, {"bytes": len(piece)})
+                on_audio_chunk(piece)
+            if on_event: on_event(SYNTHESIS_EVENT_COMPLETED, {"audio_bytes": len(pcm)})
+            audio_sec = len(pcm) / bytes_per_sec
+            return pcm
+        finally:
+            unregister()
+            self._end_request(audio_sec)
+
+    def stats(self):
+        with self._lock: return dict(self._stats, in_flight=self._in_flight)
+
+
+def stub_backend_from_settings(stub_settings):
+    stub_settings = stub_settings if isinstance(stub_settings, dict) else {}
+    return StubBackend(
+        first_audio_ms=float(stub_settings.get("first_audio_ms", DEFAULT_STUB_FIRST_AUDIO_MS)),
+        realtime_factor=float(stub_settings.get("realtime_factor", DEFAULT_STUB_REALTIME_FACTOR)),
+        jitter_ms=float(stub_settings.get("jitter_ms", 0)),
+        audio_sec_per_char=float(stub_settings.get("audio_sec_per_char", DEFAULT_STUB_AUDIO_SEC_PER_CHAR)),
+        chunk_ms=float(stub_settings.get("chunk_ms", DEFAULT_STUB_CHUNK_MS)),
+        throttle_rate=float(stub_settings.get("throttle_rate", 0.0)),
+        failure_rate=float(stub_settings.get("failure_rate", 0.0)),
+        failure_error_code=str(stub_settings.get("failure_error_code", "ServiceTimeout")),
+        concurrency_limit=int(stub_settings.get("concurrency_limit", 0)),
+        seed=stub_settings.get("seed"),
+    )
@@ -0,0 +1,154 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+
+from azure_tts_audio import stitch_wav_chunks
+from azure_tts_pool import leased_synthesizer, load_speech_sdk
+
+DEFAULT_SYNTHESIS_WORKERS = 4
+
+SYNTHESIS_EVENT_STARTED = "started"
+SYNTHESIS_EVENT_AUDIO = "audio"
+SYNTHESIS_EVENT_BOOKMARK = "bookmark"
+SYNTHESIS_EVENT_COMPLETED = "completed"
+SYNTHESIS_EVENT_CANCELED = "canceled"
+
+
+class SynthesisError(Exception):
+    def __init__(self, message, reason=None, error_details=None, error_code=None):
+        super().__init__(message)
+        self.reason = reason
+        self.error_details = error_details
+        self.error_code = error_code
+
+
+def describe_failed_result(result):
+    details = result.cancellation_details if result else None
+    error_message_detail = ""
+    if details:
+        error_message_detail = f"错误原因: {details.reason}"
+        if details.reason == load_speech_sdk().CancellationReason.Error and details.error_details:
+            error_message_detail += f" - 错误详情: {details.error_details}"
+    return f"语音合成取消/失败: {result.reason if result else '未知'}\n{error_message_detail}"
+
+
+def raise_for_result(result):
+    if result is not None and result.reason == load_speech_sdk().ResultReason.SynthesizingAudioCompleted:
+        return result
+    details = result.cancellation_details if result else None
+    raise SynthesisError(
+        describe_failed_result(result),
+        reason=result.reason if result else None,
+        error_details=details.error_details if details else None,
+        error_code=getattr(details, "error_code", None) if details else None,
+    )
+
+
+def connect_synthesis_events(synthesizer, on_event):
+    # 把 SDK 事件转换为 on_event(name, info)，供延迟统计和书签定位使用
+    synthesizer.synthesis_started.connect(lambda evt: on_event(SYNTHESIS_EVENT_STARTED, {}))
+    synthesizer.synthesizing.connect(lambda evt: on_event(SYNTHESIS_EVENT_AUDIO, {"bytes": len(evt.result.audio_data or b"")}))
+    synthesizer.bookmark_reached.connect(lambda evt: on_event(SYNTHESIS_EVENT_BOOKMARK, {
+        "text": evt.text, "audio_offset_ms": evt.audio_offset / 10000}))
+    synthesizer.synthesis_completed.connect(lambda evt: on_event(SYNTHESIS_EVENT_COMPLETED, {
+        "audio_bytes": len(evt.result.audio_data or b"")}))
+    synthesizer.synthesis_canceled.connect(lambda evt: on_event(SYNTHESIS_EVENT_CANCELED, {}))
+
+
+def speak_ssml_cancellable(synthesizer, ssml, cancel_scope=None):
+    # cancel_scope.on_cancel(callback) -> 注销函数；取消时调用 stop_speaking_async，
+    # 进行中的请求以 Canceled 结束 (抛出 SynthesisError)，合成器随后被连接池丢弃
+    unregister = cancel_scope.on_cancel(lambda: synthesizer.stop_speaking_async()) if cancel_scope is not None else None
+    try:
+        return raise_for_result(synthesizer.speak_ssml_async(ssml).get())
+    finally:
+        if unregister is not None: unregister()
+
+
+def synthesize_ssml_to_bytes(subscription_key, service_region, ssml, output_format=None, pool=None, on_event=None, cancel_scope=None):
+    # output_format 默认为 Riff16Khz16BitMonoPcm
+    if output_format is None: output_format = load_speech_sdk().SpeechSynthesisOutputFormat.Riff16Khz16BitMonoPcm
+    with leased_synthesizer(pool, subscription_key, service_region, output_format) as synthesizer:
+        if on_event is not None: connect_synthesis_events(synthesizer, on_event)
+        return speak_ssml_cancellable(synthesizer, ssml, cancel_scope).audio_data
+
+
+def synthesize_ssml_streaming(subscription_key, service_region, ssml, on_audio_chunk, pool=None, on_event=None, cancel_scope=None):
+    # 以无头 PCM 格式合成，每收到一段音频 (synthesizing 事件) 就回调 on_audio_chunk，返回完整 PCM。
+    # on_event(name, info) 可选，接收 started / audio / bookmark / completed / canceled 事件
+    output_format = load_speech_sdk().SpeechSynthesisOutputFormat.Raw16Khz16BitMonoPcm
+    with leased_synthesizer(pool, subscription_key, service_region, output_format) as synthesizer:
+        synthesizer.synthesizing.connect(lambda evt: on_audio_chunk(evt.result.audio_data))
+        if on_event is not None: connect_synthesis_events(synthesizer, on_event)
+        return speak_ssml_cancellable(synthesizer, ssml, cancel_scope).audio_data
+
+
+class OrderedAudioStream:
+    # 多段并行合成时，按段的顺序把音频转发给 sink：
+    # 当前段的数据立即转发，后续段的数据先缓冲，等前面的段全部完成后再依次送出。
+    def __init__(self, chunk_count, sink):
+        self._sink = sink
+        self._buffers = [bytearray() for _ in range(chunk_count)]
+        self._done = [False] * chunk_count
+        self._cursor = 0
+        self._lock = threading.Lock()
+
+    def feed(self, idx, data):
+        with self._lock:
+            if idx == self._cursor: self._sink(data)
+            else: self._buffers[idx] += data
+
+    def finish(self, idx):
+        with self._lock:
+            self._done[idx] = True
+            while self._cursor < len(self._done) and self._done[self._cursor]:
+                self._cursor += 1
+                if self._cursor < len(self._buffers) and self._buffers[self._cursor]:
+                    self._sink(bytes(self._buffers[self._cursor]))
+                    self._buffers[self._cursor] = bytearray()
+
+
+def synthesize_chunks_streaming(ssml_chunks, stream_fn, sink, max_workers=DEFAULT_SYNTHESIS_WORKERS, progress_callback=None):
+    # stream_fn(ssml, on_audio_chunk) -> 完整 PCM；各段并行合成，音频按顺序实时送入 sink
+    stream = OrderedAudioStream(len(ssml_chunks), sink)
+
+    def run_chunk(idx_and_ssml):
+        idx, ssml = idx_and_ssml
+        received = [0]
+        def on_audio(data):
+            received[0] += len(data)
+            stream.feed(idx, data)
+        pcm = stream_fn(ssml, on_audio)
+        if len(pcm) > received[0]:
+            # 事件未覆盖的尾部数据 (正常情况下不会发生) 也要送出
+            stream.feed(idx, pcm[received[0]:])
+        stream.finish(idx)
+        return pcm
+
+    return synthesize_chunks_parallel(list(enumerate(ssml_chunks)), run_chunk, max_workers, progress_callback)
+
+
+def synthesize_chunks_parallel(ssml_chunks, synthesize_fn, max_workers=DEFAULT_SYNTHESIS_WORKERS, progress_callback=None):
+    # 在有界线程池上并行合成各段 SSML，结果按原顺序返回。
+    # 任意一段失败时取消尚未开始的段并抛出第一个异常。
+    if not ssml_chunks: return []
+    if len(ssml_chunks) == 1:
+        audio = synthesize_fn(ssml_chunks[0])
+        if progress_callback: progress_callback(1, 1)
+        return [audio]
+    results = [None] * len(ssml_chunks)
+    workers = max(1, min(max_workers, len(ssml_chunks)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts_chunk") as pool:
+        futures = {pool.submit(synthesize_fn, ssml): idx for idx, ssml in enumerate(ssml_chunks)}
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                results[futures[future]] = future.result()
+                if progress_callback: progress_callback(done, len(ssml_chunks))
+        except BaseException:
+            for future in futures: future.cancel()
+            raise
+    return results
+
+
+def synthesize_text_chunks_to_wav(ssml_chunks, synthesize_fn, max_workers=DEFAULT_SYNTHESIS_WORKERS, progress_callback=None):
+    wav_parts = synthesize_chunks_parallel(ssml_chunks, synthesize_fn, max_workers, progress_callback)
+    return wav_parts[0] if len(wav_parts) == 1 else stitch_wav_chunks(wav_parts)
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+import itertools
+import threading
+import time
+
+DEFAULT_UI_DRAIN_INTERVAL_MS = 40
+DEFAULT_UI_IDLE_INTERVAL_MS = 100
+DEFAULT_UI_MAX_CALLBACKS_PER_DRAIN = 100
+UI_ACTIVE_WINDOW_SEC = 1.0
+
+
+class UiUpdateQueue:
+    # 工作线程不直接操作 Tk：状态、进度和界面状态变化都放进这个队列，由 Tk 主循环按固定节奏取出执行。
+    # 带 key 的更新只保留最新的一次 (例如 "status"：几百条进度消息在一次刷新里只显示最后一条)，
+    # 不带 key 的更新 (弹窗、开始播放等) 每次都会执行。执行顺序与最后一次提交的顺序一致
+    def __init__(self, interval_ms=DEFAULT_UI_DRAIN_INTERVAL_MS, idle_interval_ms=DEFAULT_UI_IDLE_INTERVAL_MS,
+                 max_per_drain=DEFAULT_UI_MAX_CALLBACKS_PER_DRAIN):
+        self.interval_ms = interval_ms
+        self.idle_interval_ms = idle_interval_ms
+        self.max_per_drain = max_per_drain
+        self._pending = OrderedDict()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._widget = None
+        self._after_id = None
+        self._last_active = 0.0
+        self._stats = {"posted": 0, "merged": 0, "run": 0, "drains": 0}
+
+    def post(self, fn, *args, key=None):
+        with self._lock:
+            self._stats["posted"] += 1
+            if key is None: key = ("_once", next(self._seq))
+            elif key in self._pending:
+                self._stats["merged"] += 1
+                self._pending.move_to_end(key)
+            self._pending[key] = (fn, args)
+
+    def drain(self, limit=None):
+        # 只能在 Tk 主线程调用；返回执行的回调数
+        with self._lock:
+            count = len(self._pending) if limit is None else min(limit, len(self._pending))
+            batch = [self._pending.popitem(last=False)[1] for _ in range(count)]
+            if batch:
+                self._stats["run"] += len(batch)
+                self._stats["drains"] += 1
+        for fn, args in batch:
+            try: fn(*args)
+            except Exception as e: print(f"警告: 界面更新出错: {e}")
+        return len(batch)
+
+    def attach(self, widget):
+        # 在 Tk 主线程中开始定时取出队列；最近有更新时按 interval_ms，空闲时按 idle_interval_ms
+        self._widget = widget
+        self._tick()
+
+    def detach(self):
+        if self._widget is not None and self._after_id is not None:
+            try: self._widget.after_cancel(self._after_id)
+            except Exception: pass
+        self._widget = self._after_id = None
+
+    def _tick(self):
+        self._after_id = None
+        if self._widget is None: return
+        now = time.monotonic()
+        if self.drain(self.max_per_drain): self._last_active = now
+        active = now - self._last_active < UI_ACTIVE_WINDOW_SEC or self.pending_count()
+        self._after_id = self._widget.after(self.interval_ms if active else self.idle_interval_ms, self._tick)
+
+    def pending_count(self):
+        with self._lock: return len(self._pending)
+
+    def stats(self):
+        with self._lock: return dict(self._stats, pending=len(self._pending))
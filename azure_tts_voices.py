@@ -0,0 +1,194 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from azure_tts_pool import leased_synthesizer, load_speech_sdk
+
+VOICE_CATALOG_FILE_NAME = "azure_tts_voices.json"
+VOICE_CATALOG_VERSION = 1
+DEFAULT_VOICE_CATALOG_TTL_SEC = 24 * 3600
+
+
+class VoiceCatalogError(Exception):
+    pass
+
+
+def _enum_name(value):
+    if value is None: return ""
+    name = getattr(value, "name", None)
+    return name if isinstance(name, str) else str(value).split(".")[-1]
+
+
+def _parse_name_list(raw):
+    if isinstance(raw, (list, tuple)): items = [str(x).strip() for x in raw]
+    elif isinstance(raw, str) and raw: items = [x.strip() for x in raw.split(",")]
+    else: items = []
+    return sorted(x for x in items if x)
+
+
+class VoiceRecord:
+    # 语音目录中的精简记录，只保留界面和合成需要的字段；
+    # 属性名与 SDK 的 VoiceInfo 保持一致，便于界面代码直接使用
+    __slots__ = ("short_name", "locale", "gender", "local_name", "voice_type", "style_list", "role_play_list")
+
+    def __init__(self, short_name, locale, gender="", local_name="", voice_type="", style_list=(), role_play_list=()):
+        self.short_name = short_name
+        self.locale = locale
+        self.gender = gender
+        self.local_name = local_name
+        self.voice_type = voice_type
+        self.style_list = _parse_name_list(style_list)
+        self.role_play_list = _parse_name_list(role_play_list)
+
+    @classmethod
+    def from_sdk(cls, voice_info):
+        return cls(
+            short_name=voice_info.short_name,
+            locale=voice_info.locale,
+            gender=_enum_name(getattr(voice_info, "gender", None)),
+            local_name=getattr(voice_info, "local_name", "") or "",
+            voice_type=_enum_name(getattr(voice_info, "voice_type", None)),
+            style_list=getattr(voice_info, "style_list", None),
+            role_play_list=getattr(voice_info, "role_play_list", None),
+        )
+
+    def to_row(self):
+        return [self.short_name, self.locale, self.gender, self.local_name, self.voice_type,
+                ",".join(self.style_list), ",".join(self.role_play_list)]
+
+    @classmethod
+    def from_row(cls, row):
+        short_name, locale, gender, local_name, voice_type, styles, roles = (list(row) + [""] * 7)[:7]
+        return cls(short_name, locale, gender, local_name, voice_type, styles, roles)
+
+    def __eq__(self, other):
+        return isinstance(other, VoiceRecord) and self.to_row() == other.to_row()
+
+    def __repr__(self):
+        return f"VoiceRecord({self.short_name!r}, {self.locale!r})"
+
+
+def diff_voice_records(old_records, new_records):
+    old_map = {r.short_name: r for r in (old_records or [])}
+    new_map = {r.short_name: r for r in (new_records or [])}
+    return {
+        "added": sorted(set(new_map) - set(old_map)),
+        "removed": sorted(set(old_map) - set(new_map)),
+        "changed": sorted(n for n in set(old_map) & set(new_map) if old_map[n] != new_map[n]),
+    }
+
+
+def fetch_voice_records(subscription_key, service_region, pool=None):
+    speechsdk = load_speech_sdk()
+    with leased_synthesizer(pool, subscription_key, service_region, speechsdk.SpeechSynthesisOutputFormat.Riff16Khz16BitMonoPcm) as synthesizer:
+        result = synthesizer.get_voices_async().get()
+    if result.reason == speechsdk.ResultReason.VoicesListRetrieved and result.voices:
+        records = []
+        for vi in result.voices:
+            try:
+                if isinstance(vi.locale, str) and isinstance(vi.short_name, str): records.append(VoiceRecord.from_sdk(vi))
+            except Exception as e_vi_proc: print(f"Debug: Error processing VoiceInfo: {e_vi_proc}")
+        return records
+    error_msg_detail = result.cancellation_details.error_details if result and result.cancellation_details and result.cancellation_details.error_details else ""
+    raise VoiceCatalogError(f"获取语音列表失败: {result.reason if result else '未知'}" + (f" (详情: {error_msg_detail})" if error_msg_detail else ""))
+
+
+class VoiceCatalog:
+    # 按区域保存在本地的语音目录，带 TTL；启动时直接读取，过期后由调用方在后台刷新
+    def __init__(self, catalog_path, ttl_sec=DEFAULT_VOICE_CATALOG_TTL_SEC):
+        self.catalog_path = catalog_path
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _region_key(service_region):
+        return (service_region or "").strip().lower()
+
+    def _read(self):
+        try:
+            with open(self.catalog_path, 'r', encoding='utf-8') as f: data = json.load(f)
+            if data.get("version") == VOICE_CATALOG_VERSION: return data
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"警告: 语音目录 '{self.catalog_path}' 读取失败，将重新获取。错误: {e}")
+        return {"version": VOICE_CATALOG_VERSION, "regions": {}}
+
+    def load(self, service_region):
+        # 返回 (records, fetched_at)；没有该区域的目录时返回 (None, None)
+        with self._lock:
+            entry = self._read()["regions"].get(self._region_key(service_region))
+        if not entry: return None, None
+        return [VoiceRecord.from_row(row) for row in entry.get("voices", [])], entry.get("fetched_at", 0)
+
+    def is_stale(self, fetched_at):
+        return fetched_at is None or (self.ttl_sec and time.time() - fetched_at > self.ttl_sec)
+
+    def store(self, service_region, records):
+        with self._lock:
+            data = self._read()
+            data["regions"][self._region_key(service_region)] = {
+                "fetched_at": time.time(),
+                "voices": [r.to_row() for r in records],
+            }
+            catalog_dir = os.path.dirname(os.path.abspath(self.catalog_path))
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", prefix="voices_", dir=catalog_dir)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f: json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+                os.replace(tmp_path, self.catalog_path)
+            except OSError as e:
+                print(f"警告: 无法写入语音目录 '{self.catalog_path}'。错误: {e}")
+                try: os.remove(tmp_path)
+                except OSError: pass
+
+
+class VoiceIndex:
+    # 每次加载语音目录时构建一次的索引：locale / gender / style / role -> 语音名称，
+    # 语言切换、语音切换和筛选都只做字典查找与集合运算，不再线性扫描全部语音
+    def __init__(self, records):
+        self.by_name = {}
+        self.by_locale = {}
+        self.by_gender = {}
+        self.by_style = {}
+        self.by_role = {}
+        self._search_text = {}
+        for r in records or []:
+            if not r.short_name or not r.locale: continue
+            self.by_name[r.short_name] = r
+            self.by_locale.setdefault(r.locale, set()).add(r.short_name)
+            if r.gender: self.by_gender.setdefault(r.gender, set()).add(r.short_name)
+            for style in r.style_list: self.by_style.setdefault(style, set()).add(r.short_name)
+            for role in r.role_play_list: self.by_role.setdefault(role, set()).add(r.short_name)
+            self._search_text[r.short_name] = " ".join(
+                [r.short_name, r.local_name, r.locale, r.gender] + r.style_list + r.role_play_list).lower()
+        self.locales = sorted(self.by_locale)
+        self.genders = sorted(self.by_gender)
+        self.styles = sorted(self.by_style)
+        self.roles = sorted(self.by_role)
+
+    def __len__(self):
+        return len(self.by_name)
+
+    def get(self, short_name):
+        return self.by_name.get(short_name)
+
+    def voices_for_locale(self, locale):
+        return sorted(self.by_locale.get(locale, ()))
+
+    def filter(self, locale=None, gender=None, style=None, role=None, query=""):
+        candidate_sets = []
+        if locale: candidate_sets.append(self.by_locale.get(locale, set()))
+        if gender: candidate_sets.append(self.by_gender.get(gender, set()))
+        if style: candidate_sets.append(self.by_style.get(style, set()))
+        if role: candidate_sets.append(self.by_role.get(role, set()))
+        if candidate_sets:
+            candidate_sets.sort(key=len)
+            names = set(candidate_sets[0]).intersection(*candidate_sets[1:])
+        else:
+            names = set(self.by_name)
+        tokens = (query or "").lower().split()
+        if tokens:
+            names = {n for n in names if all(t in self._search_text[n] for t in tokens)}
+        return sorted(names)